@@ -11,6 +11,9 @@ from __future__ import annotations
 
 from typing import Any, Dict
 
+import logging
+import os
+
 import gunicorn.app.base  # type: ignore
 
 from boardgames.wsgi import BGHandler
@@ -41,9 +44,24 @@ class StandAlone(gunicorn.app.base.Application):  # type: ignore
 
 
 if __name__ == "__main__":
+    # Gunicorn only sets up its own loggers; this lets the handler report the
+    # settings it starts with.
+    logging.basicConfig(level=logging.INFO, format="[%(name)s] %(message)s")
+
     _options = {
         "bind": "127.0.1.3:8888",
-        "workers": 1,
+        # The results tallies and caches are kept per process, and checked
+        # against the database's change counters, so any number of worker
+        # processes can share the database.
+        "workers": int(os.environ.get("BOARDGAMES_WORKERS", "1")),
+        # SQLite calls block the OS thread they run on, including while
+        # waiting for another connection's write lock, so they would stall
+        # every greenlet of an event loop worker such as "gevent". Threads
+        # are used instead. Each admin overview event stream holds a thread
+        # while open, so there must be more threads than the streams allowed
+        # by BOARDGAMES_EVENT_STREAMS (4 by default).
+        "worker_class": os.environ.get("BOARDGAMES_WORKER_CLASS", "gthread"),
+        "threads": int(os.environ.get("BOARDGAMES_THREADS", "8")),
     }
 
     StandAlone(_options).run()
@@ -9,32 +9,93 @@
 
 from __future__ import annotations
 
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import abc
 import cgi
+import hashlib
+import hmac
+import os
+import secrets
 import sqlite3
+import tempfile
+import threading
+import time
 
 from http.cookies import SimpleCookie, Morsel
 
-import bcrypt
-
 from boardgames.handler import Handler, Response, WSGIEnv
+from boardgames.hashing import PasswordHasher, PoolSaturated
 from boardgames.model import Realm, User
 
 
 PostData = Dict[str, List[Union[str, bytes]]]
 
+SESSION_LIFETIME = 30 * 24 * 60 * 60
+USER_CACHE_SIZE = 1024
+
+
+def load_session_key(path: str) -> bytes:
+    """Loads the key used to sign session cookies, creating it if needed
+
+    The key can also be supplied through the BOARDGAMES_SESSION_KEY environment
+    variable, which is needed if the key file can not be shared between workers.
+    """
+
+    if "BOARDGAMES_SESSION_KEY" in os.environ:
+        return os.environ["BOARDGAMES_SESSION_KEY"].encode("utf-8")
+
+    try:
+        return read_session_key(path)
+    except FileNotFoundError:
+        pass
+
+    key = secrets.token_bytes(32)
+
+    # The key is written in full before it is linked into place, so that a
+    # process starting at the same time never reads part of it. If another
+    # process links its key first, that one is used instead.
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".session-key-")
+
+    try:
+        with os.fdopen(handle, "wb") as outfile:
+            outfile.write(key)
+
+        os.link(temp, path)
+    except FileExistsError:
+        return read_session_key(path)
+    finally:
+        os.unlink(temp)
+
+    return key
+
+
+def read_session_key(path: str) -> bytes:
+    with open(path, "rb") as infile:
+        key = infile.read()
+
+    if not key:
+        raise ValueError(f"The session key in {path} is empty")
+
+    return key
+
 
 class AuthHandler(Handler):
-    connection: sqlite3.Connection
-    cursor: sqlite3.Cursor
+    session_key: bytes
+    hasher: PasswordHasher
+    legacy_tokens: Dict[Tuple[int, str], bytes]
+    cache_lock: threading.Lock
 
-    def auth(self, realm: Realm, cookie: str) -> Optional[User]:
+    def auth(self, cursor: sqlite3.Cursor, realm: Realm, cookie: str) -> Optional[User]:
         """Checks if a user is authorised"""
 
         cookies: SimpleCookie[str] = SimpleCookie(cookie)
 
+        session_cookie: Optional[Morsel[str]] = cookies.get(f"session-{realm.realm}")
+
+        if session_cookie:
+            return self.check_session(cursor, realm, session_cookie.value)
+
         user_cookie: Optional[Morsel[str]] = cookies.get(f"user-{realm.realm}")
         auth_cookie: Optional[Morsel[str]] = cookies.get(f"auth-{realm.realm}")
 
@@ -44,20 +105,96 @@ class AuthHandler(Handler):
         if not user or not auth:
             return None
 
-        candidates = User.model(self.cursor).search(realm=realm, username=user)
+        return self.check_legacy_auth(cursor, realm, user, auth)
+
+    def check_session(
+        self, cursor: sqlite3.Cursor, realm: Realm, token: str
+    ) -> Optional[User]:
+        """Validates a session token created by `make_session`"""
+
+        try:
+            user_id, expires, mac = token.split(":", 2)
+        except ValueError:
+            return None
+
+        expected = self.sign_session(realm, user_id, expires)
+
+        try:
+            if not hmac.compare_digest(mac.encode("utf-8"), expected.encode("utf-8")):
+                return None
+        except UnicodeError:
+            return None
+
+        if int(expires) < time.time():
+            return None
+
+        return self.get_user(cursor, int(user_id))
+
+    def check_legacy_auth(
+        self, cursor: sqlite3.Cursor, realm: Realm, username: str, auth: str
+    ) -> Optional[User]:
+        """Validates the user and auth cookies used before session tokens.
+
+        This is the only case outside of `login` which needs bcrypt, so the
+        result is remembered for the lifetime of the process.
+
+        Raises PoolSaturated if the password hashing pool is too busy.
+        """
+
+        candidates = User.model(cursor).search(realm=realm, username=username)
 
         if not candidates:
             return None
 
         authed = candidates[0]
+        known = self.legacy_tokens.get((authed.user_id or 0, auth))
+
+        if known is not None:
+            return authed if known == authed.password else None
+
+        if not self.hasher.checkpw(authed.password, auth.encode("utf-8")):
+            return None
+
+        with self.cache_lock:
+            if len(self.legacy_tokens) >= USER_CACHE_SIZE:
+                del self.legacy_tokens[next(iter(self.legacy_tokens))]
+
+            self.legacy_tokens[(authed.user_id or 0, auth)] = authed.password
+
+        return authed
+
+    @staticmethod
+    def get_user(cursor: sqlite3.Cursor, user_id: int) -> Optional[User]:
+        """Loads a user by ID, through the User model's cache"""
+
+        return User.model(cursor).get(user_id)
 
-        return authed if bcrypt.checkpw(authed.password, auth.encode("utf-8")) else None
+    def sign_session(self, realm: Realm, user_id: str, expires: str) -> str:
+        message = f"{realm.realm_id}:{user_id}:{expires}".encode("utf-8")
+
+        return hmac.new(self.session_key, message, hashlib.sha256).hexdigest()
+
+    def make_session(self, realm: Realm, user: User) -> str:
+        """Creates the Set-Cookie value for a new session"""
+
+        user_id = str(user.user_id)
+        expires = str(int(time.time()) + SESSION_LIFETIME)
+        token = f"{user_id}:{expires}:{self.sign_session(realm, user_id, expires)}"
+
+        return (
+            f"session-{realm.realm}={token}; path=/{realm.realm}; "
+            f"Max-Age={SESSION_LIFETIME}; HttpOnly; SameSite=Lax"
+        )
+
+    @staticmethod
+    def has_session(realm: Realm, cookie: str) -> bool:
+        return f"session-{realm.realm}" in SimpleCookie(cookie)
 
     @abc.abstractmethod
     def auth_challenge(self, realm: Realm) -> Response:
         pass
 
-    def login(self, realm: Realm, environ: WSGIEnv) -> Response:
+    def login(self, cursor: sqlite3.Cursor, realm: Realm, environ: WSGIEnv) -> Response:
         data = cgi.FieldStorage(environ=environ, fp=environ["wsgi.input"])  # type: ignore
 
         username = data["username"].file.read() if "username" in data else ""
@@ -67,37 +204,47 @@ class AuthHandler(Handler):
         if not username or not password:
             return self.auth_challenge(realm)
 
-        user_model = User.model(self.cursor)
+        user_model = User.model(cursor)
         user: User
 
         candidates = user_model.search(username=username, realm=realm)
 
-        if not candidates:
-            _pass = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        try:
+            if not candidates:
+                _pass = self.hasher.hashpw(password.encode("utf-8"))
 
-            user = User(realm=realm, username=username, password=_pass, role="none")
-            user_model.store(user)
-            self.connection.commit()
+                user = User(realm=realm, username=username, password=_pass, role="none")
+                user_model.store(user)
+                cursor.connection.commit()
 
-        else:
-            user = candidates[0]
+            else:
+                user = candidates[0]
 
-            if not bcrypt.checkpw(password.encode("utf-8"), user.password):
-                return self.auth_challenge(realm)
+                if not self.hasher.checkpw(password.encode("utf-8"), user.password):
+                    return self.auth_challenge(realm)
 
-        token: str = bcrypt.hashpw(user.password, bcrypt.gensalt(4)).decode("utf-8")
+        except PoolSaturated:
+            return self.busy()
 
         return Response(
             302,
             "text/plain",
             b"Redirecting...",
             headers=[
-                ("Set-Cookie", f"user-{realm.realm}={username}; path=/{realm.realm}"),
-                ("Set-Cookie", f"auth-{realm.realm}={token}; path=/{realm.realm}"),
+                ("Set-Cookie", self.make_session(realm, user)),
                 ("Location", redirect),
             ],
         )
 
+    @staticmethod
+    def busy() -> Response:
+        return Response(
+            503,
+            "text/plain",
+            b"Too many people are logging in, please try again in a moment",
+            headers=[("Retry-After", "2")],
+        )
+
     @staticmethod
     def logout(realm: Realm) -> Response:
         expires = "; expires=Thu, 01 Jan 1970 00:00:00 GMT"
@@ -109,6 +256,7 @@ class AuthHandler(Handler):
             headers=[
                 ("Set-Cookie", f"user-{realm.realm}=; path=/{realm.realm}{expires}"),
                 ("Set-Cookie", f"auth-{realm.realm}=; path=/{realm.realm}{expires}"),
+                ("Set-Cookie", f"session-{realm.realm}=; path=/{realm.realm}{expires}"),
                 ("Location", f"/{realm.realm}/"),
             ],
         )
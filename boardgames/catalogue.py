@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""Pre-encoded game lists for each realm"""
+
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+import dataclasses
+import sqlite3
+import threading
+import time
+
+import orm
+
+from boardgames.handler import CachedData
+from boardgames.model import Game, Realm
+
+
+# How often, in seconds, the database is asked whether the catalogue changed.
+CHECK_INTERVAL = 10.0
+
+CATALOGUE_TABLES = ("Game", "GameOptions", "RealmBlacklist")
+
+
+class GamesCatalogue:
+    """
+    The encoded games.json data for each realm.
+
+    The game list only changes when the importers run, so the encoded data
+    is kept until the generation counters of the tables it is built from
+    change. Those are checked at most once every CHECK_INTERVAL seconds, so
+    most requests are served without touching the database.
+    """
+
+    payloads: Dict[int, CachedData]
+    generation: Optional[Dict[str, int]]
+    checked: float
+    lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.payloads = {}
+        self.generation = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, cursor: sqlite3.Cursor, realm: Realm) -> CachedData:
+        with self.lock:
+            self.check(cursor)
+
+            if realm.realm_id not in self.payloads:
+                self.payloads[realm.realm_id] = self.build(cursor, realm)
+
+            return self.payloads[realm.realm_id]
+
+    def check(self, cursor: sqlite3.Cursor) -> None:
+        """Drops the encoded data if the underlying tables have changed"""
+
+        now = time.monotonic()
+
+        if now - self.checked < CHECK_INTERVAL:
+            return
+
+        self.checked = now
+        generation = orm.generations(cursor, *CATALOGUE_TABLES)
+
+        # Without the change counters in the database, we have to rebuild.
+        if generation != self.generation or len(generation) != len(CATALOGUE_TABLES):
+            self.payloads = {}
+            self.generation = generation
+
+    @staticmethod
+    def build(cursor: sqlite3.Cursor, realm: Realm) -> CachedData:
+        cursor.execute(
+            """
+            SELECT [Game].[game_id] FROM [Game]
+            LEFT JOIN [RealmBlacklist]
+              ON [Game].[game_id] = [RealmBlacklist].[game_id]
+              AND [RealmBlacklist].[realm_id] = ?
+            WHERE [realm_id] IS NULL
+            """,
+            (realm.realm_id,),
+        )
+
+        ids = [x[0] for x in cursor.fetchall()]
+        games = Game.model(cursor).get_many(*ids)
+        data = [dataclasses.asdict(game) for game in games.values()]
+
+        return CachedData.from_json(data)
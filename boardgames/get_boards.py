@@ -7,7 +7,7 @@
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import contextlib
 import datetime
@@ -21,7 +21,15 @@ import requests
 
 
 from orm.table import ModelWrapper
-from boardgames.model import Board, BoardAdmin, BoardAdminRealm, BoardRealm, Game, Realm
+from boardgames.model import (
+    Board,
+    BoardAdmin,
+    BoardAdminRealm,
+    BoardRealm,
+    Game,
+    Realm,
+    database,
+)
 
 
 LOGGER = logging.getLogger("boardgames")
@@ -43,14 +51,17 @@ class BoardImporter(contextlib.ContextDecorator):
         self.connection = connection
         self.cursor = connection.cursor()
 
-        self.board_model = Board.model(self.cursor)
+        # Boards are only updated, so their Game and creator are never used.
+        self.board_model = Board.model(self.cursor).lazy("game", "creator")
         self.admins = BoardAdmin.model(self.cursor).all()
         self.games = {
-            game.bga_id: game for game in Game.model(self.cursor).all() if game.bga_id
+            game.bga_id: game
+            for game in Game.model(self.cursor).skip("options").iter_all()
+            if game.bga_id
         }
         self.realms = {
             realm.bga_group: realm
-            for realm in Realm.model(self.cursor).all()
+            for realm in Realm.model(self.cursor).iter_all()
             if realm.bga_group
         }
         self.now = datetime.datetime.now()
@@ -136,25 +147,39 @@ class BoardImporter(contextlib.ContextDecorator):
             LOGGER.info("No tables found for %s", admin.admin)
             return
 
+        self.process_tables(admin, tables)
+
+    def process_tables(self, admin: BoardAdmin, tables: Dict[str, Dict[str, Any]]) -> None:
         realms = BoardAdminRealm.model(self.cursor).of_left(admin)
+        existing = self.board_model.get_many(*(int(table["id"]) for table in tables.values()))
+        boards: List[Tuple[Board, List[Realm]]] = []
 
         for table in tables.values():
-            self.process_table(admin, realms, table)
+            board = self.process_table(admin, realms, existing, table)
+
+            if board:
+                boards.append(board)
+
+        self.store(boards)
 
     def process_table(
-        self, admin: BoardAdmin, default_realms: List[Realm], table: Dict[str, Any]
-    ) -> None:
+        self,
+        admin: BoardAdmin,
+        default_realms: List[Realm],
+        existing: Dict[int, Board],
+        table: Dict[str, Any],
+    ) -> Optional[Tuple[Board, List[Realm]]]:
         board_id = int(table["id"])
         game_id = int(table["game_id"])
 
         if int(table.get("admin_id", 0)) != admin.bga_id:
-            return
+            return None
 
         if game_id not in self.games:
             LOGGER.error("Unable to find game %s in database", table["game_name"])
-            return
+            return None
 
-        board = self.board_model.get(board_id)
+        board = existing.get(board_id)
         realms = self.get_realms_for_board(default_realms, table)
 
         if not board:
@@ -181,7 +206,7 @@ class BoardImporter(contextlib.ContextDecorator):
 
         LOGGER.debug("Adding board %s (%s)", table["id"], self.games[game_id].name)
 
-        self.store(board, realms)
+        return board, realms
 
     def create_board(self, admin: BoardAdmin, table: Dict[str, Any]) -> Board:
         return Board(
@@ -233,16 +258,19 @@ class BoardImporter(contextlib.ContextDecorator):
 
         return players
 
-    def store(self, board: Board, realms: List[Realm]) -> None:
-        self.board_model.store(board)
+    def store(self, boards: List[Tuple[Board, List[Realm]]]) -> None:
+        self.board_model.store_many(board for board, _ in boards)
 
-        realm_model = BoardRealm.model(self.cursor)
-        for realm in realms:
-            realm_model.store(board, realm)
+        BoardRealm.model(self.cursor).store_pairs(
+            (board, realm) for board, realms in boards for realm in realms
+        )
 
 
 def main() -> None:
-    with sqlite3.connect("games.db") as connection:
+    settings = database()
+    LOGGER.info("Database: %s", settings)
+
+    with settings.connect() as connection:
         importer = BoardImporter(connection)
         importer.do_import()
 
@@ -5,7 +5,7 @@
 #
 # SPDX-License-Identifier: BSD-2-Clause
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Set, Tuple
 
 import json
 import logging
@@ -18,7 +18,7 @@ import requests
 
 from systemd.journal import JournalHandler  # type: ignore
 
-from boardgames.model import Game, GameTags, Tag
+from boardgames.model import Game, GameTags, Tag, database
 from orm import TableModel, JoinModel
 
 
@@ -72,35 +72,39 @@ class BGAImporter:
         raise IOError("Failed to get game metadata from BGA")
 
     def load_bga_tags(self, data: List[Dict[str, Any]]) -> None:
-        existing = set(tag.bga_id for tag in self.tag_model.all() if tag.bga_id)
+        existing = set(tag.bga_id for tag in self.tag_model.project("bga_id").all())
+
+        tags: List[Tag] = []
 
         for tag in data:
             if tag["id"] in existing:
                 continue
 
             dat = Tag(bga_id=tag["id"], category=tag["cat"] or "Meta", tag=tag["name"])
-            self.tag_model.store(dat)
+            tags.append(dat)
             LOGGER.info("Added BGA Tag %s:%s (%d)", dat.category, dat.tag, dat.bga_id)
 
+        self.tag_model.store_many(tags)
+
     def load_bga_games(self, data: List[Dict[str, Any]]) -> None:
-        existing: Dict[int, Game] = {
-            game.bga_id: game
-            for game in self.game_model.search(platform="BGA")
+        existing: Set[int] = {
+            game.bga_id
+            for game in self.game_model.project("bga_id").search(platform="BGA")
             if game.bga_id
         }
         tag_map: Dict[int, Tag] = {
-            tag.bga_id: tag for tag in self.tag_model.all() if tag.bga_id
+            tag.bga_id: tag for tag in self.tag_model.iter_all() if tag.bga_id
         }
 
+        games: List[Game] = []
+        tags: List[Tuple[Game, Tag]] = []
+
         for game_json in data:
             if game_json["id"] in existing:
                 continue
 
-            game = existing.get(
-                game_json["id"],
-                Game(
-                    platform="BGA", name=game_json["display_name_en"], bga_id=game_json["id"]
-                ),
+            game = Game(
+                platform="BGA", name=game_json["display_name_en"], bga_id=game_json["id"]
             )
             game.bgg_id = game_json["bgg_id"]
 
@@ -126,17 +130,23 @@ class BGAImporter:
 
                 game.options[option["id"]] = json.dumps(option)
 
-            self.game_model.store(game)
-
-            for tag_id in game_info.get("tags", []):
-                if tag_id in tag_map:
-                    self.tag_mapper.store(game, tag_map[tag_id])
+            games.append(game)
+            tags.extend(
+                (game, tag_map[tag_id])
+                for tag_id in game_info.get("tags", [])
+                if tag_id in tag_map
+            )
 
             self.logger.warning("New Game: %s (%s)", game.name, game.platform)
 
+        # The games get their IDs when stored, so the tags are mapped after.
+        self.game_model.store_many(games)
+        self.tag_mapper.store_pairs(tags)
+
 
 def import_from_files(cursor: sqlite3.Cursor, logger: logging.Logger) -> None:
     game_model = Game.model(cursor)
+    games: Dict[Tuple[str, str], Game] = {}
 
     for path in os.listdir("games"):
         if not path.endswith(".yaml"):
@@ -147,15 +157,23 @@ def import_from_files(cursor: sqlite3.Cursor, logger: logging.Logger) -> None:
             for game_data in yaml.load_all(yaml_stream, Loader=yaml.SafeLoader):
                 game = Game(**game_data)
 
-                if game_model.search(platform=game.platform, name=game.name):
+                if (game.platform, game.name) in games:
+                    continue
+
+                if game_model.exists(platform=game.platform, name=game.name):
                     continue
 
                 logger.warning("New Game: %s (%s)", game.name, game.platform)
-                game_model.store(game)
+                games[(game.platform, game.name)] = game
+
+    game_model.store_many(games.values())
 
 
 def main(logger: logging.Logger) -> None:
-    with sqlite3.connect("games.db") as conn:
+    settings = database()
+    logger.info("Database: %s", settings)
+
+    with settings.connect() as conn:
         cursor = conn.cursor()
 
         import_from_files(cursor, logger)
@@ -16,6 +16,7 @@ import dataclasses
 import hashlib
 import json
 import os
+import time
 
 from wsgiref.handlers import format_date_time
 
@@ -62,14 +63,24 @@ class Response:
         return self.contents
 
 
-@dataclasses.dataclass(init=False)
-class FileData:
+@dataclasses.dataclass
+class CachedData:
     mime_type: str
     modified: float
     tag: str
     contents: List[bytes]
 
-    def __init__(self, path: str, mime: str):
+    @classmethod
+    def from_json(cls, data: Any) -> CachedData:
+        contents = "".join(json.JSONEncoder().iterencode(data)).encode("utf-8")
+        tag = hashlib.md5(contents).hexdigest()
+
+        return cls("application/json", time.time(), tag, [contents])
+
+
+@dataclasses.dataclass(init=False)
+class FileData(CachedData):
+    def __init__(self, path: str, mime: str):  # pylint: disable=super-init-not-called
         self.mime_type = mime
 
         with open(path, "rb") as infile:
@@ -107,7 +118,7 @@ class Handler(abc.ABC):
         return realm, path
 
     @staticmethod
-    def page_file(environ: WSGIEnv, data: FileData) -> Response:
+    def page_file(environ: WSGIEnv, data: CachedData) -> Response:
         if environ.get("HTTP_IF_NONE_MATCH", "") == data.tag:
             return Response(304, data.mime_type, [], data.modified, data.tag)
 
@@ -122,6 +133,26 @@ class Handler(abc.ABC):
 
         return response
 
+    @classmethod
+    def send_tagged_json(
+        cls, environ: WSGIEnv, tag: Optional[str], producer: Callable[[], Any]
+    ) -> Response:
+        """
+        Sends JSON data with an ETag, if one is given.
+
+        The tag must be derived from the version of the data (for example from
+        a generation counter), so that a 304 can be returned without calling
+        the producer to build the data.
+        """
+
+        if tag and environ.get("HTTP_IF_NONE_MATCH", "") == tag:
+            return Response(304, "application/json", [], tag=tag)
+
+        response = cls.send_json(producer())
+        response.tag = tag
+
+        return response
+
     @staticmethod
     def send_json(data: Any) -> Response:
         return Response(
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""Password hashing in a bounded pool of worker processes"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+import dataclasses
+import threading
+import time
+
+import bcrypt
+
+
+Result = TypeVar("Result")
+
+
+class PoolSaturated(Exception):
+    """Raised when there is no room in the hashing queue"""
+
+
+def _timed(
+    submitted: float, func: Callable[..., Result], *args: Any
+) -> Tuple[Result, float, float]:
+    start = time.time()
+    result = func(*args)
+
+    return result, start - submitted, time.time() - start
+
+
+def _hashpw(password: bytes) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+@dataclasses.dataclass
+class HashStats:
+    calls: int = 0
+    rejected: int = 0
+    queue_seconds: float = 0.0
+    hash_seconds: float = 0.0
+    max_queue_seconds: float = 0.0
+    max_hash_seconds: float = 0.0
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a process pool, so that a burst of logins does not hold
+    up the workers serving every other request.
+
+    At most `workers + queue` operations can be pending at once; past that
+    PoolSaturated is raised straight away rather than queueing the caller.
+    """
+
+    workers: int
+    queue: int
+    stats: HashStats
+
+    _executor: Optional[ProcessPoolExecutor]
+    _pending: int
+    _lock: threading.Lock
+
+    def __init__(self, workers: int, queue: int) -> None:
+        self.workers = workers
+        self.queue = queue
+        self.stats = HashStats()
+
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def hashpw(self, password: bytes) -> bytes:
+        return self._run(_hashpw, password)
+
+    def checkpw(self, password: bytes, hashed: bytes) -> bool:
+        return self._run(_checkpw, password, hashed)
+
+    def _run(self, func: Callable[..., Result], *args: Any) -> Result:
+        with self._lock:
+            if self._pending >= self.workers + self.queue:
+                self.stats.rejected += 1
+
+                raise PoolSaturated()
+
+            # The pool is created on first use, so that it is started after
+            # gunicorn has forked the worker process. This is done under the
+            # lock, so that concurrent first calls do not each start a pool.
+            if not self._executor:
+                self._executor = ProcessPoolExecutor(self.workers)
+
+            executor = self._executor
+            self._pending += 1
+
+        try:
+            future = executor.submit(_timed, time.time(), func, *args)
+            result, queued, hashed = future.result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        with self._lock:
+            self.stats.calls += 1
+            self.stats.queue_seconds += queued
+            self.stats.hash_seconds += hashed
+            self.stats.max_queue_seconds = max(self.stats.max_queue_seconds, queued)
+            self.stats.max_hash_seconds = max(self.stats.max_hash_seconds, hashed)
+
+        return result
+
+    def metrics(self) -> List[str]:
+        """The hashing statistics, in Prometheus' text format"""
+
+        with self._lock:
+            stats = dataclasses.replace(self.stats)
+
+        return [
+            "# TYPE boardgames_hash_queue_seconds summary",
+            f"boardgames_hash_queue_seconds_sum {stats.queue_seconds}",
+            f"boardgames_hash_queue_seconds_count {stats.calls}",
+            "# TYPE boardgames_hash_seconds summary",
+            f"boardgames_hash_seconds_sum {stats.hash_seconds}",
+            f"boardgames_hash_seconds_count {stats.calls}",
+            "# TYPE boardgames_hash_queue_seconds_max gauge",
+            f"boardgames_hash_queue_seconds_max {stats.max_queue_seconds}",
+            "# TYPE boardgames_hash_seconds_max gauge",
+            f"boardgames_hash_seconds_max {stats.max_hash_seconds}",
+            "# TYPE boardgames_hash_rejected_total counter",
+            f"boardgames_hash_rejected_total {stats.rejected}",
+        ]
@@ -11,14 +11,19 @@ from __future__ import annotations
 
 from typing import Dict, Optional
 
-import sqlite3
-
 from dataclasses import dataclass, field
 import datetime
 
 import orm
 
 
+def database() -> orm.ConnectionSettings:
+    """The database settings, from BOARDGAMES_DB and BOARDGAMES_DB_* variables"""
+
+    return orm.ConnectionSettings.from_env("BOARDGAMES_DB")
+
+
+@orm.cached(size=256)
 @orm.unique("realm")
 @dataclass
 class Realm(orm.Table["Realm"]):
@@ -30,6 +35,7 @@ class Realm(orm.Table["Realm"]):
     passnplay: bool = True
 
 
+@orm.cached(size=1024)
 @orm.unique("realm_id", "username")
 @dataclass
 class User(orm.Table["User"]):
@@ -49,6 +55,7 @@ class GameOptions(orm.Table["GameOptions"]):
     game_options_id: Optional[int] = None
 
 
+@orm.cached(size=4096)
 @orm.unique("platform", "name")
 @orm.subtable("options", GameOptions, "json", "option_id")
 @dataclass
@@ -76,6 +83,7 @@ class Game(orm.Table["Game"]):
     game_id: Optional[int] = None
 
 
+@orm.cached(size=1024)
 @dataclass
 class Tag(orm.Table["Tag"]):
     tag: str
@@ -84,30 +92,35 @@ class Tag(orm.Table["Tag"]):
     tag_id: Optional[int] = None
 
 
+@orm.join_layout()
 @dataclass
 class GameTags(orm.JoinTable[Game, Tag]):
     game: Game
     tag: Tag
 
 
+@orm.join_layout()
 @dataclass
 class RealmBlacklist(orm.JoinTable[Realm, Game]):
     realm: Realm
     game: Game
 
 
+@orm.join_layout()
 @dataclass
 class Vote(orm.JoinTable[User, Game]):
     user: User
     game: Game
 
 
+@orm.join_layout()
 @dataclass
 class AsyncVote(orm.JoinTable[User, Game]):
     user: User
     game: Game
 
 
+@orm.join_layout()
 @dataclass
 class Veto(orm.JoinTable[User, Game]):
     user: User
@@ -123,6 +136,7 @@ class BoardAdminSuppression(orm.Table["BoardAdminSuppression"]):
     board_admin_suppression_id: Optional[int] = None
 
 
+@orm.cached(size=256)
 @orm.unique("admin")
 @orm.unique("bga_id")
 # @orm.subtable("suppressions", BoardAdminSuppression, "until", "game")
@@ -134,6 +148,7 @@ class BoardAdmin(orm.Table["BoardAdmin"]):
     board_admin_id: Optional[int] = None
 
 
+@orm.join_layout()
 @dataclass
 class BoardAdminRealm(orm.JoinTable[BoardAdmin, Realm]):
     admin: BoardAdmin
@@ -150,6 +165,12 @@ class BoardOptions(orm.Table["BoardOptions"]):
 
 
 @orm.subtable("options", BoardOptions, "option_value", "option_id")
+# The per-admin summary in the votes overview.
+@orm.index("board_admin_id", "game_id", include=["state", "created", "launch_time"])
+# Counting the open boards for each game.
+@orm.index("game_id", where="[state] = 'open'", name="Board__open_games")
+# The importer closing boards which have not been seen recently.
+@orm.index("state", "last_seen")
 @dataclass
 class Board(orm.Table["Board"]):
     board_id: int
@@ -170,6 +191,7 @@ class Board(orm.Table["Board"]):
     options: Dict[int, int] = field(default_factory=dict)
 
 
+@orm.join_layout()
 @dataclass
 class BoardRealm(orm.JoinTable[Board, Realm]):
     board: Board
@@ -177,24 +199,32 @@ class BoardRealm(orm.JoinTable[Board, Realm]):
 
 
 if __name__ == "__main__":
-    with sqlite3.connect("games.db") as connection:
+    settings = database()
+    print(f"Database: {settings}")
+
+    with settings.connect() as connection:
         cursor = connection.cursor()
 
+        # Join tables are migrated, which creates them if they are missing
+        # and rebuilds them if they predate their `join_layout`.
         Realm.create_table(cursor)
         User.create_table(cursor)
         GameOptions.create_table(cursor)
         Game.create_table(cursor)
         Tag.create_table(cursor)
-        GameTags.create_table(cursor)
-        RealmBlacklist.create_table(cursor)
-        Vote.create_table(cursor)
-        AsyncVote.create_table(cursor)
-        Veto.create_table(cursor)
+        GameTags.migrate(cursor)
+        RealmBlacklist.migrate(cursor)
+        Vote.migrate(cursor)
+        AsyncVote.migrate(cursor)
+        Veto.migrate(cursor)
         BoardAdminSuppression.create_table(cursor)
         BoardAdmin.create_table(cursor)
-        BoardAdminRealm.create_table(cursor)
+        BoardAdminRealm.migrate(cursor)
         BoardOptions.create_table(cursor)
         Board.create_table(cursor)
-        BoardRealm.create_table(cursor)
+        BoardRealm.migrate(cursor)
+
+        # Give the query planner statistics to choose between the indexes.
+        cursor.execute("ANALYZE")
 
         connection.commit()
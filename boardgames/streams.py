@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""A bound on the number of event streams a worker process holds open"""
+
+from __future__ import annotations
+
+from typing import Generator, Iterator, Optional
+
+import threading
+
+
+class StreamLimit:
+    """
+    Counts the event streams which are open in this process.
+
+    Each stream holds one of the worker's request threads for as long as it
+    is open, so at most `limit` are allowed at once, leaving the other
+    threads free for ordinary requests.
+    """
+
+    limit: int
+    streams: int
+
+    _lock: threading.Lock
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.streams = 0
+
+        self._lock = threading.Lock()
+
+    def start(self, events: Generator[bytes, None, None]) -> Optional[EventStream]:
+        """Takes a place for a stream, or returns None if there are none left"""
+
+        with self._lock:
+            if self.streams >= self.limit:
+                return None
+
+            self.streams += 1
+
+        return EventStream(events, self)
+
+    def finish(self) -> None:
+        with self._lock:
+            self.streams -= 1
+
+
+class EventStream:
+    """
+    The body of an event stream, which gives up its place when closed.
+
+    The WSGI server calls `close` once the response ends, even if the body
+    was never iterated, which a generator's own `finally` can not catch.
+    """
+
+    events: Generator[bytes, None, None]
+    limit: StreamLimit
+    closed: bool
+
+    def __init__(self, events: Generator[bytes, None, None], limit: StreamLimit) -> None:
+        self.events = events
+        self.limit = limit
+        self.closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self.events
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        self.closed = True
+        self.events.close()
+        self.limit.finish()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""In-memory vote tallies for the results page"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import dataclasses
+import sqlite3
+
+import orm
+
+from boardgames.handler import CachedData
+from boardgames.model import AsyncVote, Game, Realm, Veto, Vote
+
+
+Counts = Dict[int, int]
+Generation = Dict[str, int]
+
+# The tables the counts are built from, and those the games are built from.
+TALLY_TABLES = ("Vote", "AsyncVote", "Veto", "User")
+GAME_TABLES = ("Game", "GameOptions")
+
+
+class RealmTally:
+    """
+    Running totals of the votes, async votes, and vetoes in a Realm.
+
+    The tally is loaded from the database, and then kept up to date by the
+    handler applying the changes it writes. The change counters (see
+    `orm.generations`) of the vote tables are kept with it; if they move
+    without the tally being told of the change, such as when another process
+    writes votes, it is no longer `current`, and must be loaded again.
+
+    The encoded results are likewise kept until the votes change, or the
+    counters of the game tables move.
+    """
+
+    realm: Realm
+    counts: Dict[str, Counts]
+    generation: Generation
+    encoded: Optional[CachedData]
+    games: Generation
+
+    def __init__(
+        self, realm: Realm, counts: Dict[str, Counts], generation: Generation
+    ) -> None:
+        self.realm = realm
+        self.counts = counts
+        self.generation = generation
+        self.encoded = None
+        self.games = {}
+
+    @classmethod
+    def load(cls, cursor: sqlite3.Cursor, realm: Realm) -> RealmTally:
+        # The counters are read first, so that a change which is committed
+        # in between is counted, and the tally then reloaded, rather than
+        # being missed.
+        generation = cls.generation_of(cursor)
+        counts: Dict[str, Counts] = {}
+
+        for kind, table in (("vote", Vote), ("async-vote", AsyncVote), ("veto", Veto)):
+            counts[kind] = table.model(cursor).count_by("game", user__realm=realm)
+
+        return cls(realm, counts, generation)
+
+    @staticmethod
+    def generation_of(cursor: sqlite3.Cursor) -> Generation:
+        """The change counters of the tables the counts are built from"""
+
+        return orm.generations(cursor, *TALLY_TABLES)
+
+    def current(self, cursor: sqlite3.Cursor) -> bool:
+        """Whether the counts still match the database"""
+
+        generation = self.generation_of(cursor)
+
+        return len(generation) == len(TALLY_TABLES) and generation == self.generation
+
+    def apply(
+        self,
+        kind: str,
+        added: Iterable[int],
+        removed: Iterable[int],
+        before: Generation,
+        after: Generation,
+    ) -> None:
+        """
+        Applies one user's change of votes of the given kind.
+
+        `before` and `after` are the change counters either side of the
+        change. If the tally did not match the database before the change,
+        it is left as is, and will be reloaded when it is next used.
+        """
+
+        if before != self.generation:
+            return
+
+        counts = self.counts[kind]
+        self.generation = after
+        self.encoded = None
+
+        for game_id in added:
+            counts[game_id] = counts.get(game_id, 0) + 1
+
+        for game_id in removed:
+            counts[game_id] = counts.get(game_id, 0) - 1
+
+            if counts[game_id] <= 0:
+                del counts[game_id]
+
+    def payload(self, cursor: sqlite3.Cursor) -> CachedData:
+        """The encoded results.json, which is kept until the next change"""
+
+        games = orm.generations(cursor, *GAME_TABLES)
+
+        if not self.encoded or games != self.games or len(games) != len(GAME_TABLES):
+            self.encoded = CachedData.from_json(self.results(cursor))
+            self.games = games
+
+        return self.encoded
+
+    def results(self, cursor: sqlite3.Cursor) -> Dict[str, List[Dict[str, Any]]]:
+        """Builds the data for results.json"""
+
+        votes = self.counts["vote"]
+        async_votes = self.counts["async-vote"]
+        vetoes = self.counts["veto"]
+
+        # Games are read through the Game model's cache, which checks the
+        # change counters of the game tables itself.
+        game_ids = set(votes.keys()).union(async_votes.keys())
+        games = Game.model(cursor).get_many(*game_ids)
+
+        data = []
+        async_data = []
+
+        for game_id, game in games.items():
+            if game_id in votes:
+                datum = dataclasses.asdict(game)
+                datum["votes"] = votes[game_id]
+                datum["vetoes"] = vetoes.get(game_id, 0)
+                data.append(datum)
+
+            if game_id in async_votes:
+                datum = dataclasses.asdict(game)
+                datum["votes"] = async_votes[game_id]
+                datum["vetoes"] = vetoes.get(game_id, 0)
+                async_data.append(datum)
+
+        return {"results": data, "async_results": async_data}
@@ -9,26 +9,53 @@
 from __future__ import annotations
 
 import datetime
-from typing import Callable, Dict, IO, Optional, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    IO,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+)
 
+import contextlib
 import dataclasses
+import ipaddress
 import json
+import logging
+import os
 import sqlite3
+import threading
+import time
 
 import requests
 
+import orm
+from orm import ConnectionPool, JoinTable
 from boardgames.handler import FileData, Response, WSGIEnv
-from boardgames.auth_handler import AuthHandler
+from boardgames.auth_handler import AuthHandler, load_session_key
+from boardgames.catalogue import GamesCatalogue
+from boardgames.hashing import PasswordHasher, PoolSaturated
+from boardgames.streams import StreamLimit
+from boardgames.tally import RealmTally
 from boardgames.model import (
     AsyncVote,
+    Board,
     BoardRealm,
     BoardAdmin,
+    BoardAdminRealm,
     BoardAdminSuppression,
     Game,
     Realm,
     User,
     Vote,
     Veto,
+    database,
 )
 
 
@@ -47,6 +74,35 @@ FILES: Dict[str, Tuple[str, str]] = {
     "/seat.svg": ("html/seat.svg", "image/svg+xml"),
 }
 
+VOTE_MODELS: Dict[str, Type[JoinTable[User, Game]]] = {
+    "vote": Vote,
+    "async-vote": AsyncVote,
+    "veto": Veto,
+}
+
+BOARDS_TABLES = ("Board", "BoardOptions", "BoardRealm", "BoardAdmin", "Game", "GameOptions")
+OVERVIEW_TABLES = (
+    "Game",
+    "Board",
+    "AsyncVote",
+    "User",
+    "BoardAdminRealm",
+    "BoardAdminSuppression",
+)
+USER_TABLES = ("Vote", "AsyncVote", "Veto", "User", "Realm")
+
+# Settings for the overview event stream, in seconds. Streams are closed after
+# their lifetime, and the browser's EventSource will reconnect by itself.
+# Each open stream holds a worker thread, so the number open in each worker
+# process is limited (by BOARDGAMES_EVENT_STREAMS); past that, streams are
+# refused, and the overview page polls overview.json instead.
+EVENTS_POLL_INTERVAL = 2.0
+EVENTS_KEEPALIVE = 20.0
+EVENTS_LIFETIME = 600.0
+EVENTS_RETRY_AFTER = "60"
+
+LOGGER = logging.getLogger("boardgames")
+
 REALM_FILES: Dict[str, Tuple[str, bool]] = {
     "": ("html/welcome.html", True),
     "vote": ("html/vote.html", True),
@@ -60,14 +116,32 @@ class BGHandler(AuthHandler):
     realms: Dict[str, Realm] = {}
     files: Dict[str, FileData] = {}
     realm_files: Dict[str, Tuple[bool, FileData]] = {}
-    realm_data: Dict[str, Tuple[bool, Callable[[BGHandler, Realm], Response]]]
+    realm_data: Dict[
+        str, Tuple[bool, Callable[[BGHandler, sqlite3.Cursor, WSGIEnv, Realm], Response]]
+    ]
+    tallies: Dict[int, RealmTally]
+    tally_lock: threading.Lock
+    catalogue: GamesCatalogue
+    streams: StreamLimit
     _login: FileData
 
     def __init__(self) -> None:
-        self.connection = sqlite3.connect("games.db")
-        self.cursor = self.connection.cursor()
+        settings = database()
+        LOGGER.info("Database: %s", settings)
+
+        self.pool = ConnectionPool(settings)
+        self.session_key = load_session_key("session.key")
+        self.hasher = PasswordHasher(
+            int(os.environ.get("BOARDGAMES_HASH_WORKERS", "2")),
+            int(os.environ.get("BOARDGAMES_HASH_QUEUE", "8")),
+        )
+        self.streams = StreamLimit(int(os.environ.get("BOARDGAMES_EVENT_STREAMS", "4")))
+        self.legacy_tokens = {}
+        self.cache_lock = threading.Lock()
+
+        with self.pool.transaction() as cursor:
+            self.realms = {x.realm: x for x in Realm.model(cursor).all()}
 
-        self.realms = {x.realm: x for x in Realm.model(self.cursor).all()}
         self.files = {route: FileData(path, mime) for route, (path, mime) in FILES.items()}
         self.realm_files = {
             route: (path[1], FileData(path[0], "text/html; charset=utf-8"))
@@ -79,6 +153,10 @@ class BGHandler(AuthHandler):
             "boards.json": (False, BGHandler.send_boards_list),
         }
 
+        self.tallies = {}
+        self.tally_lock = threading.Lock()
+        self.catalogue = GamesCatalogue()
+
         self._login = FileData("html/login.html", "text/html; charset=utf-8")
 
     def call(  # pylint: disable=too-many-return-statements
@@ -87,6 +165,9 @@ class BGHandler(AuthHandler):
         if verb == "GET" and path in self.files:
             return self.page_file(environ, self.files[path])
 
+        if verb == "GET" and path == "/metrics":
+            return self.send_metrics(environ)
+
         realm_name, path = self.normalise_path(path)
 
         if realm_name not in self.realms:
@@ -94,26 +175,82 @@ class BGHandler(AuthHandler):
 
         realm = self.realms[realm_name]
 
-        if verb == "POST":
-            return self.post_request(environ, realm, path)
+        return self.realm_request(verb, environ, realm, path)
+
+    def realm_request(self, verb: str, environ: WSGIEnv, realm: Realm, path: str) -> Response:
+        cookie = environ.get("HTTP_COOKIE", "")
+        response: Optional[Response] = None
+
+        with self.realm_transaction() as cursor:
+            if verb == "POST":
+                return self.post_request(cursor, environ, realm, path)
+
+            try:
+                user = self.auth(cursor, realm, cookie)
+            except PoolSaturated:
+                return self.busy()
 
-        user = self.auth(realm, environ.get("HTTP_COOKIE", ""))
+            if verb not in ("PUT", "PATCH"):
+                response = self.user_request(cursor, verb, environ, realm, user, path)
 
+        if response is None:
+            # Writes take the database lock up front, so that the vote changes
+            # they compute can not be invalidated by a concurrent request. This
+            # is only done once the user is authenticated, as that can wait on
+            # the password hashing pool, and the lock must not be held while
+            # waiting on anything other than SQLite.
+            with self.realm_transaction(immediate=True) as cursor:
+                response = self.user_request(cursor, verb, environ, realm, user, path)
+
+        # Move users logged in with the old user/auth cookies on to a session.
+        if user and not self.has_session(realm, cookie):
+            response.headers.append(("Set-Cookie", self.make_session(realm, user)))
+
+        return response
+
+    @contextlib.contextmanager
+    def realm_transaction(self, immediate: bool = False) -> Iterator[sqlite3.Cursor]:
+        """A transaction for a realm request, with its own identity map"""
+
+        with self.pool.transaction(immediate=immediate) as cursor:
+            with orm.identity_map(cursor) as identities:
+                # Realms are loaded at startup, and so never need querying.
+                identities.records("Realm").update(
+                    {x.realm_id: x for x in self.realms.values()}
+                )
+
+                yield cursor
+
+    def user_request(  # pylint: disable=too-many-arguments
+        self,
+        cursor: sqlite3.Cursor,
+        verb: str,
+        environ: WSGIEnv,
+        realm: Realm,
+        user: Optional[User],
+        path: str,
+    ) -> Response:
         if verb == "GET":
-            return self.get_request(environ, realm, user, path)
+            return self.get_request(cursor, environ, realm, user, path)
+
+        data: IO[bytes] = environ.get("wsgi.input")  # type: ignore
 
         if verb == "PUT":
-            data: IO[bytes] = environ.get("wsgi.input")  # type: ignore
-            return self.put_request(realm, user, path, data)
+            return self.put_request(cursor, realm, user, path, data)
+
+        if verb == "PATCH":
+            return self.patch_request(cursor, realm, user, path, data)
 
         return Response(404, "text/plain", f"Path not found {path}".encode("utf-8"))
 
     def auth_challenge(self, realm: Realm) -> Response:
         return self.realm_file({}, realm, self._login)
 
-    def post_request(self, environ: WSGIEnv, realm: Realm, path: str) -> Response:
+    def post_request(
+        self, cursor: sqlite3.Cursor, environ: WSGIEnv, realm: Realm, path: str
+    ) -> Response:
         if path == "login":
-            return self.login(realm, environ)
+            return self.login(cursor, realm, environ)
 
         if path == "logout":
             return self.logout(realm)
@@ -121,7 +258,12 @@ class BGHandler(AuthHandler):
         return Response(404, "text/plain", f"Path not found {path}".encode("utf-8"))
 
     def get_request(
-        self, environ: WSGIEnv, realm: Realm, user: Optional[User], path: str
+        self,
+        cursor: sqlite3.Cursor,
+        environ: WSGIEnv,
+        realm: Realm,
+        user: Optional[User],
+        path: str,
     ) -> Response:
         if path in self.realm_files:
             authed, file = self.realm_files[path]
@@ -133,11 +275,19 @@ class BGHandler(AuthHandler):
 
         if path in self.realm_data:
             authed, call = self.realm_data[path]
-            return self.auth_challenge(realm) if authed and not user else call(self, realm)
+
+            if authed and not user:
+                return self.auth_challenge(realm)
+
+            return call(self, cursor, environ, realm)
 
         if path.startswith("overview.json/"):
             _, admin = path.split("/", 1)
-            return self.send_votes_overview(admin)
+            return self.send_votes_overview(cursor, environ, admin)
+
+        if path.startswith("overview.events/"):
+            _, admin = path.split("/", 1)
+            return self.send_overview_events(cursor, admin)
 
         if path.startswith("create/"):
             _, game, tokens = path.split("/", 2)
@@ -147,147 +297,377 @@ class BGHandler(AuthHandler):
             return self.create_board(game_id, tokens)
 
         if path == "me":
-            return self.send_user_details(realm, user)
+            return self.send_user_details(cursor, environ, realm, user)
 
         return Response(404, "text/plain", f"Path not found {path}".encode("utf-8"))
 
     def put_request(
-        self, realm: Realm, user: Optional[User], path: str, data: IO[bytes]
+        self,
+        cursor: sqlite3.Cursor,
+        realm: Realm,
+        user: Optional[User],
+        path: str,
+        data: IO[bytes],
     ) -> Response:
         if path == "suppress":
-            return self.suppress_request(data)
+            return self.suppress_request(cursor, data)
 
         if not user:
             return self.auth_challenge(realm)
 
-        mapping = {"vote": Vote.model, "async-vote": AsyncVote.model, "veto": Veto.model}
+        if path not in VOTE_MODELS:
+            return Response(404, "text/plain", f"Path not found {path}".encode("utf-8"))
 
-        if path not in mapping:
+        game_model = Game.model(cursor)
+        vote_model = VOTE_MODELS[path].model(cursor)
+
+        game_ids = game_model.known_ids(*map(int, json.load(data)))
+
+        self.commit_votes(cursor, realm, path, lambda: vote_model.set_left(user, game_ids))
+
+        return Response(204, "", b"")
+
+    def patch_request(
+        self,
+        cursor: sqlite3.Cursor,
+        realm: Realm,
+        user: Optional[User],
+        path: str,
+        data: IO[bytes],
+    ) -> Response:
+        """Adds and removes individual games from one of the user's vote lists.
+
+        The body is of the form {"add": [game_id, ...], "remove": [game_id, ...]},
+        and the response gives the new number of games in the list."""
+
+        if not user:
+            return self.auth_challenge(realm)
+
+        if path not in VOTE_MODELS:
             return Response(404, "text/plain", f"Path not found {path}".encode("utf-8"))
 
-        game_model = Game.model(self.cursor)
-        vote_model = mapping[path](self.cursor)
+        game_model = Game.model(cursor)
+        vote_model = VOTE_MODELS[path].model(cursor)
 
-        vote_model.clear_left(user)
+        lists = self.id_lists(data, "add", "remove")
 
-        ids = map(int, json.load(data))
+        if lists is None:
+            return Response(400, "text/plain", b"Bad Request")
 
-        for game in game_model.get_many(*ids).values():
-            vote_model.store(user, game)
+        add = game_model.known_ids(*lists[0])
+        remove = lists[1]
 
-        self.connection.commit()
+        self.commit_votes(
+            cursor, realm, path, lambda: vote_model.update_left(user, add, remove)
+        )
+        count = len(vote_model.ids_for_left(user))
 
-        return Response(204, "", b"")
+        return self.send_json({"count": count})
 
-    def suppress_request(self, data: IO[bytes]) -> Response:
+    @staticmethod
+    def id_lists(data: IO[bytes], *keys: str) -> Optional[List[List[int]]]:
+        """
+        The lists of IDs under `keys` of a JSON object, or None if the body is not one.
+
+        The pages send IDs as they read them from the document, so integers
+        written as strings are accepted as well.
+        """
+
+        try:
+            request = json.load(data)
+        except ValueError:
+            return None
+
+        if not isinstance(request, dict):
+            return None
+
+        lists = [request.get(key, []) for key in keys]
+
+        if not all(
+            isinstance(ids, list) and all(type(_id) in (int, str) for _id in ids)
+            for ids in lists
+        ):
+            return None
+
+        try:
+            return [[int(_id) for _id in ids] for ids in lists]
+        except ValueError:
+            return None
+
+    def suppress_request(self, cursor: sqlite3.Cursor, data: IO[bytes]) -> Response:
         request = json.load(data)
 
-        admins = BoardAdmin.model(self.cursor).search(admin=request.get("admin", ""))
-        game = Game.model(self.cursor).get(request.get("game_id", 0))
+        admins = BoardAdmin.model(cursor).search_ids(admin=request.get("admin", ""))
+        game = Game.model(cursor).get(request.get("game_id", 0))
 
         if not admins or not game:
             return Response(404, "", b"")
 
-        BoardAdminSuppression.model(self.cursor).store(
+        BoardAdminSuppression.model(cursor).store(
             BoardAdminSuppression(
-                admins[0].board_admin_id or 0,
+                admins[0],
                 game,
                 datetime.datetime.now() + datetime.timedelta(days=request.get("days", 0)),
             )
         )
 
-        self.connection.commit()
-
         return Response(204, "", b"")
 
-    def send_games_list(self, realm: Realm) -> Response:
-        self.cursor.execute(
-            """
-            SELECT [Game].[game_id] FROM [Game]
-            LEFT JOIN [RealmBlacklist]
-              ON [Game].[game_id] = [RealmBlacklist].[game_id]
-              AND [RealmBlacklist].[realm_id] = ?
-            WHERE [realm_id] IS NULL
-            """,
-            (realm.realm_id,),
-        )
+    def commit_votes(
+        self,
+        cursor: sqlite3.Cursor,
+        realm: Realm,
+        kind: str,
+        write: Callable[[], Tuple[Set[int], Set[int]]],
+    ) -> None:
+        """Makes and commits a change of votes, and applies it to the realm's tally.
+
+        `write` makes the change, and returns the added and removed game IDs.
+        It runs in an immediate transaction, so the tally's change counters
+        can be read on either side of it without another writer intervening.
+        The commit and the tally update happen under the tally lock, so that
+        a tally being loaded by another thread sees either none or all of
+        the change."""
+
+        before = RealmTally.generation_of(cursor)
+        added, removed = write()
+        after = RealmTally.generation_of(cursor)
+
+        with self.tally_lock:
+            cursor.connection.commit()
+
+            if realm.realm_id in self.tallies:
+                self.tallies[realm.realm_id].apply(kind, added, removed, before, after)
+
+    def send_metrics(self, environ: WSGIEnv) -> Response:
+        # The metrics expose the hashing pool and cache internals, so are only
+        # served to scrapers on this machine, and never through a proxy.
+        if not self.local_request(environ):
+            return Response(404, "text/plain", b"Not Found")
 
-        ids = [x[0] for x in self.cursor.fetchall()]
-        games = Game.model(self.cursor).get_many(*ids)
-        data = [dataclasses.asdict(game) for game in games.values()]
+        lines = self.hasher.metrics() + self.cache_metrics()
+        body = "".join(line + "\n" for line in lines).encode("utf-8")
 
-        return self.send_json(data)
+        return Response(200, "text/plain; version=0.0.4", body)
 
-    def send_boards_list(self, realm: Realm) -> Response:
-        model = BoardRealm.model(self.cursor)
+    @staticmethod
+    def local_request(environ: WSGIEnv) -> bool:
+        """Whether a request came straight from the loopback interface"""
 
-        boards = model.of_right(realm)
-        data = [dataclasses.asdict(board) for board in boards if board.state == "open"]
+        if "HTTP_X_FORWARDED_FOR" in environ or "HTTP_FORWARDED" in environ:
+            return False
 
-        return self.send_json(data)
+        try:
+            return ipaddress.ip_address(environ.get("REMOTE_ADDR", "")).is_loopback
+        except ValueError:
+            return False
 
-    def send_votes_overview(self, admin: str) -> Response:
-        admins = BoardAdmin.model(self.cursor).search(admin=admin)
+    @staticmethod
+    def cache_metrics() -> List[str]:
+        """The ORM's record cache statistics, in Prometheus' text format"""
+
+        caches = orm.cache_stats()
+        lines: List[str] = []
+
+        for metric, kind, field in (
+            ("boardgames_cache_hits_total", "counter", "hits"),
+            ("boardgames_cache_misses_total", "counter", "misses"),
+            ("boardgames_cache_entries", "gauge", "entries"),
+        ):
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(
+                f'{metric}{{table="{table}"}} {getattr(stats, field)}'
+                for table, stats in caches.items()
+            )
+
+        return lines
+
+    @staticmethod
+    def generation_tag(
+        cursor: sqlite3.Cursor, prefix: str, tables: Tuple[str, ...]
+    ) -> Optional[str]:
+        """Builds an ETag from the change counters of some tables.
+
+        If the counters are not available, no tag is generated."""
+
+        generation = orm.generations(cursor, *tables)
+
+        if len(generation) != len(tables):
+            return None
+
+        return "-".join([prefix, *(str(generation[table]) for table in tables)])
+
+    def send_games_list(
+        self, cursor: sqlite3.Cursor, environ: WSGIEnv, realm: Realm
+    ) -> Response:
+        return self.page_file(environ, self.catalogue.get(cursor, realm))
+
+    def send_boards_list(
+        self, cursor: sqlite3.Cursor, environ: WSGIEnv, realm: Realm
+    ) -> Response:
+        def boards() -> List[Dict[str, Any]]:
+            model = BoardRealm.model(cursor).lazy("game", "creator")
+
+            # Only the open boards, and their Games and creators, are loaded.
+            listed = model.of_right(realm, state="open")
+            orm.resolve(listed)
+
+            return [dataclasses.asdict(board) for board in listed]
+
+        tag = self.generation_tag(cursor, f"boards-{realm.realm_id}", BOARDS_TABLES)
+
+        return self.send_tagged_json(environ, tag, boards)
+
+    def send_votes_overview(
+        self, cursor: sqlite3.Cursor, environ: WSGIEnv, admin: str
+    ) -> Response:
+        admins = BoardAdmin.model(cursor).search_ids(admin=admin)
 
         if not admins:
             return Response(404, "text/plain", b"Not Found")
 
-        admin_id = admins[0].board_admin_id
-
-        self.cursor.execute(
-            (
-                "SELECT game_id, name, bga_id, link, description, votes, users, "
-                "until, open, all_open, created, last_created, launched, last_launched "
-                "FROM Game "
-                "NATURAL LEFT JOIN ( "
-                "SELECT game_id, SUM(IIF(state == 'open', 1, 0)) open, "
-                "COUNT(0) created, MAX(created) last_created, "
-                "COUNT(launch_time) launched, MAX(launch_time) last_launched "
-                "FROM Board WHERE board_admin_id = ? GROUP BY game_id "
-                ") "
-                "NATURAL LEFT JOIN ( "
-                "SELECT game_id, COUNT(0) all_open "
-                "FROM Board WHERE state == 'open' GROUP BY game_id "
-                ") "
-                "NATURAL LEFT JOIN ( "
-                "SELECT game_id, COUNT(0) votes, GROUP_CONCAT(DISTINCT username) users "
-                "FROM AsyncVote NATURAL JOIN User NATURAL JOIN BoardAdminRealm "
-                "WHERE board_admin_id = ? "
-                "GROUP BY game_id "
-                ") "
-                "NATURAL LEFT JOIN ( "
-                "SELECT game_id, until "
-                "FROM BoardAdminSuppression "
-                "WHERE board_admin_id = ? AND until > CURRENT_TIMESTAMP "
-                ") "
-                "WHERE Game.platform = 'BGA' "
-                "GROUP BY Game.game_id; "
-            ),
-            (admin_id, admin_id, admin_id),
+        admin_id = admins[0]
+
+        tag = self.generation_tag(cursor, self.overview_prefix(admin_id), OVERVIEW_TABLES)
+
+        return self.send_tagged_json(
+            environ, tag, lambda: self.votes_overview(cursor, admin_id)
+        )
+
+    def send_overview_events(self, cursor: sqlite3.Cursor, admin: str) -> Response:
+        admins = BoardAdmin.model(cursor).search_ids(admin=admin)
+
+        if not admins:
+            return Response(404, "text/plain", b"Not Found")
+
+        stream = self.streams.start(self.overview_events(admins[0]))
+
+        if not stream:
+            return Response(
+                503,
+                "text/plain",
+                b"Too many overview streams are open",
+                headers=[("Retry-After", EVENTS_RETRY_AFTER)],
+            )
+
+        return Response(
+            200, "text/event-stream", stream, headers=[("X-Accel-Buffering", "no")]
+        )
+
+    def overview_events(self, admin_id: int) -> Generator[bytes, None, None]:
+        """
+        Event stream for the admin overview.
+
+        The first event ("overview") is the full overview, and later events
+        ("update") contain only the rows which have changed. The overview is
+        only re-queried when the change counters of its tables move, and the
+        only state kept for the connection is the last copy of each row.
+
+        The stream outlives the request that started it, so each poll takes
+        its own connection from the pool rather than holding one open.
+        """
+
+        rows: Dict[int, Dict[str, Any]] = {}
+        tag: Optional[str] = None
+        event = b"overview"
+        finish = time.monotonic() + EVENTS_LIFETIME
+        keepalive = time.monotonic() + EVENTS_KEEPALIVE
+
+        yield b"retry: 5000\n\n"
+
+        while time.monotonic() < finish:
+            with self.pool.transaction() as cursor:
+                prefix = self.overview_prefix(admin_id)
+                current = self.generation_tag(cursor, prefix, OVERVIEW_TABLES)
+                refresh = current is None or current != tag
+                overview = self.votes_overview(cursor, admin_id) if refresh else []
+
+            if refresh:
+                tag = current
+                changed = []
+
+                for row in overview:
+                    if rows.get(row["game_id"]) != row:
+                        rows[row["game_id"]] = row
+                        changed.append(row)
+
+                if changed or event == b"overview":
+                    data = "".join(json.JSONEncoder().iterencode(changed))
+                    yield b"event: " + event + b"\ndata: " + data.encode("utf-8") + b"\n\n"
+                    keepalive = time.monotonic() + EVENTS_KEEPALIVE
+                    event = b"update"
+
+            if time.monotonic() > keepalive:
+                yield b": keepalive\n\n"
+                keepalive = time.monotonic() + EVENTS_KEEPALIVE
+
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    @staticmethod
+    def overview_prefix(admin_id: int) -> str:
+        # Suppressions expire without any write, so the tag also rolls over
+        # every minute.
+        minute = int(datetime.datetime.now().timestamp() // 60)
+
+        return f"overview-{admin_id}-{minute}"
+
+    @staticmethod
+    def votes_overview(cursor: sqlite3.Cursor, admin_id: int) -> List[Dict[str, Any]]:
+        games = Game.model(cursor).project("game_id", "name", "bga_id", "link", "description")
+        boards = Board.model(cursor).aggregate(
+            "game",
+            {
+                "open": orm.Count(state="open"),
+                "created": orm.Count(),
+                "last_created": orm.Max("created"),
+                "launched": orm.Count("launch_time"),
+                "last_launched": orm.Max("launch_time"),
+            },
+            board_admin_id=admin_id,
         )
+        all_open = Board.model(cursor).count_by("game", state="open")
+        realms = BoardAdminRealm.model(cursor).count_by("realm", board_admin_id=admin_id)
+        votes = AsyncVote.model(cursor).aggregate(
+            "game",
+            {"votes": orm.Count(), "users": orm.Concat("user__username", distinct=True)},
+            user__realm_id=list(realms),
+        )
+
+        # Suppressions are stored in local time, and compared with SQLite's
+        # CURRENT_TIMESTAMP, as text.
+        now = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S")
+        suppressions = BoardAdminSuppression.model(cursor).project("game_id", "until")
+        until = {
+            row.game_id: row.until
+            for row in suppressions.search(board_admin_id=admin_id, until=orm.Above(now))
+        }
+
+        overview = []
+
+        for game in games.search(platform="BGA"):
+            board = boards[game.game_id]._asdict() if game.game_id in boards else {}
+            vote = votes[game.game_id]._asdict() if game.game_id in votes else {}
+
+            overview.append(
+                {
+                    **game._asdict(),
+                    "votes": vote.get("votes"),
+                    "users": vote.get("users"),
+                    "until": until.get(game.game_id),
+                    "open": board.get("open"),
+                    "all_open": all_open.get(game.game_id),
+                    "created": board.get("created"),
+                    "last_created": board.get("last_created"),
+                    "launched": board.get("launched"),
+                    "last_launched": board.get("last_launched"),
+                }
+            )
 
-        fields = [
-            "game_id",
-            "name",
-            "bga_id",
-            "link",
-            "description",
-            "votes",
-            "users",
-            "until",
-            "open",
-            "all_open",
-            "created",
-            "last_created",
-            "launched",
-            "last_launched",
-        ]
-
-        rows = [dict(zip(fields, x)) for x in self.cursor.fetchall()]
-
-        return self.send_json(rows)
-
-    def send_user_details(self, realm: Realm, user: Optional[User]) -> Response:
+        return overview
+
+    def send_user_details(
+        self, cursor: sqlite3.Cursor, environ: WSGIEnv, realm: Realm, user: Optional[User]
+    ) -> Response:
         if not user:
             return self.send_json(
                 {
@@ -302,106 +682,34 @@ class BGHandler(AuthHandler):
                 }
             )
 
-        data = {
-            "username": user.username,
-            "role": user.role,
-            "votes": Vote.model(self.cursor).ids_for_left(user),
-            "async_votes": AsyncVote.model(self.cursor).ids_for_left(user),
-            "vetoes": Veto.model(self.cursor).ids_for_left(user),
-            "max_votes": 999,
-            "max_vetoes": 3,
-            "realm": dataclasses.asdict(user.realm),
-        }
+        def details() -> Dict[str, Any]:
+            return {
+                "username": user.username,
+                "role": user.role,
+                "votes": Vote.model(cursor).ids_for_left(user),
+                "async_votes": AsyncVote.model(cursor).ids_for_left(user),
+                "vetoes": Veto.model(cursor).ids_for_left(user),
+                "max_votes": 999,
+                "max_vetoes": 3,
+                "realm": dataclasses.asdict(user.realm),
+            }
 
-        return self.send_json(data)
+        tag = self.generation_tag(cursor, f"me-{user.user_id}", USER_TABLES)
 
-    def send_results(self, realm: Realm) -> Response:
-        votes, vetoes = self.get_realtime_votes(realm)
-        async_votes, async_vetoes = self.get_async_votes(realm)
+        return self.send_tagged_json(environ, tag, details)
 
-        game_ids = (
-            set(votes.keys())
-            .union(vetoes.keys())
-            .union(async_votes.keys())
-            .union(async_vetoes.keys())
-        )
-        games = Game.model(self.cursor).get_many(*game_ids)
-
-        data = []
-        async_data = []
-
-        for game in games.values():
-            if game.game_id in votes:
-                datum = dataclasses.asdict(game)
-                datum["votes"] = votes.get(game.game_id, 0)
-                datum["vetoes"] = vetoes.get(game.game_id, 0)
-                data.append(datum)
-
-            if game.game_id in async_votes:
-                datum = dataclasses.asdict(game)
-                datum["votes"] = async_votes.get(game.game_id, 0)
-                datum["vetoes"] = async_vetoes.get(game.game_id, 0)
-                async_data.append(datum)
-
-        return self.send_json({"results": data, "async_results": async_data})
-
-    def get_realtime_votes(self, realm: Realm) -> Tuple[Dict[int, int], Dict[int, int]]:
-        self.cursor.execute(
-            """
-            SELECT [game_id], COUNT(0)
-            FROM [Vote] JOIN [User] USING ([user_id])
-            WHERE [realm_id] = ?
-            GROUP BY [game_id]
-            ORDER BY COUNT(0) DESC
-            """,
-            (realm.realm_id,),
-        )
-
-        votes: Dict[int, int] = dict(self.cursor.fetchall())
-
-        self.cursor.execute(
-            """
-            SELECT [game_id], COUNT(0)
-            FROM [Veto] JOIN [User] USING ([user_id])
-            WHERE [realm_id] = ?
-            GROUP BY [game_id]
-            ORDER BY COUNT(0) DESC
-            """,
-            (realm.realm_id,),
-        )
-
-        vetoes: Dict[int, int] = dict(self.cursor.fetchall())
-
-        return votes, vetoes
-
-    def get_async_votes(self, realm: Realm) -> Tuple[Dict[int, int], Dict[int, int]]:
-        self.cursor.execute(
-            """
-            SELECT [game_id], COUNT(0)
-            FROM [AsyncVote] JOIN [User] USING ([user_id])
-            WHERE [realm_id] = ?
-            GROUP BY [game_id]
-            ORDER BY COUNT(0) DESC
-            """,
-            (realm.realm_id,),
-        )
+    def send_results(
+        self, cursor: sqlite3.Cursor, environ: WSGIEnv, realm: Realm
+    ) -> Response:
+        with self.tally_lock:
+            tally = self.tallies.get(realm.realm_id)
 
-        votes: Dict[int, int] = dict(self.cursor.fetchall())
-
-        self.cursor.execute(
-            """
-            SELECT [game_id], COUNT(0)
-            FROM [Veto] JOIN [User] USING ([user_id])
-            WHERE [realm_id] = ?
-            GROUP BY [game_id]
-            ORDER BY COUNT(0) DESC
-            """,
-            (realm.realm_id,),
-        )
+            if tally is None or not tally.current(cursor):
+                tally = self.tallies[realm.realm_id] = RealmTally.load(cursor, realm)
 
-        vetoes: Dict[int, int] = dict(self.cursor.fetchall())
+            data = tally.payload(cursor)
 
-        return votes, vetoes
+        return self.page_file(environ, data)
 
     def create_board(self, game_id: int, tokens: str) -> Response:
         config = json.loads(tokens)
@@ -100,7 +100,7 @@ function buildTable(games) {
                     " | ",
                     a({href: game.link, target: "_blank"}, "info")
                 ),
-                td({ class: "number border", title: (game?.users||"").replaceAll(",", "\n") }, (game.votes||0).toString()),
+                td({ class: "number border", field: "votes", title: (game?.users||"").replaceAll(",", "\n") }, (game.votes||0).toString()),
                 td({ class: "number border", field: "open" }, (game.open||0).toString()),
                 td({ class: "number", field: "all_open" }, (game.all_open||0).toString()),
                 td({ class: "number border" }, (game.launched||"").toString()),
@@ -135,6 +135,10 @@ function updateTable(games) {
         row.classList.toggle("suppressed", game.suppressed);
         row.classList.toggle("has_boards", game.all_open > 0);
 
+        const votes = row.querySelector('td[field="votes"]');
+        votes.textContent = (game?.votes||0).toString();
+        votes.title = (game?.users||"").replaceAll(",", "\n");
+
         row.querySelector('td[field="open"]').textContent = (game?.open||0).toString();
         row.querySelector('td[field="all_open"]').textContent = (game?.all_open||0).toString();
     });
@@ -203,29 +207,50 @@ function initTokens() {
 
 const admin = new URLSearchParams(window.location.search).get("admin");
 initTokens();
-fetch(`overview.json/${admin}`)
-    .then(r => r.json())
-    .then(games => games.map(formatGame))
-    .then(buildTable)
-    .then(table => document.body.appendChild(table))
-    .then(() => {
-        const votesColumn = document.getElementById("_t");
-        const launchedColumn = document.getElementById("_d");
-        const activeColumn = document.getElementById("_a");
-        const suppressedColumn = document.getElementById("_s");
-        sortTable({ target: launchedColumn });
-        sortTable({ target: votesColumn });
-        sortTable({ target: activeColumn });
-        sortTable({ target: activeColumn });
-        sortTable({ target: suppressedColumn });
-    });
 
-setInterval(
-    () => {
+let built = false;
+
+function showOverview(games) {
+    if (built) {
+        updateTable(games);
+        return;
+    }
+
+    built = true;
+    document.body.appendChild(buildTable(games));
+
+    const votesColumn = document.getElementById("_t");
+    const launchedColumn = document.getElementById("_d");
+    const activeColumn = document.getElementById("_a");
+    const suppressedColumn = document.getElementById("_s");
+    sortTable({ target: launchedColumn });
+    sortTable({ target: votesColumn });
+    sortTable({ target: activeColumn });
+    sortTable({ target: activeColumn });
+    sortTable({ target: suppressedColumn });
+}
+
+function pollOverview() {
+    const load = () =>
         fetch(`overview.json/${admin}`)
             .then(r => r.json())
-            .then(games => games.map(formatGame))
-            .then(updateTable)
-    },
-    30000
-);
+            .then(games => showOverview(games.map(formatGame)));
+
+    load();
+    setInterval(load, 30000);
+}
+
+// The stream starts with the full overview (also sent again after a reconnect),
+// followed by only the rows which change.
+const events = new EventSource(`overview.events/${admin}`);
+
+events.addEventListener("overview", e => showOverview(JSON.parse(e.data).map(formatGame)));
+events.addEventListener("update", e => updateTable(JSON.parse(e.data).map(formatGame)));
+
+// The server refuses streams once it has too many open, which closes the
+// EventSource rather than reconnecting it; the overview is then polled.
+events.addEventListener("error", () => {
+    if (events.readyState === EventSource.CLOSED) {
+        pollOverview();
+    }
+});
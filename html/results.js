@@ -154,11 +154,15 @@ const process = (games, votes, vetoes, header) =>
 
 let bounceTimer;
 
+const pending = new Map();
+
 function toggleVeto(event) {
     const cell = event.target;
     const row = event.target.closest("tr");
+    const vetoed = row.classList.toggle("vetoed");
 
-    cell.textContent = 1 - row.classList.toggle("vetoed");
+    cell.textContent = 1 - vetoed;
+    pending.set(row.getAttribute("game-id"), vetoed);
 
     if (bounceTimer) {
         return;
@@ -170,13 +174,19 @@ function toggleVeto(event) {
 function sendVetoes() {
     bounceTimer = null;
 
-    const games = [...document.querySelectorAll("tr.vetoed")].map(e => e.getAttribute("game-id"));
+    const entries = [...pending.entries()];
+    const add = entries.filter(([, vetoed]) => vetoed).map(([game]) => game);
+    const remove = entries.filter(([, vetoed]) => !vetoed).map(([game]) => game);
+
+    pending.clear();
 
-    console.log("Sending vetoes for", games);
+    console.log("Sending veto changes", add, remove);
 
     fetch("veto", {
-        method: "PUT",
+        method: "PATCH",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(games),
-    }).then((document.querySelector(".js-vetoes").textContent = games.length));
+        body: JSON.stringify({ add, remove }),
+    })
+        .then(r => r.json())
+        .then(r => (document.querySelector(".js-vetoes").textContent = r.count));
 }
@@ -102,12 +102,24 @@ Promise.all([fetch("games.json").then(r => r.json()), fetch("me").then(r => r.js
 
 let bounceTimer;
 
+const pending = {
+    "vote": new Map(),
+    "async-vote": new Map(),
+};
+
+const counters = {
+    "vote": ".js-votes",
+    "async-vote": ".js-async-votes",
+};
+
 function toggleVote(event) {
     const cell = event.target;
     const row = event.target.closest("tr");
     const type = event.target.classList.contains("vote") ? "voted" : "avoted";
+    const voted = row.classList.toggle(type);
 
-    cell.textContent = 1 - row.classList.toggle(type);
+    cell.textContent = 1 - voted;
+    pending[type === "voted" ? "vote" : "async-vote"].set(row.getAttribute("game-id"), voted);
 
     if (bounceTimer) {
         return;
@@ -119,23 +131,27 @@ function toggleVote(event) {
 function sendVotes() {
     bounceTimer = null;
 
-    const games = [...document.querySelectorAll("tr.voted")].map(e => e.getAttribute("game-id"));
-    const async_games = [...document.querySelectorAll("tr.avoted")].map(e => e.getAttribute("game-id"));
+    for (const [path, changes] of Object.entries(pending)) {
+        if (!changes.size) {
+            continue;
+        }
 
-    console.log("Sending realtime votes for", games);
-    console.log("Sending async votes for", async_games);
+        const entries = [...changes.entries()];
+        const add = entries.filter(([, voted]) => voted).map(([game]) => game);
+        const remove = entries.filter(([, voted]) => !voted).map(([game]) => game);
 
-    fetch("vote", {
-        method: "PUT",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(games),
-    }).then((document.querySelector(".js-votes").textContent = games.length));
+        changes.clear();
 
-    fetch("async-vote", {
-        method: "PUT",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(async_games),
-    }).then((document.querySelector(".js-async-votes").textContent = games.length));
+        console.log(`Sending ${path} changes`, add, remove);
+
+        fetch(path, {
+            method: "PATCH",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ add, remove }),
+        })
+            .then(r => r.json())
+            .then(r => (document.querySelector(counters[path]).textContent = r.count));
+    }
 }
 
 function sortTable(event) {
@@ -19,7 +19,42 @@ Find this project at:
 from __future__ import annotations
 
 from .table import Table, ModelWrapper as TableModel, subtable, unique
-from .join import JoinTable, JoinWrapper as JoinModel
-
-
-__all__ = ["Table", "TableModel", "JoinTable", "JoinModel", "subtable", "unique"]
+from .join import JoinTable, JoinWrapper as JoinModel, join_layout
+from .aggregate import Avg, Concat, Count, Max, Min, Sum
+from .compare import Above, AtLeast, AtMost, Below, Not
+from .cache import cached, cache_stats
+from .generation import generations
+from .identity import identity_map
+from .index import index
+from .lazy import resolve
+from .connection import ConnectionPool, ConnectionSettings
+
+
+__all__ = [
+    "Table",
+    "TableModel",
+    "JoinTable",
+    "JoinModel",
+    "join_layout",
+    "subtable",
+    "unique",
+    "index",
+    "Count",
+    "Sum",
+    "Min",
+    "Max",
+    "Avg",
+    "Concat",
+    "Below",
+    "AtMost",
+    "Above",
+    "AtLeast",
+    "Not",
+    "cached",
+    "cache_stats",
+    "resolve",
+    "generations",
+    "identity_map",
+    "ConnectionPool",
+    "ConnectionSettings",
+]
@@ -12,13 +12,29 @@ Base support for SQL tables and WHERE clauses
 from __future__ import annotations
 
 import sqlite3
-from typing import Any, Dict, Generator, Iterable, List, Mapping, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Hashable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import abc
+import json
 import logging
 import orm  # pylint: disable=unused-import
+from orm.compare import OPERATORS, Comparison
 from orm.exceptions import ORMException
 
+
 OurField = str
 TheirField = str
 ForeignerMap = Dict[OurField, Tuple[TheirField, "orm.table.TableModel[Any]"]]
@@ -26,6 +42,7 @@ ForeignerMap = Dict[OurField, Tuple[TheirField, "orm.table.TableModel[Any]"]]
 PrimitiveTypes = Union[str, int, float, bool, None]
 FilterTypes = Union[
     PrimitiveTypes,
+    Comparison,
     "orm.table.Table[Any]",
     Iterable[PrimitiveTypes],
     Iterable["orm.table.Table[Any]"],
@@ -34,6 +51,22 @@ Filters = Mapping[str, FilterTypes]
 MutableFilters = Dict[str, FilterTypes]
 SQLParams = Union[Tuple[PrimitiveTypes, ...], Dict[str, str]]
 
+# The shape of one column's WHERE clause: the column, the type of match
+# ("eq", "null", "in", "in_null", "json", "json_null", or the match of a
+# Comparison), and the number of IN parameters.
+WhereShape = Tuple[str, str, int]
+
+STATEMENT_CACHE_SIZE = 256
+
+# The number of records loaded by each query of an iter_search.
+ITER_BATCH_SIZE = 500
+
+# Lists longer than this are passed as a single JSON array parameter and
+# expanded with json_each, rather than as one parameter per value. This
+# avoids SQLite's limit on the number of parameters, and long statements;
+# below it, the two methods perform about the same.
+JSON_LIST_THRESHOLD = 512
+
 
 _LOGGER = logging.getLogger("tiny-orm")
 
@@ -50,9 +83,109 @@ def execute(cursor: sqlite3.Cursor, query: str, params: SQLParams) -> None:
     _LOGGER.debug("%s", params)
 
 
+def executemany(cursor: sqlite3.Cursor, query: str, params: Sequence[SQLParams]) -> None:
+    try:
+        cursor.executemany(query, params)
+    except sqlite3.Error as ex:
+        _LOGGER.error("%s", query)
+        _LOGGER.error("%s", params)
+        raise ex
+
+    _LOGGER.debug("%s", query)
+    _LOGGER.debug("%d rows", len(params))
+
+
+def in_bucket(count: int) -> int:
+    """
+    The padded length of an IN list of `count` values.
+
+    IN lists are padded with NULLs so that queries over different numbers
+    of IDs share statements in sqlite3's statement cache. Each doubling of
+    length is split into four buckets, so there are only 36 lengths up to
+    1024, and no more than a quarter of a list is padding. (Padding to
+    powers of two costs more in binding NULLs than it saves in parsing.)
+    """
+
+    if count <= 8:
+        return count
+
+    step = 1 << (count.bit_length() - 3)
+
+    return -(-count // step) * step
+
+
+def in_params(values: Iterable[PrimitiveTypes]) -> Tuple[PrimitiveTypes, ...]:
+    """The parameters for an IN list, padded to its bucket length.
+
+    The padding is NULL, which never matches in an IN list."""
+
+    params = tuple(values)
+
+    return params + (None,) * (in_bucket(len(params)) - len(params))
+
+
+def placeholders(count: int) -> str:
+    return ", ".join(["?"] * count)
+
+
+def json_list(values: Sequence[PrimitiveTypes]) -> bool:
+    """Whether a list of values should be passed as a JSON array"""
+
+    return len(values) > JSON_LIST_THRESHOLD and all(
+        isinstance(value, (str, int, float)) for value in values
+    )
+
+
+def in_list(values: Sequence[PrimitiveTypes]) -> Tuple[int, str, Tuple[PrimitiveTypes, ...]]:
+    """
+    The contents of an IN (...) for a list of values.
+
+    Returns the size the SQL was built for (as a statement cache key), the SQL
+    to go in the brackets, and the parameters for it. The size is -1 for
+    lists that are passed as JSON.
+    """
+
+    if json_list(values):
+        return -1, "SELECT [value] FROM json_each(?)", (json.dumps(list(values)),)
+
+    size = in_bucket(len(values))
+
+    return size, placeholders(size), in_params(values)
+
+
+class StatementCache:
+    """
+    SQL text for a model, built once for each shape of query.
+
+        sql = self.statements(("get_many", size), lambda: build_sql(size))
+
+    The key must identify everything that the SQL text depends on. If more
+    than STATEMENT_CACHE_SIZE shapes are seen, the cache starts again.
+    """
+
+    _statements: Dict[Hashable, str]
+
+    def __init__(self) -> None:
+        self._statements = {}
+
+    def __call__(self, key: Hashable, build: Callable[[], str]) -> str:
+        sql = self._statements.get(key)
+
+        if sql is None:
+            if len(self._statements) >= STATEMENT_CACHE_SIZE:
+                self._statements = {}
+
+            sql = build()
+            self._statements[key] = sql
+
+        return sql
+
+
 class BaseModel(abc.ABC):
     """Common functionality for different types of ORM model"""
 
+    statements: StatementCache
+
     def where(
         self, foreigners: ForeignerMap, conditions: Filters
     ) -> Tuple[str, Dict[str, Any]]:
@@ -75,13 +208,25 @@ class BaseModel(abc.ABC):
           `{visible: True, name: "Cat"}`
 
         Iterables values for a filter are processed as "and of" (OR).
+        Long lists are passed as one JSON array (see JSON_LIST_THRESHOLD).
 
           `where({}, {some_id: [1, 3, 5]}`
 
         generates as
 
-          `[some_id] IN (:some_id__0, :some_id__1, :some_id__2))`
-          `{some_id__0: 1, some_id__1: 3, some_id__2: 5}`
+          `[some_id] IN (:some_id__0, :some_id__1, :some_id__2, :some_id__3))`
+          `{some_id__0: 1, some_id__1: 3, some_id__2: 5, some_id__3: None}`
+
+        (the list is padded with NULLs, see `in_bucket`).
+
+        Comparisons (see `orm.compare`) are matched with their operator.
+
+          `where({}, {seats: AtLeast(2)})`
+
+        generates as
+
+          `[seats] >= :seats`
+          `{seats: 2}`
 
         In order to facilitiate the mapping of other objects, we can also provider
         foreign key information to the `where` function. This maps the column ID
@@ -93,10 +238,27 @@ class BaseModel(abc.ABC):
 
           `[cat_id] = :cat_id`
           `{cat_id: 1}`
+
+        The SQL is cached for each shape of query, so repeated searches
+        return the same string.
+        """
+        shape, values = self.where_values(foreigners, conditions)
+        sql = self.statements(("where", shape), lambda: self.where_sql(shape))
+
+        return sql, values
+
+    def where_values(
+        self, foreigners: ForeignerMap, conditions: Filters
+    ) -> Tuple[Tuple[WhereShape, ...], Dict[str, Any]]:
+        """
+        The shape and parameters of the WHERE clause for a set of filters.
+
+        This is `where` without the SQL, for queries which need to build the
+        clause with `where_sql` themselves (such as against a joined table).
         """
         keys = list(conditions.keys())
         values = dict(conditions)
-        clauses = []
+        shapes: List[WhereShape] = []
 
         for key in keys:
             if key in foreigners:
@@ -114,9 +276,9 @@ class BaseModel(abc.ABC):
                 values[their_field] = set(self.map_foreign_objects(their_field, subvalues))
                 key = their_field
 
-            clauses.append(self.where_clause(key, values))
+            shapes.append(self.where_shape(key, values))
 
-        return " AND ".join(clauses), values
+        return tuple(shapes), values
 
     @staticmethod
     def map_foreign_objects(
@@ -127,46 +289,76 @@ class BaseModel(abc.ABC):
             yield getattr(obj, field) if obj else None
 
     @staticmethod
-    def where_clause(field: str, filters: Dict[str, Any]) -> str:
-        """Creates a specific sub-clause for a WHERE query.
+    def where_shape(field: str, filters: Dict[str, Any]) -> WhereShape:
+        """Works out the shape of a specific sub-clause for a WHERE query.
 
         This will by representing some number of values a specific
-        column must match at least one of"""
+        column must match at least one of. Any parameters the clause needs
+        beyond `field` are added to `filters`."""
+        if isinstance(filters[field], Comparison):
+            comparison = filters[field]
+            filters[field] = comparison.value
+
+            return (field, comparison.match, 0)
+
         if not isinstance(filters[field], (list, set, tuple)):
-            return (
-                f"[{field}] = :{field}"
-                if filters[field] is not None
-                else f"[{field}] IS NULL"
-            )
+            return (field, "eq" if filters[field] is not None else "null", 0)
 
         if len(filters[field]) == 1:
             filters[field] = list(filters[field]).pop()
 
-            return (
-                f"[{field}] = :{field}"
-                if filters[field] is not None
-                else f"[{field}] IS NULL"
-            )
+            return (field, "eq" if filters[field] is not None else "null", 0)
+
+        values = [value for value in filters[field] if value is not None]
+        null = len(values) != len(filters[field])
+
+        if not values and null:
+            return (field, "null", 0)
+
+        if json_list(values):
+            filters[f"{field}__json"] = json.dumps(values)
+
+            return (field, "json_null" if null else "json", 0)
+
+        for i, value in enumerate(in_params(values)):
+            filters[f"{field}__{i}"] = value
+
+        return (field, "in_null" if null else "in", in_bucket(len(values)))
+
+    @staticmethod
+    def where_sql(
+        shape: Sequence[WhereShape], columns: Optional[Mapping[str, str]] = None
+    ) -> str:
+        """
+        Creates the SQL for a WHERE clause from its shape.
+
+        `columns` maps fields to the SQL for their column, where it is not
+        just the field's name (such as a column of a joined table).
+        """
+
+        clauses = []
+
+        for field, match, size in shape:
+            column = columns[field] if columns and field in columns else f"[{field}]"
 
-        fields = []
-        i = 0
-        null = False
+            if match == "eq":
+                clauses.append(f"{column} = :{field}")
+                continue
+
+            if match == "null":
+                clauses.append(f"{column} IS NULL")
+                continue
 
-        for value in filters[field]:
-            if value is None:
-                null = True
+            if match in OPERATORS:
+                clauses.append(f"{column} {OPERATORS[match]} :{field}")
                 continue
 
-            subfield = field + "__" + str(i)
-            filters[subfield] = value
-            fields.append(":" + subfield)
-            i += 1
+            if match in ("json", "json_null"):
+                fields = f"SELECT [value] FROM json_each(:{field}__json)"
+            else:
+                fields = ", ".join(f":{field}__{i}" for i in range(size))
 
-        if not fields and null:
-            return f"[{field}] IS NULL"
+            null = f" OR {column} IS NULL" if match.endswith("_null") else ""
+            clauses.append(f"({column} IN ({fields}){null})")
 
-        return (
-            f"([{field}] IN ({', '.join(fields)})"
-            + (f" OR [{field}] IS NULL" if null else "")
-            + ")"
-        )
+        return " AND ".join(clauses)
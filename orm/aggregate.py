@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Grouped queries, which return counts and other aggregates rather than records.
+
+The rows of a Table or a JoinTable can be counted, or aggregated, grouped
+by one of their fields, with a single statement:
+
+    # {game_id: number of open boards}
+    Board.model(cursor).count_by("game", state="open")
+
+    # {game_id: BoardAggregateRow(boards=..., launched=..., last_created=...)}
+    Board.model(cursor).aggregate(
+        "game",
+        {
+            "boards": orm.Count(),
+            "launched": orm.Count("launch_time"),
+            "last_created": orm.Max("created"),
+        },
+        board_admin_id=3,
+    )
+
+Fields (including those of the aggregates) and filters can follow foreign
+keys with "__", which joins the other table into the same statement:
+
+    # {game_id: number of votes by users in the realm}
+    Vote.model(cursor).count_by("game", user__realm=realm)
+
+A foreign key on its own is its ID column, so results are keyed by ID, and
+no records are loaded. Filters are the same as for `search`. Aggregates can
+also have their own filters, which only match single values:
+
+    orm.Count(state="open")  # COUNT(*) FILTER (WHERE [state] IS 'open')
+"""
+
+from __future__ import annotations
+
+from typing import Any, Collection, Dict, List, Mapping, Optional, Tuple
+
+import dataclasses
+import sqlite3
+
+import orm  # pylint: disable=unused-import
+from .abc import (
+    BaseModel,
+    Filters,
+    ForeignerMap,
+    PrimitiveTypes,
+    StatementCache,
+    WhereShape,
+    execute,
+)
+from .exceptions import ORMException
+from .projection import row_type
+
+
+@dataclasses.dataclass(frozen=True)
+class Source:
+    """A table which can be queried, with its columns and foreign keys"""
+
+    table: str
+    columns: Collection[str]
+    foreigners: ForeignerMap
+
+
+def source(model: orm.table.TableModel[Any]) -> Source:
+    return Source(model.table, model.table_fields, model.foreigners)
+
+
+class Aggregate:
+    """
+    An aggregate function over the rows of each group.
+
+    `field` is the field to aggregate; only `Count` can do without one, and
+    counts every row. `distinct` only includes each value once, and `where`
+    only includes rows whose fields have the given values.
+    """
+
+    function = ""
+
+    field: Optional[str]
+    distinct: bool
+    where: Dict[str, PrimitiveTypes]
+
+    def __init__(
+        self, field: Optional[str] = None, distinct: bool = False, **where: PrimitiveTypes
+    ) -> None:
+        if field is None and (distinct or self.function != "COUNT"):
+            raise ORMException(f"{type(self).__name__} needs a field")
+
+        self.field = field
+        self.distinct = distinct
+        self.where = where
+
+    def shape(self) -> Tuple[Any, ...]:
+        return (self.function, self.field, self.distinct, tuple(self.where))
+
+    def params(self, name: str) -> Dict[str, PrimitiveTypes]:
+        return {f"orm_{name}__{i}": value for i, value in enumerate(self.where.values())}
+
+    def sql(self, query: Aggregation, name: str) -> str:
+        argument = query.column(self.field)[0] if self.field else "*"
+        distinct = "DISTINCT " if self.distinct else ""
+        sql = f"{self.function}({distinct}{argument})"
+
+        if not self.where:
+            return sql
+
+        clauses = [
+            f"{query.column(field)[0]} IS :orm_{name}__{i}"
+            for i, field in enumerate(self.where)
+        ]
+
+        return f"{sql} FILTER (WHERE {' AND '.join(clauses)})"
+
+
+class Count(Aggregate):
+    """The number of rows, or of non-NULL values of a field"""
+
+    function = "COUNT"
+
+
+class Sum(Aggregate):
+    """The sum of a field, or None if it has no values"""
+
+    function = "SUM"
+
+
+class Min(Aggregate):
+    """The lowest value of a field"""
+
+    function = "MIN"
+
+
+class Max(Aggregate):
+    """The highest value of a field"""
+
+    function = "MAX"
+
+
+class Avg(Aggregate):
+    """The mean of a field, as a float"""
+
+    function = "AVG"
+
+
+class Concat(Aggregate):
+    """The values of a field, joined with commas"""
+
+    function = "GROUP_CONCAT"
+
+
+class Aggregation:
+    """The tables of one grouped query, joined as its fields need them"""
+
+    joins: Dict[Tuple[str, ...], Tuple[str, Source]]
+    clauses: List[str]
+
+    def __init__(self, root: Source) -> None:
+        self.joins = {(): ("t0", root)}
+        self.clauses = [f"[{root.table}] AS [t0]"]
+
+    def column(self, path: str) -> Tuple[str, Optional[orm.table.TableModel[Any]]]:
+        """
+        The SQL for the column of a field, which may follow foreign keys.
+
+        If the field is itself a foreign key, the model it refers to is also
+        returned.
+        """
+
+        parts = tuple(path.split("__"))
+        alias, table = self.join(parts[:-1])
+        field = parts[-1]
+
+        if field in table.foreigners:
+            their_field, model = table.foreigners[field]
+            return f"[{alias}].[{their_field}]", model
+
+        if field in table.columns:
+            return f"[{alias}].[{field}]", None
+
+        raise ORMException(f"{table.table} has no field {field}")
+
+    def join(self, parts: Tuple[str, ...]) -> Tuple[str, Source]:
+        """The alias of the table reached by following some foreign keys"""
+
+        if parts in self.joins:
+            return self.joins[parts]
+
+        alias, table = self.join(parts[:-1])
+
+        if parts[-1] not in table.foreigners:
+            raise ORMException(f"{parts[-1]} is not a foreign key of {table.table}")
+
+        their_field, model = table.foreigners[parts[-1]]
+        joined = f"t{len(self.joins)}"
+
+        self.clauses.append(
+            f"LEFT JOIN [{model.table}] AS [{joined}] "
+            f"ON [{joined}].[{model.id_field}] = [{alias}].[{their_field}]"
+        )
+        self.joins[parts] = (joined, source(model))
+
+        return self.joins[parts]
+
+    def where(
+        self, filters: Filters
+    ) -> Tuple[Dict[str, Any], Tuple[WhereShape, ...], Dict[str, str]]:
+        """
+        The parameters and shape of the WHERE clause for some filters.
+
+        Also returns the SQL for the column of each filtered field, for `sql`.
+        """
+
+        values: Dict[str, Any] = {}
+        shapes: List[WhereShape] = []
+        columns: Dict[str, str] = {}
+
+        for path, value in filters.items():
+            columns[path], model = self.column(path)
+            values[path] = value if model is None else _foreign_ids(model, value)
+            shapes.append(BaseModel.where_shape(path, values))
+
+        return values, tuple(shapes), columns
+
+    def sql(
+        self,
+        by: str,
+        aggregates: Mapping[str, Aggregate],
+        shape: Tuple[WhereShape, ...],
+        columns: Mapping[str, str],
+    ) -> str:
+        group = self.column(by)[0]
+        selects = [group]
+        selects.extend(
+            f"{func.sql(self, name)} AS [{name}]" for name, func in aggregates.items()
+        )
+
+        sql = f"SELECT {', '.join(selects)} FROM {' '.join(self.clauses)}"
+
+        if shape:
+            sql += f" WHERE {BaseModel.where_sql(shape, columns)}"
+
+        return f"{sql} GROUP BY {group} ORDER BY {group}"
+
+
+def _foreign_ids(model: orm.table.TableModel[Any], value: Any) -> Any:
+    """The IDs of the records a foreign key filter matches"""
+
+    records = list(value) if isinstance(value, (set, tuple, list)) else [value]
+
+    if not all(isinstance(record, model.record) for record in records):
+        raise ORMException("Passed incorrect object to foreign key")
+
+    return set(BaseModel.map_foreign_objects(model.id_field, records))
+
+
+class Grouping:
+    """Binding between a table, the statement cache of its model, and a cursor"""
+
+    root: Source
+    statements: StatementCache
+    cursor: sqlite3.Cursor
+
+    def __init__(self, root: Source, statements: StatementCache, cursor: sqlite3.Cursor):
+        self.root = root
+        self.statements = statements
+        self.cursor = cursor
+
+    def count(self, field: str, filters: Filters) -> Dict[Any, int]:
+        """The number of rows matching the filters, for each value of a field"""
+
+        return dict(self._rows(field, {"count": Count()}, filters))
+
+    def aggregate(
+        self, by: str, aggregates: Mapping[str, Aggregate], filters: Filters
+    ) -> Dict[Any, Any]:
+        """Named tuples of the aggregates of the rows matching the filters, by value of `by`"""
+
+        if not aggregates:
+            raise ORMException("An aggregate query needs at least one aggregate")
+
+        row = row_type(f"{self.root.table}Aggregate", tuple(aggregates))
+
+        return {values[0]: row(*values[1:]) for values in self._rows(by, aggregates, filters)}
+
+    def _rows(
+        self, by: str, aggregates: Mapping[str, Aggregate], filters: Filters
+    ) -> List[Any]:
+        """Rows of each group's value of `by`, followed by the value of each aggregate"""
+
+        query = Aggregation(self.root)
+        values, shape, columns = query.where(filters)
+
+        for name, func in aggregates.items():
+            values.update(func.params(name))
+
+        functions = tuple((name, func.shape()) for name, func in aggregates.items())
+        sql = self.statements(
+            ("aggregate", by, functions, shape),
+            lambda: query.sql(by, aggregates, shape, columns),
+        )
+
+        execute(self.cursor, sql, values)
+
+        return self.cursor.fetchall()
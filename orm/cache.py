@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Process-wide read-through caches for rarely changing tables.
+
+A Table declared with the `cached` decorator keeps the records loaded by
+`get_many` (and so by everything built on it) in a bounded LRU, which is
+shared by every cursor in the process:
+
+    @orm.cached(size=512, ttl=600)
+    @dataclass
+    class Realm(orm.Table["Realm"]):
+        ...
+
+Before records are served from the cache, the change counters (see
+`orm.generations`) of the table and of the tables its records are built
+from are checked, so writes made by other processes or without the ORM
+are noticed. Writes made through the ORM also clear the cache directly.
+
+Cached records are shared between threads, so must not be modified except
+in order to store them.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Collection, Dict, Iterable, Optional, Set, Tuple, TypeVar
+
+import collections
+import dataclasses
+import sqlite3
+import threading
+import time
+import weakref
+
+from .exceptions import ORMException
+from .generation import generations
+
+
+Cached = TypeVar("Cached")
+Generation = Tuple[int, ...]
+
+_CACHE = "__orm_cache__"
+
+_CACHES: Dict[str, RecordCache] = {}
+
+# The tables each cursor has written to through the ORM. Those writes may
+# yet be rolled back, so the cursor must neither read from nor fill the
+# caches of those tables.
+_WRITES: weakref.WeakKeyDictionary[sqlite3.Cursor, Set[str]] = weakref.WeakKeyDictionary()
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheStats:
+    """Counters for one table's cache; hits and misses are counted per record"""
+
+    hits: int
+    misses: int
+    entries: int
+    size: int
+
+
+class RecordCache:
+    """A thread-safe LRU of the records of one table, by ID"""
+
+    size: int
+    ttl: Optional[float]
+    tables: Tuple[str, ...]
+
+    hits: int
+    misses: int
+
+    _entries: collections.OrderedDict[int, Tuple[float, Any]]
+    _generation: Optional[Generation]
+    _lock: threading.Lock
+
+    def __init__(self, size: int, ttl: Optional[float]) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.tables = ()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def watch(self, tables: Collection[str]) -> None:
+        """Sets the tables whose changes invalidate the cache"""
+
+        self.tables = tuple(sorted(tables))
+
+    def generation(self, cursor: sqlite3.Cursor) -> Optional[Generation]:
+        """
+        The change counters of the watched tables, as seen by the cursor.
+
+        This is None if the cache can not be used with this cursor, either
+        because it has written to one of the tables, or because one of the
+        tables is not tracked.
+        """
+
+        if _WRITES.get(cursor, set()).intersection(self.tables):
+            return None
+
+        counters = generations(cursor, *self.tables)
+
+        if len(counters) != len(self.tables):
+            return None
+
+        return tuple(counters[table] for table in self.tables)
+
+    def get_many(
+        self, generation: Generation, ids: Iterable[int]
+    ) -> Tuple[Dict[int, Any], Tuple[int, ...]]:
+        """
+        Looks up records in the cache.
+
+        Returns the records that were found, and the IDs which were not.
+        """
+
+        found: Dict[int, Any] = {}
+        missing: Tuple[int, ...] = ()
+        expired = time.monotonic() - self.ttl if self.ttl else None
+
+        with self._lock:
+            if not self._current(generation):
+                missing = tuple(ids)
+                self.misses += len(missing)
+                return found, missing
+
+            for _id in ids:
+                entry = self._entries.get(_id)
+
+                if entry is None or (expired is not None and entry[0] < expired):
+                    missing += (_id,)
+                    continue
+
+                self._entries.move_to_end(_id)
+                found[_id] = entry[1]
+
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        return found, missing
+
+    def update(self, generation: Generation, records: Dict[int, Any]) -> None:
+        """Adds records which were loaded at the given generation"""
+
+        now = time.monotonic()
+
+        with self._lock:
+            if not self._current(generation):
+                return
+
+            for _id, record in records.items():
+                self._entries[_id] = (now, record)
+                self._entries.move_to_end(_id)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self.hits, self.misses, len(self._entries), self.size)
+
+    def _current(self, generation: Generation) -> bool:
+        """
+        Whether the cache holds records for the given generation.
+
+        A newer generation replaces the cache's contents; an older one (from a
+        cursor whose transaction started before a write) uses the database.
+        Must be called with the lock held.
+        """
+
+        if self._generation is None or generation > self._generation:
+            self._entries.clear()
+            self._generation = generation
+
+        return generation == self._generation
+
+
+def cached(size: int = 1024, ttl: Optional[float] = None) -> Callable[[Cached], Cached]:
+    """
+    Keeps the records of a Table in a process-wide cache.
+
+    `size` is the maximum number of records which are kept, with the least
+    recently used being dropped first. `ttl`, if given, is the number of
+    seconds a record is kept for before it is loaded again.
+    """
+
+    if size < 1:
+        raise ORMException("A cache needs a size of at least one")
+
+    def _cached(cls: Cached) -> Cached:
+        cache = RecordCache(size, ttl)
+        setattr(cls, _CACHE, cache)
+        _CACHES[getattr(cls, "__name__")] = cache
+
+        return cls
+
+    return _cached
+
+
+def cache_for(record: Any) -> Optional[RecordCache]:
+    """The cache declared on a Table, if it has one"""
+
+    cache: Optional[RecordCache] = vars(record).get(_CACHE)
+
+    return cache
+
+
+def written(cursor: sqlite3.Cursor, table: str) -> None:
+    """Notes that a cursor has written to a table through the ORM"""
+
+    _WRITES.setdefault(cursor, set()).add(table)
+
+
+def cache_stats() -> Dict[str, CacheStats]:
+    """The counters for every cached table, by table name"""
+
+    return {table: cache.stats() for table, cache in _CACHES.items()}
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+# pylint: disable=too-few-public-methods
+
+"""
+Filters which compare a column with a value, rather than matching it.
+
+Anywhere a filter is accepted (`search`, `count`, `of_right`, `count_by`,
+and so on), a comparison can be given instead of a value or list:
+
+    # Boards which have been seen since the cutoff.
+    Board.model(cursor).search(last_seen=orm.AtLeast(cutoff))
+
+    # WHERE [seats_taken] > :seats_taken AND [state] IS NOT :state
+    Board.model(cursor).search(seats_taken=orm.Above(2), state=orm.Not("finished"))
+
+Comparisons follow SQLite's rules, so ordering comparisons never match NULL
+and can not be made with None; `Not(None)` is IS NOT NULL.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from .exceptions import ORMException
+
+
+class Comparison:
+    """A filter matching the values of a column which compare to `value`"""
+
+    # The type of match in the WHERE shape, and its SQL operator.
+    match = ""
+    operator = ""
+
+    value: Any
+
+    def __init__(self, value: Any) -> None:
+        if value is None and self.match != "not":
+            raise ORMException(f"{type(self).__name__} can not compare with None")
+
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.value!r})"
+
+
+class Below(Comparison):
+    """Values less than the given one"""
+
+    match = "lt"
+    operator = "<"
+
+
+class AtMost(Comparison):
+    """Values less than or equal to the given one"""
+
+    match = "le"
+    operator = "<="
+
+
+class Above(Comparison):
+    """Values greater than the given one"""
+
+    match = "gt"
+    operator = ">"
+
+
+class AtLeast(Comparison):
+    """Values greater than or equal to the given one"""
+
+    match = "ge"
+    operator = ">="
+
+
+class Not(Comparison):
+    """Values other than the given one, including NULL unless it is None"""
+
+    match = "not"
+    operator = "IS NOT"
+
+
+OPERATORS = {kind.match: kind.operator for kind in (Below, AtMost, Above, AtLeast, Not)}
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Connection handling for users of the ORM.
+
+ConnectionSettings is the one place connections are opened, so that every
+program using a database applies the same pragmas to it.
+
+SQLite connections can not safely be shared between threads that use them
+at the same time, so a ConnectionPool hands each unit of work its own
+connection and cursor, and returns the connection for re-use afterwards.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Mapping
+
+import contextlib
+import dataclasses
+import logging
+import os
+import sqlite3
+import threading
+
+
+_LOGGER = logging.getLogger("tiny-orm")
+
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+TEMP_STORES = ("DEFAULT", "FILE", "MEMORY")
+
+
+@dataclasses.dataclass
+class ConnectionSettings:
+    """
+    The database file, and the pragmas applied to every connection to it.
+
+    The defaults suit a web application with a few background writers:
+
+     - WAL lets readers continue while a writer holds a long transaction,
+       and synchronous=NORMAL is durable enough in WAL mode.
+     - busy_timeout (milliseconds) makes writers wait for each other,
+       rather than failing with "database is locked".
+     - mmap_size and cache_size (in KiB if negative, pages if positive)
+       keep the hot parts of the database in memory.
+     - foreign_keys is off, as `delete` (and the INSERT OR REPLACE used
+       for sub-table rows) does not first remove the rows which reference
+       the deleted ones.
+
+    Settings can be overridden from the environment with from_env().
+    """
+
+    path: str = "games.db"
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    busy_timeout: int = 5000
+    mmap_size: int = 64 * 1024 * 1024
+    cache_size: int = -16 * 1024
+    temp_store: str = "MEMORY"
+    foreign_keys: bool = False
+
+    def __post_init__(self) -> None:
+        self.journal_mode = self.journal_mode.upper()
+        self.synchronous = self.synchronous.upper()
+        self.temp_store = self.temp_store.upper()
+
+        # These are interpolated into the PRAGMA statements, so only allow
+        # the known keywords through.
+        if self.journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unknown journal_mode {self.journal_mode}")
+
+        if self.synchronous not in SYNCHRONOUS:
+            raise ValueError(f"Unknown synchronous setting {self.synchronous}")
+
+        if self.temp_store not in TEMP_STORES:
+            raise ValueError(f"Unknown temp_store {self.temp_store}")
+
+    @classmethod
+    def from_env(
+        cls, prefix: str, environ: Mapping[str, str] = os.environ, **defaults: Any
+    ) -> ConnectionSettings:
+        """
+        Loads the settings from environment variables.
+
+        The path is read from `{prefix}`, and each pragma from
+        `{prefix}_{PRAGMA}`, so with a prefix of "APP_DB" the journal mode is
+        set by APP_DB_JOURNAL_MODE. Anything not in the environment is taken
+        from `defaults`, and then from the class defaults.
+        """
+
+        values: Dict[str, Any] = dict(defaults)
+
+        for field in dataclasses.fields(cls):
+            name = prefix if field.name == "path" else f"{prefix}_{field.name.upper()}"
+
+            if name not in environ:
+                continue
+
+            value = environ[name]
+            kind = type(values.get(field.name, field.default))
+
+            if kind is bool:
+                values[field.name] = value.lower() in ("1", "true", "yes", "on")
+            else:
+                values[field.name] = kind(value)
+
+        return cls(**values)
+
+    def pragmas(self) -> Dict[str, str]:
+        return {
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "busy_timeout": str(int(self.busy_timeout)),
+            "mmap_size": str(int(self.mmap_size)),
+            "cache_size": str(int(self.cache_size)),
+            "temp_store": self.temp_store,
+            "foreign_keys": "ON" if self.foreign_keys else "OFF",
+        }
+
+    def connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """Opens a connection to the database, with the pragmas applied"""
+
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=check_same_thread,
+        )
+
+        for pragma, value in self.pragmas().items():
+            result = connection.execute(f"PRAGMA {pragma} = {value}").fetchone()
+
+            # Changing the journal mode reports the mode actually in use,
+            # which is not the one asked for if it can not be changed.
+            if pragma == "journal_mode" and result and str(result[0]).upper() != value:
+                _LOGGER.warning("%s: journal_mode is %s, not %s", self.path, result[0], value)
+
+        return connection
+
+    def __str__(self) -> str:
+        pragmas = ", ".join(f"{key}={value}" for key, value in self.pragmas().items())
+
+        return f"{self.path} ({pragmas})"
+
+
+class ConnectionPool:
+    """
+    A pool of SQLite connections to a single database.
+
+        pool = ConnectionPool(ConnectionSettings("games.db"))
+
+        with pool.transaction() as cursor:
+            User.model(cursor).search(name="Bob")
+
+    Each transaction() gets a connection which no other transaction is
+    using. The transaction is committed if the block completes, and rolled
+    back if it raises. Connections are created on demand, and at most
+    `max_idle` unused connections are kept open.
+    """
+
+    settings: ConnectionSettings
+    max_idle: int
+
+    _idle: List[sqlite3.Connection]
+    _lock: threading.Lock
+
+    def __init__(self, settings: ConnectionSettings, max_idle: int = 8) -> None:
+        self.settings = settings
+        self.max_idle = max_idle
+
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        # Connections are handed between threads by the pool, but are only
+        # ever used by one thread at a time.
+        return self.settings.connect(check_same_thread=False)
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+
+        return self.connect()
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        if connection.in_transaction:
+            connection.rollback()
+
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+
+        connection.close()
+
+    @contextlib.contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Cursor]:
+        """
+        Runs a block with a cursor on its own connection.
+
+        With `immediate`, the write lock is taken at the start of the
+        transaction, so that anything read in the block can not be changed
+        by another writer before the block's own writes are committed.
+        """
+
+        connection = self.acquire()
+        cursor = connection.cursor()
+
+        try:
+            if immediate:
+                cursor.execute("BEGIN IMMEDIATE")
+
+            yield cursor
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            self.release(connection)
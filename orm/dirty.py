@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Change tracking for records which were loaded or stored through the ORM.
+
+Each such record remembers the values of its columns and sub-tables as
+they are in the database. When it is stored again, only the columns which
+have changed since are written, with an UPDATE, and sub-tables which are
+unchanged are not read or written at all:
+
+    board = Board.model(cursor).get(1)
+    board.seats_taken += 1
+
+    # UPDATE [Board] SET [seats_taken] = :seats_taken WHERE [board_id] = :board_id
+    Board.model(cursor).store(board)
+
+    # Nothing has changed, so this does not query.
+    Board.model(cursor).store(board)
+
+Values are compared as they would be bound to a statement, so a datetime
+which was loaded back as text matches the same datetime assigned again.
+
+Records which were created directly, copied with `dataclasses.replace`, or
+whose ID has changed, are written in full. Records which were stored in a
+transaction that is then rolled back no longer match the database, so
+should be loaded again.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+import copy
+import dataclasses
+import sqlite3
+
+
+# The values a record was loaded or last stored with.
+ORIGINAL = "__orm_original__"
+
+
+@dataclasses.dataclass(frozen=True)
+class Snapshot:
+    """The column values and sub-table contents of a record in the database"""
+
+    row: Dict[str, Any]
+    subtables: Dict[str, Any]
+
+
+def adapt(value: Any) -> Any:
+    """A value as sqlite3 binds it, using the adapter registered for its type"""
+
+    adapter = sqlite3.adapters.get((type(value), sqlite3.PrepareProtocol))
+
+    return adapter(value) if adapter else value
+
+
+def remember(record: Any, row: Dict[str, Any], subtables: Dict[str, Any]) -> None:
+    """Notes the values which a record has in the database"""
+
+    snapshot = Snapshot(
+        {column: adapt(value) for column, value in row.items()},
+        {field: copy.copy(value) for field, value in subtables.items()},
+    )
+
+    setattr(record, ORIGINAL, snapshot)
+
+
+def original(record: Any) -> Optional[Snapshot]:
+    """The values a record had when it was loaded or last stored, if known"""
+
+    snapshot: Optional[Snapshot] = vars(record).get(ORIGINAL)
+
+    return snapshot
+
+
+def changed_columns(
+    record: Any, row: Dict[str, Any], id_field: str
+) -> Optional[Dict[str, Any]]:
+    """
+    The columns of a record's row which differ from those in the database.
+
+    This is None if the record is not known to be in the database, so must
+    be written in full.
+    """
+
+    snapshot = original(record)
+
+    if snapshot is None or row.get(id_field) is None:
+        return None
+
+    if snapshot.row.get(id_field) != row[id_field]:
+        return None
+
+    return {
+        column: value
+        for column, value in row.items()
+        if column not in snapshot.row or snapshot.row[column] != adapt(value)
+    }
+
+
+def changed_subtable(record: Any, field: str) -> bool:
+    """Whether a sub-table field may differ from the rows in the database"""
+
+    snapshot = original(record)
+
+    if snapshot is None or field not in snapshot.subtables:
+        return True
+
+    return bool(snapshot.subtables[field] != getattr(record, field))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Change counters for tables.
+
+Every table created through the ORM gets a row in the generation table,
+and triggers which increment it whenever a row of that table is inserted,
+updated, or deleted. As the triggers are part of the database, this also
+catches writes made by other processes and by code which does not use the
+ORM, which makes the counters suitable for invalidating caches.
+
+SQLite only has row triggers, so a statement which writes many rows would
+move the counter once for each of them. The ORM's multi-row writes are
+wrapped in `counted`, which pauses the table's triggers for the block and
+moves the counter itself. The pause is a column of the table's counter row,
+so it is written in the same transaction as the rows it covers, and is
+never seen by other connections.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterator, Optional
+
+import contextlib
+import sqlite3
+
+from .abc import execute
+
+
+GENERATION_TABLE = "orm_generation"
+
+
+def track(cursor: sqlite3.Cursor, table: str) -> None:
+    """Installs the change counter for a table, if it does not already exist"""
+
+    execute(
+        cursor,
+        f"CREATE TABLE IF NOT EXISTS [{GENERATION_TABLE}] ("
+        "[table_name] TEXT NOT NULL PRIMARY KEY, "
+        "[generation] INTEGER NOT NULL DEFAULT 0, "
+        "[paused] INTEGER NOT NULL DEFAULT 0"
+        ")",
+        tuple(),
+    )
+    _add_pause(cursor)
+    execute(
+        cursor,
+        f"INSERT OR IGNORE INTO [{GENERATION_TABLE}] ([table_name]) VALUES (?)",
+        (table,),
+    )
+
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        trigger = f"{table}__generation_{event.lower()}"
+
+        execute(
+            cursor,
+            "SELECT [sql] FROM [sqlite_master] WHERE [type] = 'trigger' AND [name] = ?",
+            (trigger,),
+        )
+        row = cursor.fetchone()
+
+        # Triggers from before `counted` bump the counter for every row.
+        if row and "[paused]" not in row[0]:
+            execute(cursor, f"DROP TRIGGER [{trigger}]", tuple())
+
+        execute(
+            cursor,
+            f"CREATE TRIGGER IF NOT EXISTS [{trigger}] "
+            f"AFTER {event} ON [{table}] "
+            f"WHEN (SELECT [paused] FROM [{GENERATION_TABLE}] "
+            f"WHERE [table_name] = '{table}') = 0 BEGIN "
+            f"UPDATE [{GENERATION_TABLE}] SET [generation] = [generation] + 1 "
+            f"WHERE [table_name] = '{table}'; "
+            "END",
+            tuple(),
+        )
+
+
+def _add_pause(cursor: sqlite3.Cursor) -> None:
+    """Adds the pause column to a generation table from before `counted`"""
+
+    execute(cursor, f"PRAGMA table_info([{GENERATION_TABLE}])", tuple())
+
+    if "paused" not in (column[1] for column in cursor.fetchall()):
+        execute(
+            cursor,
+            f"ALTER TABLE [{GENERATION_TABLE}] "
+            "ADD COLUMN [paused] INTEGER NOT NULL DEFAULT 0",
+            tuple(),
+        )
+
+
+@contextlib.contextmanager
+def counted(cursor: sqlite3.Cursor, table: str, rows: Optional[int] = None) -> Iterator[None]:
+    """
+    Counts the writes the block makes to a table as one change.
+
+    The counter is moved on the way in, so that records the cursor reads
+    inside the block are not cached against the old generation, and on the
+    way out, to cover anything else written while the triggers were paused.
+    Blocks can be nested.
+
+    `rows` is the number of rows the block writes, if it is known; for one
+    row (or none) the trigger is cheaper, and the block is not paused.
+    """
+
+    if rows is not None and rows < 2:
+        yield
+        return
+
+    sql = (
+        f"UPDATE [{GENERATION_TABLE}] "
+        "SET [generation] = [generation] + 1, [paused] = MAX([paused] + ?, 0) "
+        "WHERE [table_name] = ?"
+    )
+
+    try:
+        cursor.execute(sql, (1, table))
+    except sqlite3.OperationalError:
+        # The generation table has not been created (or migrated) yet, so
+        # the triggers are not paused either.
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        execute(cursor, sql, (-1, table))
+
+
+def generations(cursor: sqlite3.Cursor, *tables: str) -> Dict[str, int]:
+    """
+    Gets the current change counters for the given tables.
+
+    Tables which are not tracked are omitted from the result, so callers
+    should treat a missing entry as "unknown" rather than "unchanged".
+    """
+
+    sql = (
+        f"SELECT [table_name], [generation] FROM [{GENERATION_TABLE}] "
+        f"WHERE [table_name] IN ({', '.join(['?'] * len(tables))})"
+    )
+
+    try:
+        cursor.execute(sql, tables)
+    except sqlite3.OperationalError:
+        # The generation table has not been created yet.
+        return {}
+
+    return dict(cursor.fetchall())
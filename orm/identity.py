@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Identity maps for units of work.
+
+Inside an identity map, each record is loaded at most once per cursor:
+`get_many` (and so everything that loads foreign records through it)
+returns the instance which was already loaded for an ID, and only queries
+the database for the IDs it has not seen.
+
+    with orm.identity_map(cursor):
+        users = User.model(cursor).search(role="admin")
+        # Every user's Realm is now loaded, so this does not query.
+        realm = Realm.model(cursor).get(users[0].realm.realm_id)
+
+The records are shared, so a change to one is seen everywhere it is used.
+Changes made to the database by other cursors are not seen until the map
+is closed, so maps should be short lived, such as one per web request.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, Optional
+
+import contextlib
+import sqlite3
+import weakref
+
+
+_MAPS: weakref.WeakKeyDictionary[sqlite3.Cursor, IdentityMap] = weakref.WeakKeyDictionary()
+
+
+class IdentityMap:
+    """The records loaded through one cursor, by table and then ID"""
+
+    tables: Dict[str, Dict[int, Any]]
+
+    def __init__(self) -> None:
+        self.tables = {}
+
+    def records(self, table: str) -> Dict[int, Any]:
+        return self.tables.setdefault(table, {})
+
+
+@contextlib.contextmanager
+def identity_map(cursor: sqlite3.Cursor) -> Iterator[IdentityMap]:
+    """
+    Runs a block with an identity map bound to the cursor.
+
+    Nested blocks on the same cursor share the outer block's map.
+    """
+
+    if cursor in _MAPS:
+        yield _MAPS[cursor]
+        return
+
+    _MAPS[cursor] = IdentityMap()
+
+    try:
+        yield _MAPS[cursor]
+    finally:
+        del _MAPS[cursor]
+
+
+def records(cursor: sqlite3.Cursor, table: str) -> Optional[Dict[int, Any]]:
+    """The loaded records of a table, if the cursor has an identity map"""
+
+    identities = _MAPS.get(cursor)
+
+    return identities.records(table) if identities else None
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Secondary indexes for tables.
+
+Indexes are declared on the Table or JoinTable class with the `index`
+decorator, and are created alongside the table by `create_table`.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Collection, List, Optional, Sequence, Tuple, TypeVar
+
+import dataclasses
+import sqlite3
+
+from .abc import execute
+from .exceptions import ORMException
+
+
+Indexed = TypeVar("Indexed")
+
+_INDEXES = "__orm_indexes__"
+
+
+@dataclasses.dataclass(frozen=True)
+class Index:
+    """A declared index; see `index` for the meaning of the fields"""
+
+    fields: Tuple[str, ...]
+    include: Tuple[str, ...]
+    where: Optional[str]
+    name: Optional[str]
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        return self.fields + self.include
+
+    def index_name(self, table: str) -> str:
+        return self.name or f"{table}__{'__'.join(self.columns)}"
+
+    def create_sql(self, table: str) -> str:
+        sql = (
+            f"CREATE INDEX IF NOT EXISTS [{self.index_name(table)}] "
+            f"ON [{table}] ([{'], ['.join(self.columns)}])"
+        )
+
+        if self.where:
+            sql += f" WHERE {self.where}"
+
+        return sql
+
+
+def index(
+    *fields: str,
+    include: Sequence[str] = (),
+    where: Optional[str] = None,
+    name: Optional[str] = None,
+) -> Callable[[Indexed], Indexed]:
+    """
+    Adds a secondary index to a Table or JoinTable.
+
+        @orm.index("realm_id", "role")
+        @orm.index("game_id", where="[state] = 'open'", name="Board__open_games")
+        @orm.index("game_id", include=["user_id"])
+
+    `fields` are the column names to look rows up by. `include` columns are
+    appended to the index, so that queries which only need those columns can
+    be answered from the index alone (SQLite has no separate INCLUDE clause).
+    `where` makes a partial index, and is SQL which is used verbatim; partial
+    indexes with the same columns need a distinct `name`.
+
+    Indexes are created with IF NOT EXISTS, so changing the definition of an
+    existing index requires a new name.
+    """
+
+    if not fields:
+        raise ORMException("An index needs at least one field")
+
+    def _index(cls: Indexed) -> Indexed:
+        indexes: List[Index] = list(getattr(cls, _INDEXES, []))
+        indexes.append(Index(tuple(fields), tuple(include), where, name))
+        setattr(cls, _INDEXES, indexes)
+
+        return cls
+
+    return _index
+
+
+def create_indexes(
+    cursor: sqlite3.Cursor, record: Any, table: str, columns: Collection[str]
+) -> None:
+    """Creates the indexes declared on `record`, if they do not already exist"""
+
+    for _index in getattr(record, _INDEXES, []):
+        if not all(column in columns for column in _index.columns):
+            raise ORMException(f"{table} does not have all fields specified in index")
+
+        execute(cursor, _index.create_sql(table), tuple())
@@ -17,26 +17,38 @@ from __future__ import annotations
 from typing import (
     get_type_hints,
     Any,
+    Callable,
     Dict,
     Generic,
+    Iterable,
     List,
+    Mapping,
+    Set,
+    Tuple,
     Type,
     TypeVar,
 )
 
+import dataclasses
 import inspect
 import logging
 import sqlite3
 
-from .abc import execute
+from .abc import Filters, ForeignerMap, StatementCache, WhereShape, execute, executemany
+from .aggregate import Aggregate, Grouping, Source
 from .exceptions import ORMException
+from .generation import counted, track
+from .index import Index, create_indexes
+from .lazy import EAGER, Load
 from .table import TableModel, Table, _get_model
 
 
 Left = TypeVar("Left", bound=Table[Any])
 Right = TypeVar("Right", bound=Table[Any])
+JoinedTable = TypeVar("JoinedTable", bound="JoinTable[Any, Any]")
 
 _LOGGER = logging.getLogger("tiny-orm")
+_LAYOUT = "__orm_join_layout__"
 _MODELS: Dict[Type[JoinTable[Left, Right]], JoinModel[Left, Right]] = {}  # type: ignore
 
 
@@ -73,7 +85,46 @@ def _make_join(data_class: Type[JoinTable[Left, Right]]) -> JoinModel[Left, Righ
 
     table = data_class.__name__
 
-    return JoinModel(table, left_model, right_model)
+    return JoinModel(data_class, table, left_model, right_model)
+
+
+@dataclasses.dataclass(frozen=True)
+class JoinLayout:
+    """How a JoinTable is stored; see `join_layout`"""
+
+    without_rowid: bool = False
+    reverse_index: bool = False
+
+
+def join_layout(
+    without_rowid: bool = True, reverse_index: bool = True
+) -> Callable[[Type[JoinedTable]], Type[JoinedTable]]:
+    """
+    Sets the physical layout of a JoinTable.
+
+    By default a JoinTable is a rowid table, with its (left, right) primary
+    key as a separate index, which lookups by the right hand side can not use.
+
+    `without_rowid` stores the rows in the primary key itself, which halves
+    the storage and makes lookups by left a single b-tree search.
+
+    `reverse_index` adds a (right, left) index, which makes lookups by right
+    just as cheap; as it contains both columns, it covers every query the
+    JoinModel makes.
+
+    Tables which already exist are not changed by create_table; use
+    `JoinTable.migrate` to rebuild them.
+    """
+
+    def _join_layout(cls: Type[JoinedTable]) -> Type[JoinedTable]:
+        if not issubclass(cls, JoinTable):
+            raise ORMException(f"{cls.__name__} is not a sub class of JoinTable")
+
+        setattr(cls, _LAYOUT, JoinLayout(without_rowid, reverse_index))
+
+        return cls
+
+    return _join_layout
 
 
 class JoinTable(Generic[Left, Right]):
@@ -112,6 +163,26 @@ class JoinTable(Generic[Left, Right]):
 
         _get_join(cls).create_table(cursor)
 
+    @classmethod
+    def migrate(cls, cursor: sqlite3.Cursor) -> bool:
+        """
+        Creates this table, or brings an existing table up to date with its
+        `join_layout`.
+
+        A table with the wrong layout is rebuilt by copying its rows into a
+        new table, which takes a write lock on the database for the duration.
+
+        Returns whether the table had to be rebuilt.
+        """
+
+        return _get_join(cls).migrate(cursor)
+
+
+def _aliased(alias: str, shape: Tuple[WhereShape, ...]) -> Dict[str, str]:
+    """The columns of the filtered fields, in the table with the given alias"""
+
+    return {field: f"[{alias}].[{field}]" for field, _, _ in shape}
+
 
 class JoinModel(Generic[Left, Right]):
     """
@@ -120,15 +191,38 @@ class JoinModel(Generic[Left, Right]):
 
     cursor: sqlite3.Cursor
 
+    record: Type[JoinTable[Left, Right]]
+    statements: StatementCache
     table: str
     left: TableModel[Left]
     right: TableModel[Right]
-
-    def __init__(self, table: str, left: TableModel[Left], right: TableModel[Right]):
+    foreigners: ForeignerMap
+
+    def __init__(
+        self,
+        record: Type[JoinTable[Left, Right]],
+        table: str,
+        left: TableModel[Left],
+        right: TableModel[Right],
+    ):
+        self.record = record
+        self.statements = StatementCache()
         self.table = table
         self.left = left
         self.right = right
 
+        left_field, right_field = get_type_hints(record)
+        self.foreigners = {
+            left_field: (left.id_field, left),
+            right_field: (right.id_field, right),
+        }
+
+    @property
+    def layout(self) -> JoinLayout:
+        layout: JoinLayout = getattr(self.record, _LAYOUT, JoinLayout())
+
+        return layout
+
     def create_table(self, cursor: sqlite3.Cursor) -> None:
         """
         Creates the table in the SQLLite
@@ -137,8 +231,14 @@ class JoinModel(Generic[Left, Right]):
         self.left.create_table(cursor)
         self.right.create_table(cursor)
 
+        execute(cursor, self._create_table_sql(self.table), tuple())
+        self._create_extras(cursor)
+
+    def _create_table_sql(self, table: str) -> str:
+        """CREATE TABLE Statement for this table, under the given name"""
+
         sql = f"""
-            CREATE TABLE IF NOT EXISTS [{self.table}] (
+            CREATE TABLE IF NOT EXISTS [{table}] (
               [{self.left.id_field}] INTEGER NOT NULL,
               [{self.right.id_field}] INTEGER NOT NULL,
               PRIMARY KEY ([{self.left.id_field}], [{self.right.id_field}]),
@@ -149,7 +249,70 @@ class JoinModel(Generic[Left, Right]):
             )
         """
 
-        execute(cursor, sql, tuple())
+        if self.layout.without_rowid:
+            sql += " WITHOUT ROWID"
+
+        return sql
+
+    def _create_extras(self, cursor: sqlite3.Cursor) -> None:
+        """Creates the triggers and indexes which go with the table"""
+
+        columns = (self.left.id_field, self.right.id_field)
+
+        track(cursor, self.table)
+        create_indexes(cursor, self.record, self.table, columns)
+
+        if self.layout.reverse_index:
+            reverse = Index((self.right.id_field, self.left.id_field), tuple(), None, None)
+            execute(cursor, reverse.create_sql(self.table), tuple())
+
+    def migrate(self, cursor: sqlite3.Cursor) -> bool:
+        """
+        Creates the table, rebuilding it first if it has the wrong layout.
+
+        Returns whether the table was rebuilt.
+        """
+
+        execute(
+            cursor,
+            "SELECT [sql] FROM [sqlite_master] WHERE [type] = 'table' AND [name] = ?",
+            (self.table,),
+        )
+        row = cursor.fetchone()
+
+        if not row or ("WITHOUT ROWID" in row[0].upper()) == self.layout.without_rowid:
+            self.create_table(cursor)
+            return False
+
+        _LOGGER.warning("Rebuilding %s for its new layout", self.table)
+
+        self.left.create_table(cursor)
+        self.right.create_table(cursor)
+
+        columns = f"[{self.left.id_field}], [{self.right.id_field}]"
+        rebuild = f"{self.table}__rebuild"
+
+        # Dropping the old table also drops its triggers and indexes, which
+        # are then re-created against the new table.
+        execute(cursor, "SAVEPOINT [orm_migrate]", tuple())
+
+        try:
+            execute(cursor, self._create_table_sql(rebuild), tuple())
+            execute(
+                cursor,
+                f"INSERT INTO [{rebuild}] ({columns}) SELECT {columns} FROM [{self.table}]",
+                tuple(),
+            )
+            execute(cursor, f"DROP TABLE [{self.table}]", tuple())
+            execute(cursor, f"ALTER TABLE [{rebuild}] RENAME TO [{self.table}]", tuple())
+            self._create_extras(cursor)
+        except sqlite3.Error:
+            execute(cursor, "ROLLBACK TO [orm_migrate]", tuple())
+            raise
+        finally:
+            execute(cursor, "RELEASE [orm_migrate]", tuple())
+
+        return True
 
     def ids_for_left(self, cursor: sqlite3.Cursor, left: Left) -> List[int]:
         """
@@ -160,24 +323,44 @@ class JoinModel(Generic[Left, Right]):
         foreign key lookups.
         """
 
-        sql = f"SELECT [{self.right.id_field}] FROM [{self.table}] WHERE [{self.left.id_field}] = ?"
+        sql = self.statements(
+            "ids_for_left",
+            lambda: (
+                f"SELECT [{self.right.id_field}] FROM [{self.table}] "
+                f"WHERE [{self.left.id_field}] = ?"
+            ),
+        )
 
         execute(cursor, sql, (getattr(left, self.left.id_field),))
 
         return [x[0] for x in cursor.fetchall()]
 
-    def of_left(self, cursor: sqlite3.Cursor, left: Left) -> List[Right]:
-        """Returns all Right records which map to a given Left"""
+    def of_left(
+        self, cursor: sqlite3.Cursor, left: Left, load: Load = EAGER, /, **kwargs: Any
+    ) -> List[Right]:
+        """
+        Returns all Right records which map to a given Left, and match the
+        given filters.
 
-        ids = self.ids_for_left(cursor, left)
+        The filters are the same as for `search` on the Right table, and are
+        applied in the same query as the join, so only matching Right records
+        are loaded.
+        """
 
-        return list(self.right.get_many(cursor, *ids).values())
+        if kwargs:
+            ids = self._ids_of(cursor, "of_left", (self.left, left), self.right, kwargs)
+        else:
+            ids = self.ids_for_left(cursor, left)
 
-    def from_left(self, cursor: sqlite3.Cursor, **kwargs: Any) -> List[Right]:
+        return list(self.right.get_many(cursor, *ids, load=load).values())
+
+    def from_left(
+        self, cursor: sqlite3.Cursor, load: Load = EAGER, /, **kwargs: Any
+    ) -> List[Right]:
         """
         Returns all unique Right records which map to Left records that match
         the given search criteria. No information about which Left they
-        matched is maintained.
+        matched is maintained. The criteria are the same as for `search`.
 
         This will have the same result as:
 
@@ -193,31 +376,78 @@ class JoinModel(Generic[Left, Right]):
         but this function will be considerably more efficient.
         """
 
-        for key in kwargs:
-            if key not in self.left.table_fields:
-                raise AttributeError(f"{self.left.record.__name__} has no attribute {key}")
+        ids = self._ids_from(cursor, "from_left", self.left, self.right, kwargs)
+
+        return list(self.right.get_many(cursor, *ids, load=load).values())
 
-        def field(_field: str) -> str:
-            return f"[{_field}] = :{_field}"
+    def clear_left(self, cursor: sqlite3.Cursor, left: Left) -> None:
+        """Deletes all records in the join table that feature the given Left record"""
 
-        sql = (
-            f"SELECT DISTINCT [{self.right.id_field}] "
-            f"FROM [{self.left.table}] JOIN [{self.table}] USING ([{self.left.id_field}]) "
-            f"WHERE {' AND '.join(map(field, kwargs))}"
+        sql = self.statements(
+            "clear_left",
+            lambda: f"DELETE FROM [{self.table}] WHERE [{self.left.id_field}] = ?",
         )
 
-        execute(cursor, sql, kwargs)
+        with counted(cursor, self.table):
+            execute(cursor, sql, (getattr(left, self.left.id_field),))
 
-        ids = [x[0] for x in cursor.fetchall()]
+    def set_left(
+        self, cursor: sqlite3.Cursor, left: Left, right_ids: Iterable[int]
+    ) -> Tuple[Set[int], Set[int]]:
+        """
+        Sets the Right records which map to the given Left to be exactly
+        the supplied IDs.
 
-        return list(self.right.get_many(cursor, *ids).values())
+        Only the difference from the current mapping is written, in at most
+        one DELETE and one INSERT statement. The IDs are not validated.
 
-    def clear_left(self, cursor: sqlite3.Cursor, left: Left) -> None:
-        """Deletes all records in the join table that feature the given Left record"""
+        Returns the sets of added and removed Right IDs.
+        """
 
-        sql = f"DELETE FROM [{self.table}] WHERE [{self.left.id_field}] = ?"
+        current = set(self.ids_for_left(cursor, left))
+        desired = set(right_ids)
 
-        execute(cursor, sql, (getattr(left, self.left.id_field),))
+        return self._write_left(cursor, left, desired - current, current - desired)
+
+    def update_left(
+        self,
+        cursor: sqlite3.Cursor,
+        left: Left,
+        add: Iterable[int],
+        remove: Iterable[int],
+    ) -> Tuple[Set[int], Set[int]]:
+        """
+        Adds and removes mappings from the given Left to the supplied Right IDs.
+
+        IDs which are in both lists are removed. The IDs are not validated.
+
+        Returns the sets of Right IDs which were actually added and removed.
+        """
+
+        current = set(self.ids_for_left(cursor, left))
+        removing = set(remove)
+
+        return self._write_left(
+            cursor, left, set(add) - removing - current, removing & current
+        )
+
+    def _write_left(
+        self, cursor: sqlite3.Cursor, left: Left, added: Set[int], removed: Set[int]
+    ) -> Tuple[Set[int], Set[int]]:
+        left_id = getattr(left, self.left.id_field)
+
+        with counted(cursor, self.table, len(removed) + len(added)):
+            if removed:
+                executemany(
+                    cursor, self._delete_sql(), [(left_id, right_id) for right_id in removed]
+                )
+
+            if added:
+                executemany(
+                    cursor, self._insert_sql(), [(left_id, right_id) for right_id in added]
+                )
+
+        return added, removed
 
     def ids_for_right(self, cursor: sqlite3.Cursor, right: Right) -> List[int]:
         """
@@ -227,24 +457,44 @@ class JoinModel(Generic[Left, Right]):
         the "of_right" function, but saves the overhead of doing any extra
         foreign key lookups.
         """
-        sql = f"SELECT [{self.left.id_field}] FROM [{self.table}] WHERE [{self.right.id_field}] = ?"
+        sql = self.statements(
+            "ids_for_right",
+            lambda: (
+                f"SELECT [{self.left.id_field}] FROM [{self.table}] "
+                f"WHERE [{self.right.id_field}] = ?"
+            ),
+        )
 
         execute(cursor, sql, (getattr(right, self.right.id_field),))
 
         return [x[0] for x in cursor.fetchall()]
 
-    def of_right(self, cursor: sqlite3.Cursor, right: Right) -> List[Left]:
-        """Returns all Left records which map to a given Right"""
+    def of_right(
+        self, cursor: sqlite3.Cursor, right: Right, load: Load = EAGER, /, **kwargs: Any
+    ) -> List[Left]:
+        """
+        Returns all Left records which map to a given Right, and match the
+        given filters.
 
-        ids = self.ids_for_right(cursor, right)
+        The filters are the same as for `search` on the Left table, and are
+        applied in the same query as the join, so only matching Left records
+        are loaded.
+        """
 
-        return list(self.left.get_many(cursor, *ids).values())
+        if kwargs:
+            ids = self._ids_of(cursor, "of_right", (self.right, right), self.left, kwargs)
+        else:
+            ids = self.ids_for_right(cursor, right)
 
-    def from_right(self, cursor: sqlite3.Cursor, **kwargs: Any) -> List[Left]:
+        return list(self.left.get_many(cursor, *ids, load=load).values())
+
+    def from_right(
+        self, cursor: sqlite3.Cursor, load: Load = EAGER, /, **kwargs: Any
+    ) -> List[Left]:
         """
         Returns all unique Left records which map to Right records that match
         the given search criteria. No information about which Right they
-        matched is maintained.
+        matched is maintained. The criteria are the same as for `search`.
 
         This will have the same result as:
 
@@ -260,31 +510,119 @@ class JoinModel(Generic[Left, Right]):
         but this function will be considerably more efficient.
         """
 
-        for key in kwargs:
-            if key not in self.right.table_fields:
-                raise AttributeError(f"{self.right.record.__name__} has no attribute {key}")
+        ids = self._ids_from(cursor, "from_right", self.right, self.left, kwargs)
+
+        return list(self.left.get_many(cursor, *ids, load=load).values())
+
+    def _ids_of(
+        self,
+        cursor: sqlite3.Cursor,
+        name: str,
+        mapped: Tuple[TableModel[Any], Any],
+        target: TableModel[Any],
+        filters: Filters,
+    ) -> List[int]:
+        """The IDs of the target records which map to a record, and match the filters"""
+
+        model, record = mapped
+        shape, values = self._filter(target, filters)
+        values["orm_id"] = getattr(record, model.id_field)
+
+        sql = self.statements(
+            (name, shape),
+            lambda: (
+                f"SELECT [j].[{target.id_field}] FROM [{self.table}] AS [j] "
+                f"JOIN [{target.table}] AS [t] "
+                f"ON [t].[{target.id_field}] = [j].[{target.id_field}] "
+                f"WHERE [j].[{model.id_field}] = :orm_id "
+                f"AND {target.where_sql(shape, _aliased('t', shape))}"
+            ),
+        )
+
+        execute(cursor, sql, values)
 
-        def field(_field: str) -> str:
-            return f"[{_field}] = :{_field}"
+        return [x[0] for x in cursor.fetchall()]
 
-        sql = (
-            f"SELECT DISTINCT [{self.left.id_field}] "
-            f"FROM [{self.right.table}] JOIN [{self.table}] USING ([{self.right.id_field}]) "
-            f"WHERE {' AND '.join(map(field, kwargs))}"
+    def _ids_from(
+        self,
+        cursor: sqlite3.Cursor,
+        name: str,
+        source: TableModel[Any],
+        target: TableModel[Any],
+        filters: Filters,
+    ) -> List[int]:
+        """The IDs of the target records mapped to by any source record matching the filters"""
+
+        shape, values = self._filter(source, filters)
+
+        sql = self.statements(
+            (name, shape),
+            lambda: (
+                f"SELECT DISTINCT [j].[{target.id_field}] FROM [{source.table}] AS [s] "
+                f"JOIN [{self.table}] AS [j] "
+                f"ON [j].[{source.id_field}] = [s].[{source.id_field}]"
+                + (f" WHERE {source.where_sql(shape, _aliased('s', shape))}" if shape else "")
+            ),
         )
 
-        execute(cursor, sql, kwargs)
+        execute(cursor, sql, values)
+
+        return [x[0] for x in cursor.fetchall()]
 
-        ids = [x[0] for x in cursor.fetchall()]
+    @staticmethod
+    def _filter(
+        model: TableModel[Any], filters: Filters
+    ) -> Tuple[Tuple[WhereShape, ...], Dict[str, Any]]:
+        for key in filters:
+            if key not in model.table_fields and key not in model.foreigners:
+                raise AttributeError(f"{model.record.__name__} has no attribute {key}")
 
-        return list(self.left.get_many(cursor, *ids).values())
+        return model.where_values(model.foreigners, filters)
 
     def clear_right(self, cursor: sqlite3.Cursor, right: Right) -> None:
         """Deletes all records in the join table that feature the given Right record"""
 
-        sql = f"DELETE FROM [{self.table}] WHERE [{self.right.id_field}] = ?"
+        sql = self.statements(
+            "clear_right",
+            lambda: f"DELETE FROM [{self.table}] WHERE [{self.right.id_field}] = ?",
+        )
 
-        execute(cursor, sql, (getattr(right, self.right.id_field),))
+        with counted(cursor, self.table):
+            execute(cursor, sql, (getattr(right, self.right.id_field),))
+
+    def count_by(
+        self, cursor: sqlite3.Cursor, field: str, /, **kwargs: Any
+    ) -> Dict[Any, int]:
+        """
+        Counts the mappings which match the given filters, for each value of a field.
+
+        The fields are those of the JoinTable (or their ID columns), and can
+        follow foreign keys, such as "user__realm"; see `orm.aggregate`.
+        """
+
+        return self._grouping(cursor).count(field, kwargs)
+
+    def aggregate(
+        self,
+        cursor: sqlite3.Cursor,
+        by: str,
+        aggregates: Mapping[str, Aggregate],
+        /,
+        **kwargs: Any,
+    ) -> Dict[Any, Any]:
+        """
+        Aggregates the mappings which match the given filters, for each value of `by`.
+
+        Returns a named tuple of the aggregates for each value, in one query;
+        see `orm.aggregate`.
+        """
+
+        return self._grouping(cursor).aggregate(by, aggregates, kwargs)
+
+    def _grouping(self, cursor: sqlite3.Cursor) -> Grouping:
+        columns = (self.left.id_field, self.right.id_field)
+
+        return Grouping(Source(self.table, columns, self.foreigners), self.statements, cursor)
 
     def store(self, cursor: sqlite3.Cursor, left: Left, right: Right) -> bool:
         """
@@ -302,16 +640,42 @@ class JoinModel(Generic[Left, Right]):
         left_id = getattr(left, self.left.id_field)
         right_id = getattr(right, self.right.id_field)
 
-        sql = (
-            f"INSERT OR IGNORE INTO [{self.table}] "
-            f"([{self.left.id_field}], [{self.right.id_field}]) "
-            f"VALUES (?, ?)"
-        )
-
-        execute(cursor, sql, (left_id, right_id))
+        execute(cursor, self._insert_sql(), (left_id, right_id))
 
         return True
 
+    def store_pairs(self, cursor: sqlite3.Cursor, pairs: Iterable[Tuple[Left, Right]]) -> int:
+        """
+        Adds mappings between each of the supplied Left and Right pairs,
+        in one executemany.
+
+        No action is taken for mappings which already exist. Returns the number
+        of mappings which were added.
+        """
+
+        rows: List[Tuple[int, int]] = []
+
+        for left, right in pairs:
+            if not isinstance(left, self.left.record):
+                raise ORMException("Wrong type")
+
+            if not isinstance(right, self.right.record):
+                raise ORMException("Wrong type")
+
+            rows.append(
+                (getattr(left, self.left.id_field), getattr(right, self.right.id_field))
+            )
+
+        if not rows:
+            return 0
+
+        with counted(cursor, self.table, len(rows)):
+            executemany(cursor, self._insert_sql(), rows)
+
+            added = int(cursor.rowcount)
+
+        return added
+
     def remove(self, cursor: sqlite3.Cursor, left: Left, right: Right) -> bool:
         """
         Removes a mapping between the supplied Left and Right.
@@ -328,15 +692,29 @@ class JoinModel(Generic[Left, Right]):
         left_id = getattr(left, self.left.id_field)
         right_id = getattr(right, self.right.id_field)
 
-        sql = (
-            f"DELETE FROM [{self.table}] "
-            f"WHERE [{self.left.id_field}] = ? AND [{self.right.id_field}] = ?"
-        )
-
-        execute(cursor, sql, (left_id, right_id))
+        execute(cursor, self._delete_sql(), (left_id, right_id))
 
         return True
 
+    def _insert_sql(self) -> str:
+        return self.statements(
+            "insert",
+            lambda: (
+                f"INSERT OR IGNORE INTO [{self.table}] "
+                f"([{self.left.id_field}], [{self.right.id_field}]) "
+                f"VALUES (?, ?)"
+            ),
+        )
+
+    def _delete_sql(self) -> str:
+        return self.statements(
+            "delete",
+            lambda: (
+                f"DELETE FROM [{self.table}] "
+                f"WHERE [{self.left.id_field}] = ? AND [{self.right.id_field}] = ?"
+            ),
+        )
+
 
 class JoinWrapper(Generic[Left, Right]):
     """
@@ -349,10 +727,34 @@ class JoinWrapper(Generic[Left, Right]):
 
     model: JoinModel[Left, Right]
     cursor: sqlite3.Cursor
+    load: Load
 
-    def __init__(self, model: JoinModel[Left, Right], cursor: sqlite3.Cursor):
+    def __init__(
+        self, model: JoinModel[Left, Right], cursor: sqlite3.Cursor, load: Load = EAGER
+    ):
         self.model = model
         self.cursor = cursor
+        self.load = load
+
+    def lazy(self, *fields: str) -> JoinWrapper[Left, Right]:
+        """
+        A wrapper which loads the given foreign key fields of the records it
+        returns only when used. See `orm.lazy` for the details.
+        """
+
+        load = dataclasses.replace(self.load, lazy=self.load.lazy.union(fields))
+
+        return JoinWrapper(self.model, self.cursor, load)
+
+    def skip(self, *fields: str) -> JoinWrapper[Left, Right]:
+        """
+        A wrapper which does not load the given sub-table fields of the records
+        it returns. See `orm.lazy` for the details.
+        """
+
+        load = dataclasses.replace(self.load, skip=self.load.skip.union(fields))
+
+        return JoinWrapper(self.model, self.cursor, load)
 
     def ids_for_left(self, left: Left) -> List[int]:
         """
@@ -365,16 +767,23 @@ class JoinWrapper(Generic[Left, Right]):
 
         return self.model.ids_for_left(self.cursor, left)
 
-    def of_left(self, left: Left) -> List[Right]:
-        """Returns all Right records which map to a given Left"""
+    def of_left(self, left: Left, /, **kwargs: Any) -> List[Right]:
+        """
+        Returns all Right records which map to a given Left, and match the
+        given filters.
 
-        return self.model.of_left(self.cursor, left)
+        The filters are the same as for `search` on the Right table, and are
+        applied in the same query as the join, so only matching Right records
+        are loaded.
+        """
+
+        return self.model.of_left(self.cursor, left, self.load, **kwargs)
 
     def from_left(self, **kwargs: Any) -> List[Right]:
         """
         Returns all unique Right records which map to Left records that match
         the given search criteria. No information about which Left they
-        matched is maintained.
+        matched is maintained. The criteria are the same as for `search`.
 
         This will have the same result as:
 
@@ -390,13 +799,39 @@ class JoinWrapper(Generic[Left, Right]):
         but this function will be considerably more efficient.
         """
 
-        return self.model.from_left(self.cursor, **kwargs)
+        return self.model.from_left(self.cursor, self.load, **kwargs)
 
     def clear_left(self, left: Left) -> None:
         """Deletes all records in the join table that feature the given Left record"""
 
         return self.model.clear_left(self.cursor, left)
 
+    def set_left(self, left: Left, right_ids: Iterable[int]) -> Tuple[Set[int], Set[int]]:
+        """
+        Sets the Right records which map to the given Left to be exactly
+        the supplied IDs.
+
+        Only the difference from the current mapping is written, in at most
+        one DELETE and one INSERT statement. The IDs are not validated.
+
+        Returns the sets of added and removed Right IDs.
+        """
+
+        return self.model.set_left(self.cursor, left, right_ids)
+
+    def update_left(
+        self, left: Left, add: Iterable[int], remove: Iterable[int]
+    ) -> Tuple[Set[int], Set[int]]:
+        """
+        Adds and removes mappings from the given Left to the supplied Right IDs.
+
+        IDs which are in both lists are removed. The IDs are not validated.
+
+        Returns the sets of Right IDs which were actually added and removed.
+        """
+
+        return self.model.update_left(self.cursor, left, add, remove)
+
     def ids_for_right(self, right: Right) -> List[int]:
         """
         Returns all left_ids present for a given Right record
@@ -408,16 +843,26 @@ class JoinWrapper(Generic[Left, Right]):
 
         return self.model.ids_for_right(self.cursor, right)
 
-    def of_right(self, right: Right) -> List[Left]:
-        """Returns all Left records which map to a given Right"""
+    def of_right(self, right: Right, /, **kwargs: Any) -> List[Left]:
+        """
+        Returns all Left records which map to a given Right, and match the
+        given filters.
+
+        The filters are the same as for `search` on the Left table, and are
+        applied in the same query as the join, so only matching Left records
+        are loaded.
+
+            # The open boards in a realm
+            BoardRealm.model(cursor).of_right(realm, state="open")
+        """
 
-        return self.model.of_right(self.cursor, right)
+        return self.model.of_right(self.cursor, right, self.load, **kwargs)
 
     def from_right(self, **kwargs: Any) -> List[Left]:
         """
         Returns all unique Left records which map to Right records that match
         the given search criteria. No information about which Right they
-        matched is maintained.
+        matched is maintained. The criteria are the same as for `search`.
 
         This will have the same result as:
 
@@ -433,13 +878,35 @@ class JoinWrapper(Generic[Left, Right]):
         but this function will be considerably more efficient.
         """
 
-        return self.model.from_right(self.cursor, **kwargs)
+        return self.model.from_right(self.cursor, self.load, **kwargs)
 
     def clear_right(self, right: Right) -> None:
         """Deletes all records in the join table that feature the given Right record"""
 
         return self.model.clear_right(self.cursor, right)
 
+    def count_by(self, field: str, /, **kwargs: Any) -> Dict[Any, int]:
+        """
+        Counts the mappings which match the given filters, for each value of a field.
+
+        The fields are those of the JoinTable (or their ID columns), and can
+        follow foreign keys, such as "user__realm"; see `orm.aggregate`.
+        """
+
+        return self.model.count_by(self.cursor, field, **kwargs)
+
+    def aggregate(
+        self, by: str, aggregates: Mapping[str, Aggregate], /, **kwargs: Any
+    ) -> Dict[Any, Any]:
+        """
+        Aggregates the mappings which match the given filters, for each value of `by`.
+
+        Returns a named tuple of the aggregates for each value, in one query;
+        see `orm.aggregate`.
+        """
+
+        return self.model.aggregate(self.cursor, by, aggregates, **kwargs)
+
     def store(self, left: Left, right: Right) -> bool:
         """
         Adds a mapping between the supplied Left and Right
@@ -449,6 +916,17 @@ class JoinWrapper(Generic[Left, Right]):
 
         return self.model.store(self.cursor, left, right)
 
+    def store_pairs(self, pairs: Iterable[Tuple[Left, Right]]) -> int:
+        """
+        Adds mappings between each of the supplied Left and Right pairs,
+        in one executemany.
+
+        No action is taken for mappings which already exist. Returns the number
+        of mappings which were added.
+        """
+
+        return self.model.store_pairs(self.cursor, pairs)
+
     def remove(self, left: Left, right: Right) -> bool:
         """
         Removes a mapping between the supplied Left and Right.
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Control over which related records are loaded with a record.
+
+By default, loading a record also loads every record it has a foreign key
+to, and the contents of its sub-tables. Either can be avoided for a query
+through the model wrappers:
+
+    # Boards whose Game and creator are only loaded if they are used.
+    boards = Board.model(cursor).lazy("game", "creator").all()
+
+    # Games without their options.
+    games = Game.model(cursor).skip("options").all()
+
+A lazy field holds a `Lazy` stand-in, which loads the real record the first
+time one of its fields (other than the ID) is used. All the stand-ins from
+the same query which are still in use are loaded together, so the number of
+queries does not grow with the number of records. The stand-ins use the
+cursor of the original query, so must be used before it is closed. As they
+are not dataclasses, `resolve` should be used before `dataclasses.asdict`.
+
+A skipped sub-table is left at the field's default value, and `store` will
+leave the sub-table's rows as they are for records loaded this way.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Collection, Dict, FrozenSet, Iterable, Optional
+
+import dataclasses
+import sqlite3
+import weakref
+
+import orm  # pylint: disable=unused-import
+from .exceptions import ORMException
+
+
+# The sub-tables which were skipped when a record was loaded.
+PARTIAL = "__orm_partial__"
+
+
+@dataclasses.dataclass(frozen=True)
+class Load:
+    """Which fields of the records in a query are lazy, or skipped"""
+
+    lazy: FrozenSet[str] = frozenset()
+    skip: FrozenSet[str] = frozenset()
+
+    @property
+    def eager(self) -> bool:
+        return not self.lazy and not self.skip
+
+    def check(self, foreigners: Collection[str], submodels: Collection[str]) -> None:
+        """Checks that the fields are foreign keys and sub-tables respectively"""
+
+        for field in self.lazy:
+            if field not in foreigners:
+                raise ORMException(f"{field} is not a foreign key, so can not be lazy")
+
+        for field in self.skip:
+            if field not in submodels:
+                raise ORMException(f"{field} is not a sub-table, so can not be skipped")
+
+
+EAGER = Load()
+
+
+class LazyBatch:
+    """The stand-ins for one foreign key field from one query"""
+
+    model: orm.table.TableModel[Any]
+    cursor: sqlite3.Cursor
+    pending: weakref.WeakValueDictionary[int, Lazy]
+    records: Dict[int, Any]
+
+    def __init__(self, model: orm.table.TableModel[Any], cursor: sqlite3.Cursor) -> None:
+        self.model = model
+        self.cursor = cursor
+        self.pending = weakref.WeakValueDictionary()
+        self.records = {}
+
+    def proxy(self, _id: Optional[int]) -> Optional[Lazy]:
+        """Gets the stand-in for a record, sharing one per ID"""
+
+        if _id is None:
+            return None
+
+        proxy = self.pending.get(_id)
+
+        if proxy is None:
+            proxy = Lazy(self, _id)
+            self.pending[_id] = proxy
+
+        return proxy
+
+    def record(self, _id: int) -> Any:
+        """Gets the real record for an ID, loading all the stand-ins still in use"""
+
+        if _id not in self.records:
+            ids = set(self.pending.keys())
+            ids.add(_id)
+            self.pending.clear()
+            self.records.update(self.model.get_many(self.cursor, *ids))
+
+        if _id not in self.records:
+            raise ORMException(f"{self.model.table} {_id} does not exist")
+
+        return self.records[_id]
+
+
+class Lazy:
+    """A stand-in for a foreign record which has not been loaded yet"""
+
+    __slots__ = ("_batch", "_id", "__weakref__")
+
+    _batch: LazyBatch
+    _id: int
+
+    def __init__(self, batch: LazyBatch, _id: int) -> None:
+        object.__setattr__(self, "_batch", batch)
+        object.__setattr__(self, "_id", _id)
+
+    def resolve(self) -> Any:
+        """The real record"""
+
+        return self._batch.record(self._id)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == self._batch.model.id_field:
+            return self._id
+
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self.resolve(), name, value)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Lazy):
+            other = other.resolve()
+
+        return bool(self.resolve() == other)
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"Lazy({self._batch.model.table}, {self._id})"
+
+
+def resolve(records: Iterable[Any]) -> None:
+    """
+    Replaces the lazy fields of some records with the real records.
+
+    Each query's stand-ins are loaded together, in one call to `get_many`.
+    """
+
+    for record in records:
+        for field, value in list(vars(record).items()):
+            if isinstance(value, Lazy):
+                setattr(record, field, value.resolve())
+
+
+def partial(record: Any) -> FrozenSet[str]:
+    """The sub-tables which were skipped when a record was loaded"""
+
+    skipped: FrozenSet[str] = vars(record).get(PARTIAL, frozenset())
+
+    return skipped
+
+
+def complete(record: Any) -> bool:
+    """Whether a record has no skipped sub-tables, and no lazy fields"""
+
+    return not partial(record) and not any(
+        isinstance(value, Lazy) for value in vars(record).values()
+    )
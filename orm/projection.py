@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Queries which load only some of the columns of a table.
+
+A projection is made from a model wrapper, and returns named tuples with
+just the requested columns, read with a single SELECT:
+
+    for game in Game.model(cursor).project("game_id", "name").all():
+        print(game.game_id, game.name)
+
+Only columns of the table itself can be selected, so foreign keys are
+returned as their ID column (e.g. "game_id" rather than "game"), and
+sub-tables are not available. Projections do not use the identity map or
+the record caches, so they suit reads of a few columns from many rows;
+records which are served whole, or by ID, are better loaded through the
+model, whose caches they can use.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Tuple
+
+import collections
+import functools
+import sqlite3
+
+import orm  # pylint: disable=unused-import
+from .abc import FilterTypes, execute
+from .exceptions import ORMException
+
+
+@functools.lru_cache(maxsize=None)
+def row_type(table: str, fields: Tuple[str, ...]) -> Callable[..., Any]:
+    """The named tuple type for a projection of a table"""
+
+    return collections.namedtuple(f"{table}Row", fields)
+
+
+class Projection:
+    """
+    Binding class between a Table's Model, some of its columns, and a cursor.
+
+    The projection for some columns of table "Foo" can be retrieved with
+
+        Foo.model(cursor).project("foo_id", "name")
+    """
+
+    model: orm.table.TableModel[Any]
+    cursor: sqlite3.Cursor
+    fields: Tuple[str, ...]
+    row: Callable[..., Any]
+
+    def __init__(
+        self,
+        model: orm.table.TableModel[Any],
+        cursor: sqlite3.Cursor,
+        fields: Tuple[str, ...],
+    ):
+        if not fields:
+            raise ORMException("A projection needs at least one field")
+
+        for field in fields:
+            if field not in model.table_fields:
+                raise ORMException(f"{model.table} has no column {field}")
+
+        self.model = model
+        self.cursor = cursor
+        self.fields = fields
+        self.row = row_type(model.table, fields)
+
+    def _select(self) -> str:
+        return (
+            f"SELECT [{self.model.id_field}], [{'], ['.join(self.fields)}] "
+            f"FROM [{self.model.table}]"
+        )
+
+    def _rows(self, sql: str, params: Any) -> Dict[int, Any]:
+        execute(self.cursor, sql, params)
+
+        return {row[0]: self.row(*row[1:]) for row in self.cursor.fetchall()}
+
+    def all(self) -> List[Any]:
+        """Returns the columns of all records on the table, in order of ID"""
+
+        sql = self.model.statements(
+            ("project_all", self.fields),
+            lambda: f"{self._select()} ORDER BY [{self.model.id_field}]",
+        )
+
+        return list(self._rows(sql, tuple()).values())
+
+    def search(self, **kwargs: FilterTypes) -> List[Any]:
+        """
+        Gets the columns of records which match the given filters, in order of ID.
+
+        The filters are the same as for `TableModel.search`.
+        """
+
+        where, params = self.model.where(self.model.foreigners, kwargs)
+        sql = self.model.statements(
+            ("project_search", self.fields, where),
+            lambda: (
+                self._select()
+                + (f" WHERE {where}" if where else "")
+                + f" ORDER BY [{self.model.id_field}]"
+            ),
+        )
+
+        return list(self._rows(sql, params).values())
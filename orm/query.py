@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Queries over the records of a Table which do not load them all at once.
+
+These back the matching methods of the model wrapper:
+
+    # IDs, counts, and existence, which only need the index
+    Board.model(cursor).search_ids(state="open")
+    Board.model(cursor).count(state="open")
+    Board.model(cursor).exists(state="open")
+
+    # Records, loaded in batches
+    for board in Board.model(cursor).iter_search(state="open"):
+        ...
+
+    # Grouped counts and aggregates (see orm.aggregate)
+    Board.model(cursor).count_by("game", state="open")
+
+The filters are the same as for `search` throughout.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+import functools
+import sqlite3
+
+import orm  # pylint: disable=unused-import
+from .abc import Filters, execute
+from .aggregate import Aggregate, Grouping, source
+from .lazy import Load
+
+
+class Query:
+    """Binding class between a Table's Model and a cursor, for the queries above"""
+
+    model: orm.table.TableModel[Any]
+    cursor: sqlite3.Cursor
+
+    def __init__(self, model: orm.table.TableModel[Any], cursor: sqlite3.Cursor):
+        self.model = model
+        self.cursor = cursor
+
+    def ids(self, filters: Filters) -> List[int]:
+        """
+        Gets the IDs of the records which match the given filters, in order.
+
+        No records are loaded, so an index on the filtered columns is all
+        that is read.
+        """
+
+        model = self.model
+        where, params = model.where(model.foreigners, filters)
+        sql = model.statements(
+            ("search_ids", where),
+            lambda: (
+                f"SELECT [{model.id_field}] FROM [{model.table}]"
+                + (f" WHERE {where}" if where else "")
+                + f" ORDER BY [{model.id_field}]"
+            ),
+        )
+
+        execute(self.cursor, sql, params)
+
+        return [x[0] for x in self.cursor.fetchall()]
+
+    def count(self, filters: Filters) -> int:
+        """Counts the records which match the given filters, or all of them"""
+
+        model = self.model
+        where, params = model.where(model.foreigners, filters)
+        sql = model.statements(
+            ("count", where),
+            lambda: (
+                f"SELECT COUNT(*) FROM [{model.table}]" + (f" WHERE {where}" if where else "")
+            ),
+        )
+
+        execute(self.cursor, sql, params)
+
+        return int(self.cursor.fetchone()[0])
+
+    def exists(self, filters: Filters) -> bool:
+        """Checks whether any record matches the given filters, stopping at the first"""
+
+        model = self.model
+        where, params = model.where(model.foreigners, filters)
+        sql = model.statements(
+            ("exists", where),
+            lambda: (
+                f"SELECT EXISTS (SELECT 1 FROM [{model.table}]"
+                + (f" WHERE {where}" if where else "")
+                + ")"
+            ),
+        )
+
+        execute(self.cursor, sql, params)
+
+        return bool(self.cursor.fetchone()[0])
+
+    def iterate(self, load: Load, batch_size: int, filters: Filters) -> Iterator[Any]:
+        """
+        Iterates over the records which match the given filters, in order of ID.
+
+        Records are read in batches of `batch_size`, each with its own query
+        which starts after the last ID of the previous batch, so only one batch
+        is held in memory at a time. The foreign keys and sub-tables of each
+        batch are loaded together.
+
+        The records are not added to the identity map or the record cache.
+        """
+
+        model = self.model
+        load.check(model.foreigners, model.submodels)
+
+        where, params = model.where(model.foreigners, filters)
+        fields = model.columns()
+        after: Optional[int] = None
+        params["orm_limit"] = batch_size
+
+        while True:
+            params["orm_after"] = after
+            sql = model.statements(
+                ("iter_search", where, after is None),
+                functools.partial(self._iter_sql, fields, where, after is None),
+            )
+
+            execute(self.cursor, sql, params)
+
+            rows = self.cursor.fetchall()
+
+            if not rows:
+                return
+
+            # The ID is the last of the columns.
+            after = rows[-1][-1]
+
+            yield from model.build(self.cursor, fields, rows, load).values()
+
+            if len(rows) < batch_size:
+                return
+
+    def _iter_sql(self, fields: List[str], where: str, first: bool) -> str:
+        clauses = [where] if where else []
+
+        if not first:
+            clauses.insert(0, f"[{self.model.id_field}] > :orm_after")
+
+        return (
+            f"SELECT [{'], ['.join(fields)}] FROM [{self.model.table}] "
+            + (f"WHERE {' AND '.join(clauses)} " if clauses else "")
+            + f"ORDER BY [{self.model.id_field}] LIMIT :orm_limit"
+        )
+
+    def count_by(self, field: str, filters: Filters) -> Dict[Any, int]:
+        """Counts the records which match the given filters, for each value of a field"""
+
+        return self._grouping().count(field, filters)
+
+    def aggregate(
+        self, by: str, aggregates: Mapping[str, Aggregate], filters: Filters
+    ) -> Dict[Any, Any]:
+        """Aggregates the records which match the given filters, for each value of `by`"""
+
+        return self._grouping().aggregate(by, aggregates, filters)
+
+    def _grouping(self) -> Grouping:
+        return Grouping(source(self.model), self.model.statements, self.cursor)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2020-2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Sub-tables, which expand a field of a Table with the values in another table.
+
+A sub-table field is a Set of the values of one column of the other table,
+or a Dict keyed by another of its columns (the pivot), for the rows which
+have a foreign key to the parent record.
+"""
+
+from __future__ import annotations
+
+from typing import (
+    get_type_hints,
+    Any,
+    Dict,
+    Generic,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+import logging
+import sqlite3
+
+import orm  # pylint: disable=unused-import
+from .abc import (
+    BaseModel,
+    MutableFilters as Filters,
+    PrimitiveTypes,
+    StatementCache,
+    execute,
+    executemany,
+)
+from .exceptions import ORMException
+from .generation import counted
+
+
+ModelledTable = TypeVar("ModelledTable", bound="orm.table.Table[Any]")
+
+_LOGGER = logging.getLogger("tiny-orm")
+
+
+class SubTable(Generic[ModelledTable], BaseModel):
+    """
+    Class which represents a request for the ORM tools to expand a field
+    with the values in a sub table
+    """
+
+    model: orm.table.TableModel[ModelledTable]
+    field: str
+    connector: Optional[str]
+    pivot: Optional[str]
+    selector: Dict[str, PrimitiveTypes]
+
+    def __init__(
+        self,
+        model: orm.table.TableModel[ModelledTable],
+        field: str,
+        pivot: Optional[str],
+        selectors: Dict[str, PrimitiveTypes],
+    ) -> None:
+        # This is the model that the actual data for the sub tables is storeed in.
+        self.model = model
+
+        # Field is the output field mapped into new parent table
+        self.field = field
+
+        # Selectors are filters on the sub-table beyond the foreign key
+        # of the parent type. This is used when you want to store two
+        # different sub-types of data in one sub table.
+        self.selectors = selectors
+
+        # If this sub-table is being mapped into a dictionary, this is
+        # the field to use as the key for that dictionary.
+        self.pivot = pivot
+
+        self.connector = None
+        self.statements = StatementCache()
+
+        # Validate the settings we have so far (this will not include
+        # the foreign key relation to the parent)
+        self.validate()
+
+    def validate(self) -> None:
+        """Check if this subtable has a valid configuration.
+
+        This includes:
+          - That the underlying table model has the correct data, connector,
+            and (where appropriate) pivot fields
+          - That the parent table, once connected, has the correct fields in
+            the model.
+        """
+
+        if self.field not in self.model.table_fields:
+            raise ValueError(f"Value field {self.field} not present in {self.model.table}")
+
+        if self.pivot:
+            if (
+                self.pivot not in self.model.table_fields
+                and self.pivot not in self.model.foreigners
+            ):
+                raise ValueError(
+                    f"Pivot field {self.pivot} not present in {self.model.table}"
+                )
+
+        if self.connector:
+            if self.connector not in self.model.table_fields:
+                raise ValueError(
+                    f"Connector field {self.connector} not present in {self.model.table}"
+                )
+
+        for field in self.selectors:
+            if field not in self.model.table_fields:
+                raise ValueError(f"Selector field {field} not present in {self.model.table}")
+
+    def connect_to(self, parent: orm.table.TableModel[Any]) -> None:
+        """Connects this sub-table to a its parent.
+
+        The validity of the join is checked at this time.
+
+        This method will fail if it has been connected already."""
+
+        if self.connector:
+            raise ORMException(
+                "Attempting to connect an already connected sub-table instance"
+            )
+
+        # Confirm that the source table has a relation to the parent table
+        # that is now claiming us as a sub-table
+        if parent.id_field not in self.model.table_fields:
+            raise ValueError(
+                f"Can not use {self.model.table} as a sub-table of {parent.table}, "
+                f"as it has no foreign key to {parent.table}"
+            )
+
+        self.connector = parent.id_field
+        self.model.foreigners[parent.id_field] = (parent.id_field, parent)
+        self.validate()
+
+    def get_expected_type(self) -> Type[Any]:
+        """Determines the expected type of the sub-field in the parent
+        ype definition, based off the parameters to this helper class.
+
+        This will either be a Set[] or Dict[] depending on whether a
+        pivot has been specified. The types will be taken from the completed
+        model of this sub-table."""
+
+        types = get_type_hints(self.model.record)
+
+        if self.pivot:
+            return Dict[types[self.pivot], types[self.field]]  # type: ignore
+
+        return Set[types[self.field]]  # type: ignore
+
+    def select(
+        self, cursor: sqlite3.Cursor, *connector_value: int
+    ) -> Mapping[int, Union[Mapping[PrimitiveTypes, PrimitiveTypes], Set[PrimitiveTypes]]]:
+        """Selects the sub table values for a set of parent objects."""
+
+        if not self.connector:
+            raise ORMException(f"{self.model.table} has not been attached to a model")
+
+        if self.pivot:
+            return self.select_pivot(cursor, connector_value)
+
+        return self.select_column(cursor, connector_value)
+
+    def select_column(
+        self, cursor: sqlite3.Cursor, connector_value: Tuple[int, ...]
+    ) -> Mapping[int, Set[PrimitiveTypes]]:
+        """Selects the sub table values for a set of parent objects
+
+        This is a sub-call of select(), for use when the sub table is a Set[] type."""
+
+        if not self.connector:
+            raise ORMException(f"{self.model.table} has not been attached to a model")
+
+        where: Filters = dict(self.selectors)
+        where[self.connector] = connector_value
+
+        clause, params = self.where({}, where)
+        sql = self.statements(
+            ("select_column", clause),
+            lambda: (
+                f"SELECT [{self.connector}], [{self.field}] FROM [{self.model.table}] "
+                f"WHERE {clause}"
+            ),
+        )
+
+        execute(cursor, sql, params)
+
+        result: Dict[int, Set[Any]] = {connected: set() for connected in connector_value}
+
+        for connected, value in cursor.fetchall():
+            result[connected].add(value)
+
+        return result
+
+    def select_pivot(
+        self, cursor: sqlite3.Cursor, connectors: Tuple[int, ...]
+    ) -> Dict[int, Dict[PrimitiveTypes, PrimitiveTypes]]:
+        """Selects the sub table values for a set of parent objects
+
+        This is a sub-call of select(), for use when the sub table is a Dict[] type."""
+
+        if not self.connector:
+            raise ORMException(f"{self.model.table} has not been attached to a model")
+
+        where: Filters = dict(self.selectors)
+        where[self.connector] = connectors
+
+        clause, params = self.where({}, where)
+        sql = self.statements(
+            ("select_pivot", clause),
+            lambda: (
+                f"SELECT [{self.connector}], [{self.pivot}], [{self.field}] "
+                f"FROM [{self.model.table}] WHERE {clause}"
+            ),
+        )
+
+        execute(cursor, sql, params)
+
+        result: Dict[int, Dict[PrimitiveTypes, PrimitiveTypes]] = dict(
+            zip(connectors, [{} for _ in range(len(connectors))])
+        )
+
+        for connecter, key, value in cursor.fetchall():
+            result[connecter][key] = value
+
+        return result
+
+    def store_many(self, cursor: sqlite3.Cursor, values: Mapping[int, Any]) -> None:
+        """
+        Stores the sub table values for many parent objects, keyed by their IDs.
+
+        The values are a Dict for sub tables with a pivot, and a Set (or List)
+        otherwise. The current values of all the parents are read in one
+        query, and only the differences are written, in one executemany for
+        the removed rows and one for the added rows.
+        """
+
+        if not self.connector:
+            raise ORMException(f"{self.model.table} has not been attached to a model")
+
+        if not values:
+            return
+
+        current = self.select(cursor, *values)
+        removed: List[Tuple[Any, ...]] = []
+        added: List[Tuple[Any, ...]] = []
+        selected = tuple(self.selectors.values())
+
+        for connector_value, desired in values.items():
+            gone, new = self._diff(current[connector_value], desired)
+
+            removed.extend((connector_value, *row, *selected) for row in gone)
+            added.extend((connector_value, *row, *selected) for row in new)
+
+        with counted(cursor, self.model.table, len(removed) + len(added)):
+            if removed:
+                executemany(cursor, self._delete_sql(), removed)
+
+                if cursor.rowcount != len(removed):
+                    _LOGGER.warning(
+                        "Expected to delete %d rows from sub-table %s, but %d were deleted",
+                        len(removed),
+                        self.model.table,
+                        cursor.rowcount,
+                    )
+
+            if added:
+                executemany(cursor, self._insert_sql(), added)
+
+        if removed or added:
+            self.model.invalidate(cursor)
+
+    def _diff(
+        self, existing: Any, desired: Any
+    ) -> Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]]]:
+        """The rows to remove and add to change the existing values to the desired ones"""
+
+        if self.pivot:
+            if not isinstance(desired, dict):
+                raise ORMException(
+                    f"Expected dict for {self.model.table}, got {type(desired).__name__}"
+                )
+
+            # Rows whose value has changed are removed and added again.
+            changed = {
+                key for key in existing if key not in desired or existing[key] != desired[key]
+            }
+            changed.update(key for key in desired if key not in existing)
+
+            return (
+                [(key,) for key in changed if key in existing],
+                [(key, desired[key]) for key in changed if key in desired],
+            )
+
+        if not isinstance(desired, (set, list, tuple)):
+            raise ORMException(
+                f"Expected set for {self.model.table}, got {type(desired).__name__}"
+            )
+
+        return (
+            [(value,) for value in existing.difference(desired)],
+            [(value,) for value in set(desired).difference(existing)],
+        )
+
+    def _delete_sql(self) -> str:
+        return self.statements(
+            "delete",
+            lambda: (
+                f"DELETE FROM [{self.model.table}] "
+                f"WHERE [{self.connector}] = ? AND [{self.pivot or self.field}] = ?"
+                + "".join(f" AND [{field}] IS ?" for field in self.selectors)
+            ),
+        )
+
+    def _insert_sql(self) -> str:
+        columns: List[str] = [
+            column
+            for column in (self.connector, self.pivot, self.field, *self.selectors)
+            if column
+        ]
+
+        return self.statements(
+            "insert",
+            lambda: (
+                f"INSERT OR REPLACE INTO [{self.model.table}] ([{'], ['.join(columns)}]) "
+                f"VALUES ({', '.join(['?'] * len(columns))})"
+            ),
+        )
@@ -19,6 +19,8 @@ from typing import (
     Callable,
     Dict,
     Generic,
+    Iterable,
+    Iterator,
     List,
     Mapping,
     Optional,
@@ -26,25 +28,36 @@ from typing import (
     Tuple,
     Type,
     TypeVar,
-    Union,
 )
 
+import dataclasses
 import datetime
 import inspect
-import logging
 import re
 import sqlite3
 import typing_inspect  # type: ignore
 
 
+from .aggregate import Aggregate
+from .cache import cache_for, written
 from .exceptions import MissingIdField, ORMException
+from .generation import counted, track
+from .identity import records as identity_records
+from .index import create_indexes
+from .lazy import EAGER, PARTIAL, Load, LazyBatch
+from .projection import Projection
+from .query import Query
+from .subtable import SubTable
+from .write import remember_row, write_records
 from .abc import (
     BaseModel,
-    MutableFilters as Filters,
     FilterTypes,
     ForeignerMap,
+    ITER_BATCH_SIZE,
     PrimitiveTypes,
+    StatementCache,
     execute,
+    in_list,
 )
 
 
@@ -52,8 +65,6 @@ ModelledTable = TypeVar("ModelledTable", bound="Table[Any]")
 SecondTable = TypeVar("SecondTable", bound="Table[Any]")
 NoneType: Type[None] = type(None)
 
-_LOGGER = logging.getLogger("tiny-orm")
-
 _TYPE_MAP = {
     str: "TEXT",
     bytes: "BLOB",
@@ -285,6 +296,7 @@ class TableModel(Generic[ModelledTable], BaseModel):
         self.table_fields = {}
         self.foreigners = {}
         self.submodels: Dict[str, SubTable[Any]] = {}
+        self.statements = StatementCache()
 
     def create_table(self, cursor: sqlite3.Cursor) -> None:
         """Creates the table(s) in SQLite"""
@@ -301,6 +313,8 @@ class TableModel(Generic[ModelledTable], BaseModel):
         compiled_sql = self._create_table_sql()
 
         execute(cursor, compiled_sql, tuple())
+        track(cursor, self.table)
+        create_indexes(cursor, self.record, self.table, self.table_fields)
 
         for smodel in self.submodels.values():
             smodel.model.create_table(cursor)
@@ -323,7 +337,7 @@ class TableModel(Generic[ModelledTable], BaseModel):
 
         return "\n".join(sql).strip(", ") + "\n);"
 
-    def all(self, cursor: sqlite3.Cursor) -> List[ModelledTable]:
+    def all(self, cursor: sqlite3.Cursor, load: Load = EAGER) -> List[ModelledTable]:
         """
         Returns all records on the current table.
 
@@ -331,40 +345,108 @@ class TableModel(Generic[ModelledTable], BaseModel):
         in order to optimise the number of queries to realted tables.
         """
 
-        sql = f"SELECT {self.id_field} FROM [{self.table}]"
+        sql = self.statements("all", lambda: f"SELECT {self.id_field} FROM [{self.table}]")
 
         execute(cursor, sql, tuple())
 
         ids = [x[0] for x in cursor.fetchall()]
 
-        return list(self.get_many(cursor, *ids).values())
+        return list(self.get_many(cursor, *ids, load=load).values())
 
     def get(self, cursor: sqlite3.Cursor, unique_id: int) -> Optional[ModelledTable]:
         """Gets a record by ID, or None if no record with that ID exists"""
 
         return self.get_many(cursor, unique_id).get(unique_id, None)
 
-    def get_many(self, cursor: sqlite3.Cursor, *ids: int) -> Dict[int, ModelledTable]:
+    def get_many(
+        self, cursor: sqlite3.Cursor, *ids: int, load: Load = EAGER
+    ) -> Dict[int, ModelledTable]:
         """
         Gets all records that exist with ID in the supplied list.
 
-        Entries in the dict are not generated for records which do not exist.
+        Entries in the dict are not generated for records which do not exist,
+        and are in ascending order of ID. Any number of IDs can be requested.
+
+        Inside an `orm.identity_map`, records which have already been loaded
+        are returned as they are, and only the others are queried. Tables
+        declared with `orm.cached` are then looked up in their cache.
+
+        Records loaded with lazy or skipped fields (see `orm.lazy`) are not
+        added to the identity map or the cache.
         """
 
+        load.check(self.foreigners, self.submodels)
+
+        known: Optional[Dict[int, ModelledTable]] = identity_records(cursor, self.table)
+
+        if known is None:
+            return self._read_many(cursor, ids, load)
+
+        found = {_id: known[_id] for _id in ids if _id in known}
+        loaded = self._read_many(cursor, tuple(_id for _id in ids if _id not in known), load)
+
+        if load.eager:
+            known.update(loaded)
+
+        return _merge(found, loaded)
+
+    def _read_many(
+        self, cursor: sqlite3.Cursor, ids: Tuple[int, ...], load: Load
+    ) -> Dict[int, ModelledTable]:
+        cache = cache_for(self.record)
+
+        if not ids or cache is None:
+            return self._load_many(cursor, ids, load)
+
+        if not cache.tables:
+            cache.watch(self.dependencies())
+
+        generation = cache.generation(cursor)
+
+        if generation is None:
+            return self._load_many(cursor, ids, load)
+
+        found, missing = cache.get_many(generation, ids)
+        loaded = self._load_many(cursor, missing, load)
+
+        if load.eager:
+            cache.update(generation, loaded)
+
+        return _merge(found, loaded)
+
+    def _load_many(
+        self, cursor: sqlite3.Cursor, ids: Tuple[int, ...], load: Load
+    ) -> Dict[int, ModelledTable]:
         if not ids:
             return {}
 
-        fields: List[str] = list(self.table_fields.keys())
-        fields.append(self.id_field)
+        fields = self.columns()
 
-        sql = (
-            f"SELECT [{'], ['.join(fields)}] FROM [{self.table}] "
-            f"WHERE [{self.id_field}] IN ({', '.join(['?'] * len(ids))})"
+        size, id_sql, params = in_list(ids)
+        sql = self.statements(
+            ("get_many", size),
+            lambda: (
+                f"SELECT [{'], ['.join(fields)}] FROM [{self.table}] "
+                f"WHERE [{self.id_field}] IN ({id_sql}) ORDER BY [{self.id_field}]"
+            ),
         )
 
-        execute(cursor, sql, tuple(ids))
+        execute(cursor, sql, params)
+
+        return self.build(cursor, fields, cursor.fetchall(), load)
 
-        rows = cursor.fetchall()
+    def columns(self) -> List[str]:
+        """The columns of the table, with the ID last"""
+
+        fields: List[str] = list(self.table_fields.keys())
+        fields.append(self.id_field)
+
+        return fields
+
+    def build(
+        self, cursor: sqlite3.Cursor, fields: List[str], rows: List[Any], load: Load
+    ) -> Dict[int, ModelledTable]:
+        """Creates records from rows of the given columns"""
 
         if not rows:
             return {}
@@ -373,21 +455,75 @@ class TableModel(Generic[ModelledTable], BaseModel):
 
         del rows
 
-        packed = self._add_joins(cursor, packed)
+        packed = self._add_joins(cursor, packed, load)
 
         output: Dict[int, ModelledTable] = {}
 
         for row in packed:
-            output[row[self.id_field]] = self.record(**row)
+            record = self.record(**row)
+            output[row[self.id_field]] = record
+
+            if load.skip:
+                setattr(record, PARTIAL, load.skip)
+
+            remember_row(self, record)
 
         return output
 
+    def dependencies(self) -> Set[str]:
+        """The tables which this table's records are loaded from"""
+
+        tables: Set[str] = set()
+        pending: List[TableModel[Any]] = [self]
+
+        while pending:
+            model = pending.pop()
+
+            if model.table in tables:
+                continue
+
+            tables.add(model.table)
+            pending.extend(foreign for _, foreign in model.foreigners.values())
+            pending.extend(sub.model for sub in model.submodels.values())
+
+        return tables
+
+    def known_ids(self, cursor: sqlite3.Cursor, *ids: int) -> Set[int]:
+        """
+        Returns the subset of the supplied IDs which exist in the table.
+
+        This only reads the primary key index, so is much cheaper than using
+        get_many() to check that some IDs are valid.
+        """
+
+        if not ids:
+            return set()
+
+        size, id_sql, params = in_list(ids)
+        sql = self.statements(
+            ("known_ids", size),
+            lambda: (
+                f"SELECT [{self.id_field}] FROM [{self.table}] "
+                f"WHERE [{self.id_field}] IN ({id_sql})"
+            ),
+        )
+
+        execute(cursor, sql, params)
+
+        return {x[0] for x in cursor.fetchall()}
+
     def _add_joins(
-        self, cursor: sqlite3.Cursor, packed: List[Dict[str, Any]]
+        self, cursor: sqlite3.Cursor, packed: List[Dict[str, Any]], load: Load
     ) -> List[Dict[str, Any]]:
         for our_key, (their_key, model) in self.foreigners.items():
             their_ids: Set[int] = {row[their_key] for row in packed}
-            frens = model.get_many(cursor, *their_ids)
+            frens: Mapping[Any, Any]
+
+            if our_key in load.lazy:
+                batch = LazyBatch(model, cursor)
+                frens = {_id: batch.proxy(_id) for _id in their_ids}
+            else:
+                frens = model.get_many(cursor, *their_ids)
 
             for row in packed:
                 row[our_key] = frens[row[their_key]]
@@ -396,6 +532,9 @@ class TableModel(Generic[ModelledTable], BaseModel):
                     del row[their_key]
 
         for our_key, sub_model in self.submodels.items():
+            if our_key in load.skip:
+                continue
+
             children = sub_model.select(cursor, *[row[self.id_field] for row in packed])
 
             for row in packed:
@@ -403,7 +542,9 @@ class TableModel(Generic[ModelledTable], BaseModel):
 
         return packed
 
-    def search(self, cursor: sqlite3.Cursor, **kwargs: FilterTypes) -> List[ModelledTable]:
+    def search(
+        self, cursor: sqlite3.Cursor, load: Load = EAGER, **kwargs: FilterTypes
+    ) -> List[ModelledTable]:
         """
         Gets records for this model which match the given filters.
 
@@ -429,66 +570,58 @@ class TableModel(Generic[ModelledTable], BaseModel):
             # Search by local ID
             # NOTE: This is valid, but using Model.get() is faster.
             Bar.model(cursor).search(bar_id=123)
-        """
 
-        sql, params = self.where(self.foreigners, kwargs)
-        sql = f"SELECT {self.id_field} FROM [{self.table}] WHERE " + sql
-
-        execute(cursor, sql, params)
+            # Search by several values, or by comparison (see orm.compare)
+            Bar.model(cursor).search(name=["Hello", "World"], bar_id=orm.Above(100))
+        """
 
-        ids = [x[0] for x in cursor.fetchall()]
+        ids = Query(self, cursor).ids(kwargs)
 
-        return list(self.get_many(cursor, *ids).values())
+        return list(self.get_many(cursor, *ids, load=load).values())
 
     def store(self, cursor: sqlite3.Cursor, record: ModelledTable) -> bool:
         """
         Writes a record to the database.
 
-        In all cases, this is done as an INSERT OR REPLACE statement.
-        If the ID field is not set, this may cause the ID of a record to change,
-        where it is matched via a unique key.
+        This is done as an upsert, so an existing row with the same ID, or
+        with the same values for any unique key, is updated in place.
+        If the ID field is not set and the record matches a row via a unique
+        key, the record takes that row's ID. A record which matches two
+        different rows is an error, rather than one of the rows being deleted.
 
-        The ID field will be updated with the inserted row's ID.
-        """
+        The ID field will be updated with the inserted (or updated) row's ID.
 
-        if not isinstance(record, self.record):
-            raise ORMException("Wrong type")
+        A record which was loaded (or stored) through the ORM only has the
+        columns which have changed since written, and unchanged sub-tables
+        are not written at all.
 
-        fields = list(self.table_fields.keys())
-        data: Dict[str, Any] = {}
+        Sub-tables which were skipped when the record was loaded are left as
+        they are.
+        """
 
-        for field in fields:
-            data[field] = getattr(record, field, None)
+        self.store_many(cursor, [record])
 
-        for _attr, (_id_field, _model) in self.foreigners.items():
-            _data = getattr(record, _attr)
-            data[_id_field] = getattr(_data, _model.id_field) if _data is not None else None
+        return True
 
-        if data[self.id_field] is None:
-            fields.remove(self.id_field)
-            del data[self.id_field]
-        else:
-            fields.append(self.id_field)
+    def store_many(self, cursor: sqlite3.Cursor, records: Iterable[ModelledTable]) -> None:
+        """
+        Writes many records to the database, in the same way as `store`.
+
+        Records which were loaded (or stored) through the ORM only have the
+        columns which have changed since written, with an UPDATE, and are
+        skipped if none have. Of the others, consecutive records which have
+        IDs are written in one executemany. Records without IDs are inserted
+        one at a time, so that their generated IDs can be written back to
+        them. The changed sub-tables of all the records are then compared
+        and written together.
+        """
 
-        sql = (
-            f"INSERT OR REPLACE INTO [{self.table}] ([{'], ['.join(fields)}])"
-            f" VALUES (:{', :'.join(fields)})"
-        )
+        write_records(self, cursor, list(records))
 
-        execute(cursor, sql, data)
+    def uniques(self) -> List[List[str]]:
+        """The fields of each unique key of the table, in order"""
 
-        setattr(record, self.id_field, cursor.lastrowid)
-
-        for our_key, sub_model in self.submodels.items():
-            sub_data = getattr(record, our_key)
-            sub_model.store(
-                cursor,
-                record,
-                set(sub_data) if isinstance(sub_data, (set, list)) else None,
-                sub_data if isinstance(sub_data, dict) else None,
-            )
-
-        return True
+        return [sorted(key) for key in getattr(self.record, _UNIQUES, [])]
 
     def delete(self, cursor: sqlite3.Cursor, **kwargs: FilterTypes) -> int:
         """
@@ -516,14 +649,58 @@ class TableModel(Generic[ModelledTable], BaseModel):
             # Search by local ID
             # NOTE: This is valid, but using Model.get() is faster.
             Bar.model(cursor).search(bar_id=123)
+
+            # Search by several values, or by comparison (see orm.compare)
+            Bar.model(cursor).search(name=["Hello", "World"], bar_id=orm.Above(100))
         """
 
-        sql, params = self.where(self.foreigners, kwargs)
-        sql = f"DELETE FROM [{self.table}] WHERE " + sql
+        where, params = self.where(self.foreigners, kwargs)
+        sql = self.statements(
+            ("delete", where), lambda: f"DELETE FROM [{self.table}] WHERE {where}"
+        )
 
-        execute(cursor, sql, params)
+        with counted(cursor, self.table):
+            execute(cursor, sql, params)
+
+            rows = int(cursor.rowcount)
+
+        self.invalidate(cursor)
+
+        return rows
+
+    def invalidate(self, cursor: sqlite3.Cursor) -> None:
+        """
+        Forgets the loaded records of this table, after the cursor wrote to it.
+
+        An upsert can update a row which was matched by a unique key, rather
+        than by the ID of the record which was stored, so none of the loaded
+        records of the table can be trusted.
+        """
+
+        written(cursor, self.table)
+
+        cache = cache_for(self.record)
 
-        return int(cursor.rowcount)
+        if cache is not None:
+            cache.clear()
+
+        known = identity_records(cursor, self.table)
+
+        if known is not None:
+            known.clear()
+
+
+def _merge(
+    found: Dict[int, ModelledTable], loaded: Dict[int, ModelledTable]
+) -> Dict[int, ModelledTable]:
+    """Combines records from two sources, in ascending order of ID"""
+
+    if not found:
+        return loaded
+
+    found.update(loaded)
+
+    return dict(sorted(found.items()))
 
 
 class ModelWrapper(Generic[ModelledTable]):
@@ -537,10 +714,47 @@ class ModelWrapper(Generic[ModelledTable]):
 
     model: TableModel[ModelledTable]
     cursor: sqlite3.Cursor
+    load: Load
+
+    def __init__(
+        self, model: TableModel[ModelledTable], cursor: sqlite3.Cursor, load: Load = EAGER
+    ):
+        load.check(model.foreigners, model.submodels)
 
-    def __init__(self, model: TableModel[ModelledTable], cursor: sqlite3.Cursor):
         self.model = model
         self.cursor = cursor
+        self.load = load
+
+    def lazy(self, *fields: str) -> ModelWrapper[ModelledTable]:
+        """
+        A wrapper which loads the given foreign key fields only when used.
+
+        See `orm.lazy` for the details.
+        """
+
+        load = dataclasses.replace(self.load, lazy=self.load.lazy.union(fields))
+
+        return ModelWrapper(self.model, self.cursor, load)
+
+    def skip(self, *fields: str) -> ModelWrapper[ModelledTable]:
+        """
+        A wrapper which does not load the given sub-table fields.
+
+        See `orm.lazy` for the details.
+        """
+
+        load = dataclasses.replace(self.load, skip=self.load.skip.union(fields))
+
+        return ModelWrapper(self.model, self.cursor, load)
+
+    def project(self, *fields: str) -> Projection:
+        """
+        A view of the table which only loads the given columns.
+
+        See `orm.projection` for the details.
+        """
+
+        return Projection(self.model, self.cursor, fields)
 
     def all(self) -> List[ModelledTable]:
         """
@@ -550,21 +764,32 @@ class ModelWrapper(Generic[ModelledTable]):
         in order to optimise the number of queries to realted tables.
         """
 
-        return self.model.all(self.cursor)
+        return self.model.all(self.cursor, self.load)
 
     def get(self, unique_id: int) -> Optional[ModelledTable]:
         """Gets a record by ID, or None if no record with that ID exists"""
 
-        return self.model.get(self.cursor, unique_id)
+        return self.get_many(unique_id).get(unique_id, None)
 
     def get_many(self, *ids: int) -> Dict[int, ModelledTable]:
         """
         Gets all records that exist with ID in the supplied list.
 
-        Entries in the dict are not generated for records which do not exist.
+        Entries in the dict are not generated for records which do not exist,
+        and are in ascending order of ID. Any number of IDs can be requested.
         """
 
-        return self.model.get_many(self.cursor, *ids)
+        return self.model.get_many(self.cursor, *ids, load=self.load)
+
+    def known_ids(self, *ids: int) -> Set[int]:
+        """
+        Returns the subset of the supplied IDs which exist in the table.
+
+        This only reads the primary key index, so is much cheaper than using
+        get_many() to check that some IDs are valid.
+        """
+
+        return self.model.known_ids(self.cursor, *ids)
 
     def search(self, **kwargs: FilterTypes) -> List[ModelledTable]:
         """
@@ -592,23 +817,120 @@ class ModelWrapper(Generic[ModelledTable]):
             # Search by local ID
             # NOTE: This is value, but using Model.get() is faster.
             Bar.model(cursor).search(bar_id=123)
+
+            # Search by several values, or by comparison (see orm.compare)
+            Bar.model(cursor).search(name=["Hello", "World"], bar_id=orm.Above(100))
+        """
+
+        return self.model.search(self.cursor, self.load, **kwargs)
+
+    def search_ids(self, **kwargs: FilterTypes) -> List[int]:
+        """
+        Gets the IDs of the records which match the given filters, in order.
+
+        The filters are the same as for `search`, but no records are loaded,
+        so an index on the filtered columns is all that is read.
         """
 
-        return self.model.search(self.cursor, **kwargs)
+        return Query(self.model, self.cursor).ids(kwargs)
+
+    def count(self, **kwargs: FilterTypes) -> int:
+        """
+        Counts the records which match the given filters, or all of them.
+
+        The filters are the same as for `search`; no records are loaded.
+        """
+
+        return Query(self.model, self.cursor).count(kwargs)
+
+    def exists(self, **kwargs: FilterTypes) -> bool:
+        """
+        Checks whether any record matches the given filters.
+
+        The filters are the same as for `search`. The query stops at the
+        first match, and no records are loaded.
+        """
+
+        return Query(self.model, self.cursor).exists(kwargs)
+
+    def iter_all(self, batch_size: int = ITER_BATCH_SIZE) -> Iterator[ModelledTable]:
+        """
+        Iterates over all records on the current table, in order of ID.
+
+        Records are loaded in batches of `batch_size`, so only one batch
+        is held in memory at a time.
+        """
+
+        return Query(self.model, self.cursor).iterate(self.load, batch_size, {})
+
+    def iter_search(self, **kwargs: FilterTypes) -> Iterator[ModelledTable]:
+        """
+        Iterates over the records which match the given filters, in order of ID.
+
+        The filters are the same as for `search`. Records are loaded in
+        batches, so only one batch is held in memory at a time.
+        """
+
+        query = Query(self.model, self.cursor)
+
+        return query.iterate(self.load, ITER_BATCH_SIZE, kwargs)
+
+    def count_by(self, field: str, /, **kwargs: FilterTypes) -> Dict[Any, int]:
+        """
+        Counts the records which match the given filters, for each value of a field.
+
+        The field and filters can follow foreign keys, such as "user__realm";
+        see `orm.aggregate`. Records are not loaded.
+        """
+
+        return Query(self.model, self.cursor).count_by(field, kwargs)
+
+    def aggregate(
+        self, by: str, aggregates: Mapping[str, Aggregate], /, **kwargs: FilterTypes
+    ) -> Dict[Any, Any]:
+        """
+        Aggregates the records which match the given filters, for each value of `by`.
+
+        Returns a named tuple of the aggregates for each value, in one query;
+        see `orm.aggregate`. Records are not loaded.
+        """
+
+        return Query(self.model, self.cursor).aggregate(by, aggregates, kwargs)
 
     def store(self, record: ModelledTable) -> bool:
         """
         Writes a record to the database.
 
-        In all cases, this is done as an INSERT OR REPLACE statement.
-        If the ID field is not set, this may cause the ID of a record to change,
-        where it is matched via a unique key.
+        This is done as an upsert, so an existing row with the same ID, or
+        with the same values for any unique key, is updated in place.
+        If the ID field is not set and the record matches a row via a unique
+        key, the record takes that row's ID. A record which matches two
+        different rows is an error, rather than one of the rows being deleted.
+
+        The ID field will be updated with the inserted (or updated) row's ID.
 
-        The ID field will be updated with the inserted row's ID.
+        A record which was loaded (or stored) through the ORM only has the
+        columns which have changed since written, and unchanged sub-tables
+        are not written at all.
         """
 
         return self.model.store(self.cursor, record)
 
+    def store_many(self, records: Iterable[ModelledTable]) -> None:
+        """
+        Writes many records to the database, in the same way as `store`.
+
+        Records which were loaded (or stored) through the ORM only have the
+        columns which have changed since written, with an UPDATE, and are
+        skipped if none have. Of the others, consecutive records which have
+        IDs are written in one executemany. Records without IDs are inserted
+        one at a time, so that their generated IDs can be written back to
+        them. The changed sub-tables of all the records are then compared
+        and written together.
+        """
+
+        return self.model.store_many(self.cursor, records)
+
     def delete(self, **kwargs: FilterTypes) -> int:
         """
         Delete records for this model which match the given filters.
@@ -655,7 +977,7 @@ def subtable(
     if not selectors:
         selectors = {}
 
-    sub: SubTable[ModelledTable] = SubTable(table, subfield, pivot, selectors)
+    sub: SubTable[ModelledTable] = SubTable(_get_model(table), subfield, pivot, selectors)
 
     def _subtable(cls: Type[SecondTable]) -> Type[SecondTable]:
         """Adds a subtable key to a Table"""
@@ -670,305 +992,3 @@ def subtable(
         return cls
 
     return _subtable
-
-
-class SubTable(Generic[ModelledTable], BaseModel):
-    """
-    Class which represents a request for the ORM tools to expand a field
-    with the values in a sub table
-    """
-
-    model: TableModel[ModelledTable]
-    field: str
-    connector: Optional[str]
-    pivot: Optional[str]
-    selector: Dict[str, PrimitiveTypes]
-
-    def __init__(
-        self,
-        source: Type[ModelledTable],
-        field: str,
-        pivot: Optional[str],
-        selectors: Dict[str, PrimitiveTypes],
-    ) -> None:
-        # This is the model that the actual data for the sub tables is storeed in.
-        self.model = _get_model(source)
-
-        # Field is the output field mapped into new parent table
-        self.field = field
-
-        # Selectors are filters on the sub-table beyond the foreign key
-        # of the parent type. This is used when you want to store two
-        # different sub-types of data in one sub table.
-        self.selectors = selectors
-
-        # If this sub-table is being mapped into a dictionary, this is
-        # the field to use as the key for that dictionary.
-        self.pivot = pivot
-
-        self.connector = None
-
-        # Validate the settings we have so far (this will not include
-        # the foreign key relation to the parent)
-        self.validate()
-
-    def validate(self) -> None:
-        """Check if this subtable has a valid configuration.
-
-        This includes:
-          - That the underlying table model has the correct data, connector,
-            and (where appropriate) pivot fields
-          - That the parent table, once connected, has the correct fields in
-            the model.
-        """
-
-        if self.field not in self.model.table_fields:
-            raise ValueError(f"Value field {self.field} not present in {self.model.table}")
-
-        if self.pivot:
-            if (
-                self.pivot not in self.model.table_fields
-                and self.pivot not in self.model.foreigners
-            ):
-                raise ValueError(
-                    f"Pivot field {self.pivot} not present in {self.model.table}"
-                )
-
-        if self.connector:
-            if self.connector not in self.model.table_fields:
-                raise ValueError(
-                    f"Connector field {self.connector} not present in {self.model.table}"
-                )
-
-        for field in self.selectors:
-            if field not in self.model.table_fields:
-                raise ValueError(f"Selector field {field} not present in {self.model.table}")
-
-    def connect_to(self, parent: TableModel[Any]) -> None:
-        """Connects this sub-table to a its parent.
-
-        The validity of the join is checked at this time.
-
-        This method will fail if it has been connected already."""
-
-        if self.connector:
-            raise ORMException(
-                "Attempting to connect an already connected sub-table instance"
-            )
-
-        # Confirm that the source table has a relation to the parent table
-        # that is now claiming us as a sub-table
-        if parent.id_field not in self.model.table_fields:
-            raise ValueError(
-                f"Can not use {self.model.table} as a sub-table of {parent.table}, "
-                f"as it has no foreign key to {parent.table}"
-            )
-
-        self.connector = parent.id_field
-        self.model.foreigners[parent.id_field] = (parent.id_field, parent)
-        self.validate()
-
-    def get_expected_type(self) -> Type[Any]:
-        """Determines the expected type of the sub-field in the parent
-        ype definition, based off the parameters to this helper class.
-
-        This will either be a Set[] or Dict[] depending on whether a
-        pivot has been specified. The types will be taken from the completed
-        model of this sub-table."""
-
-        types = get_type_hints(self.model.record)
-
-        if self.pivot:
-            return Dict[types[self.pivot], types[self.field]]  # type: ignore
-
-        return Set[types[self.field]]  # type: ignore
-
-    def select(
-        self, cursor: sqlite3.Cursor, *connector_value: int
-    ) -> Mapping[int, Union[Mapping[PrimitiveTypes, PrimitiveTypes], Set[PrimitiveTypes]]]:
-        """Selects the sub table values for a set of parent objects."""
-
-        if not self.connector:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        if self.pivot:
-            return self.select_pivot(cursor, connector_value)
-
-        return self.select_column(cursor, connector_value)
-
-    def select_column(
-        self, cursor: sqlite3.Cursor, connector_value: Tuple[int, ...]
-    ) -> Mapping[int, Set[PrimitiveTypes]]:
-        """Selects the sub table values for a set of parent objects
-
-        This is a sub-call of select(), for use when the sub table is a Set[] type."""
-
-        if not self.connector:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        where: Filters = dict(self.selectors)
-        where[self.connector] = connector_value
-
-        sql, params = self.where({}, where)
-        sql = (
-            f"SELECT [{self.connector}], [{self.field}] FROM [{self.model.table}] WHERE "
-            + sql
-        )
-
-        execute(cursor, sql, params)
-
-        result: Dict[int, Set[Any]] = dict(
-            zip(connector_value, [set()] * len(connector_value))
-        )
-
-        for connected, value in cursor.fetchall():
-            result[connected] += value
-
-        return result
-
-    def select_pivot(
-        self, cursor: sqlite3.Cursor, connectors: Tuple[int, ...]
-    ) -> Dict[int, Dict[PrimitiveTypes, PrimitiveTypes]]:
-        """Selects the sub table values for a set of parent objects
-
-        This is a sub-call of select(), for use when the sub table is a Dict[] type."""
-
-        if not self.connector:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        where: Filters = dict(self.selectors)
-        where[self.connector] = connectors
-
-        sql, params = self.where({}, where)
-        sql = (
-            f"SELECT [{self.connector}], [{self.pivot}], [{self.field}] "
-            + f"FROM [{self.model.table}] WHERE "
-            + sql
-        )
-
-        execute(cursor, sql, params)
-
-        result: Dict[int, Dict[PrimitiveTypes, PrimitiveTypes]] = dict(
-            zip(connectors, [{} for _ in range(len(connectors))])
-        )
-
-        for connecter, key, value in cursor.fetchall():
-            result[connecter][key] = value
-
-        return result
-
-    def store(
-        self,
-        cursor: sqlite3.Cursor,
-        connector: Table[Any],
-        lvalues: Optional[Set[PrimitiveTypes]] = None,
-        kvalues: Optional[Dict[PrimitiveTypes, PrimitiveTypes]] = None,
-    ) -> None:
-        """Stores a list of values for a single parent object in the sub table"""
-
-        if not self.connector:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        if self.pivot:
-            if not isinstance(kvalues, dict):
-                raise ORMException(
-                    f"Expected dict for {self.model.table}, got {type(kvalues).__name__}"
-                )
-
-            return self.store_pivot(cursor, connector, kvalues)
-
-        if not isinstance(kvalues, list):
-            raise ORMException(
-                f"Expected list for {self.model.table}, got {type(kvalues).__name__}"
-            )
-
-        if lvalues is None:
-            raise ORMException(
-                f"Expected set for {self.model.table}, got {type(lvalues).__name__}"
-            )
-
-        return self.store_column(cursor, connector, lvalues)
-
-    def store_pivot(
-        self,
-        cursor: sqlite3.Cursor,
-        connector: Table[Any],
-        values: Dict[PrimitiveTypes, PrimitiveTypes],
-    ) -> None:
-        """Stores a dict of values in the sub table"""
-
-        if not self.connector:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        if not self.pivot:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        connector_value = getattr(connector, self.connector)
-
-        current = self.select_pivot(cursor, (connector_value,))[connector_value]
-        existing = set(current.keys())
-        desired = set(values.keys())
-
-        filters: Filters = dict(self.selectors)
-        filters[self.connector] = connector
-        filters[self.pivot] = existing - desired
-
-        rows = self.model.delete(cursor, **filters)
-
-        if rows != len(existing - desired):
-            _LOGGER.warning(
-                (
-                    "Potential issue when processing pivot sub-table: expected to delete %d rows, "
-                    "but cursor only reported %d deleted."
-                ),
-                len(existing - desired),
-                rows,
-            )
-            _LOGGER.warning("Filters: %s", filters)
-            _LOGGER.warning("Existing: %s", existing)
-            _LOGGER.warning("Desired: %s", desired)
-
-        for new_key in desired - existing:
-            filters[self.pivot] = new_key
-            filters[self.field] = values[new_key]
-
-            self.model.store(cursor, self.model.record(**filters))
-
-    def store_column(
-        self, cursor: sqlite3.Cursor, connector: Table[Any], values: Set[PrimitiveTypes]
-    ) -> None:
-        """Stores a list of values in the sub table"""
-
-        if not self.connector:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        if self.pivot:
-            raise ORMException(f"{self.model.table} has not been attached to a model")
-
-        connector_value = getattr(connector, self.connector)
-
-        existing = self.select_column(cursor, (connector_value,))[connector_value]
-        desired = set(values)
-
-        filters: Filters = dict(self.selectors)
-        filters[self.connector] = connector_value
-
-        rows = self.model.delete(cursor, **filters)
-
-        if rows != len(existing - desired):
-            _LOGGER.warning(
-                (
-                    "Potential issue when processing column sub-table: expected to delete %d rows, "
-                    "but cursor only reported %d deleted."
-                ),
-                len(existing - desired),
-                rows,
-            )
-            _LOGGER.warning("Filters: %s", filters)
-            _LOGGER.warning("Existing: %s", existing)
-            _LOGGER.warning("Desired: %s", desired)
-
-        for new_value in desired - existing:
-            filters[self.field] = new_value
-
-            self.model.store(cursor, self.model.record(**filters))
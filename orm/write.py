@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Writes the records of a Table to the database.
+
+New records are written with an upsert, which updates the row matched by
+the ID or by any unique key. Records which were loaded (or stored) through
+the ORM only have the columns which have changed written, with an UPDATE;
+see `orm.dirty`.
+
+Records with IDs are written with one executemany. Records without IDs are
+written many rows to a statement, whose RETURNING rows are matched back to
+the records by the table's first unique key; records of tables without
+a unique key, or with NULLs in it, are written one at a time.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Tuple
+
+import functools
+import itertools
+import sqlite3
+
+import orm  # pylint: disable=unused-import
+from .abc import execute, executemany
+from .dirty import adapt, changed_columns, changed_subtable, remember
+from .exceptions import ORMException
+from .generation import counted
+from .identity import records as identity_records
+from .lazy import complete, partial
+
+
+Row = Tuple[Any, Dict[str, Any]]
+
+# The most parameters in one multi-row INSERT, which is SQLite's limit
+# before version 3.32.
+INSERT_PARAMETERS = 999
+
+
+def row_of(model: orm.table.TableModel[Any], record: Any) -> Dict[str, Any]:
+    """The column values of a record, without the ID if it is not set"""
+
+    data: Dict[str, Any] = {}
+
+    for field in model.table_fields:
+        data[field] = getattr(record, field, None)
+
+    for _attr, (_id_field, _model) in model.foreigners.items():
+        _data = getattr(record, _attr)
+        data[_id_field] = getattr(_data, _model.id_field) if _data is not None else None
+
+    if data[model.id_field] is None:
+        del data[model.id_field]
+
+    return data
+
+
+def remember_row(model: orm.table.TableModel[Any], record: Any) -> None:
+    """Notes a record's current values as those in the database"""
+
+    remember(
+        record,
+        row_of(model, record),
+        {
+            field: getattr(record, field)
+            for field in model.submodels
+            if field not in partial(record)
+        },
+    )
+
+
+def write_records(
+    model: orm.table.TableModel[Any], cursor: sqlite3.Cursor, records: List[Any]
+) -> None:
+    """Writes the records, then their changed sub-tables"""
+
+    for record in records:
+        if not isinstance(record, model.record):
+            raise ORMException("Wrong type")
+
+    if _write(model, cursor, records):
+        model.invalidate(cursor)
+
+    _identify(model, cursor, records)
+
+    for our_key, sub_model in model.submodels.items():
+        sub_model.store_many(
+            cursor,
+            {
+                getattr(record, model.id_field): getattr(record, our_key)
+                for record in records
+                if our_key not in partial(record) and changed_subtable(record, our_key)
+            },
+        )
+
+    for record in records:
+        remember_row(model, record)
+
+
+def _identify(
+    model: orm.table.TableModel[Any], cursor: sqlite3.Cursor, records: List[Any]
+) -> None:
+    """
+    Puts stored records in the cursor's identity map, if it has one.
+
+    As in get_many, records with lazy or skipped fields are left out, and
+    any other instance for their ID is dropped.
+    """
+
+    known = identity_records(cursor, model.table)
+
+    if known is None:
+        return
+
+    for record in records:
+        if complete(record):
+            known[getattr(record, model.id_field)] = record
+        else:
+            known.pop(getattr(record, model.id_field), None)
+
+
+def _write(
+    model: orm.table.TableModel[Any], cursor: sqlite3.Cursor, records: List[Any]
+) -> bool:
+    """Writes the rows of the records which have changed, returning whether any had"""
+
+    inserts: List[Row] = []
+    updates: List[Row] = []
+
+    for record in records:
+        row = row_of(model, record)
+        changes = changed_columns(record, row, model.id_field)
+
+        if changes is None:
+            inserts.append((record, row))
+        elif changes:
+            updates.append((record, {**changes, model.id_field: row[model.id_field]}))
+
+    with counted(cursor, model.table, len(inserts) + len(updates)):
+        for has_id, group in itertools.groupby(inserts, lambda row: model.id_field in row[1]):
+            _insert(model, cursor, has_id, list(group))
+
+        _update(model, cursor, updates)
+
+    return bool(inserts or updates)
+
+
+def _insert(
+    model: orm.table.TableModel[Any], cursor: sqlite3.Cursor, has_id: bool, rows: List[Row]
+) -> None:
+    fields = list(rows[0][1])
+    sql = model.statements(("store", has_id), lambda: _upsert_sql(model, fields, has_id))
+
+    if has_id:
+        executemany(cursor, sql, [data for _, data in rows])
+        return
+
+    key = model.uniques()[0] if model.uniques() else []
+    single: List[Row] = []
+    batched: List[Row] = []
+
+    for row in rows:
+        keyed = key and all(row[1].get(column) is not None for column in key)
+        (batched if keyed else single).append(row)
+
+    for batch in _batches(batched, max(1, INSERT_PARAMETERS // len(fields))):
+        single.extend(_insert_batch(model, cursor, fields, key, batch))
+
+    for record, data in single:
+        execute(cursor, sql, data)
+        setattr(record, model.id_field, cursor.fetchone()[0])
+
+
+def _batches(rows: List[Row], size: int) -> Iterator[List[Row]]:
+    """
+    Splits rows into lists of `size`, and the rest into powers of two.
+
+    This keeps the number of statement shapes small, whatever the number
+    of rows.
+    """
+
+    start = 0
+
+    while start < len(rows):
+        left = len(rows) - start
+        end = start + (size if left >= size else 1 << (left.bit_length() - 1))
+
+        yield rows[start:end]
+
+        start = end
+
+
+def _insert_batch(
+    model: orm.table.TableModel[Any],
+    cursor: sqlite3.Cursor,
+    fields: List[str],
+    key: List[str],
+    batch: List[Row],
+) -> List[Row]:
+    """
+    Inserts new records in one statement, and sets their IDs.
+
+    RETURNING does not report rows in any given order, so the IDs are
+    matched to the records by their values of `key`. The rows of any
+    records which can not be matched are returned, to be written again
+    one at a time.
+    """
+
+    sql = model.statements(
+        ("store_many", len(batch)),
+        functools.partial(_upsert_sql, model, fields, False, len(batch)),
+    )
+
+    execute(cursor, sql, tuple(data[field] for _, data in batch for field in fields))
+
+    ids = {tuple(values): _id for _id, *values in cursor.fetchall()}
+    unmatched: List[Row] = []
+
+    for record, data in batch:
+        _id = ids.get(tuple(adapt(data[column]) for column in key))
+
+        if _id is None:
+            unmatched.append((record, data))
+        else:
+            setattr(record, model.id_field, _id)
+
+    return unmatched
+
+
+def _upsert_sql(
+    model: orm.table.TableModel[Any], fields: List[str], has_id: bool, rows: int = 0
+) -> str:
+    """
+    INSERT statement which updates the row matched by the ID or a unique key.
+
+    Each key gets its own ON CONFLICT clause, which sets every column not
+    in the key; a row which only has key columns sets them to themselves,
+    so that RETURNING still reports its ID.
+
+    The statement takes named parameters for one row, or, if `rows` is given,
+    positional parameters for that many rows, and then also returns the
+    columns of the first unique key of each.
+    """
+
+    keys = model.uniques()
+
+    if has_id:
+        keys.insert(0, [model.id_field])
+
+    values = (
+        ", ".join([f"({', '.join(['?'] * len(fields))})"] * rows)
+        if rows
+        else f"(:{', :'.join(fields)})"
+    )
+    sql = [
+        f"INSERT INTO [{model.table}] ([{'], ['.join(fields)}])",
+        f"VALUES {values}",
+    ]
+
+    for key in keys:
+        updates = [field for field in fields if field not in key] or key
+        sql.append(
+            f"ON CONFLICT ([{'], ['.join(key)}]) DO UPDATE SET "
+            + ", ".join(f"[{field}] = excluded.[{field}]" for field in updates)
+        )
+
+    if not has_id:
+        returning = [model.id_field, *(keys[0] if rows else [])]
+        sql.append(f"RETURNING [{'], ['.join(returning)}]")
+
+    return " ".join(sql)
+
+
+def _update(
+    model: orm.table.TableModel[Any], cursor: sqlite3.Cursor, rows: List[Row]
+) -> None:
+    """
+    Writes the changed columns of records which are in the database.
+
+    Records which changed the same columns are written together. If any
+    of their rows have been deleted since they were loaded, the group is
+    written again in full.
+    """
+
+    def columns(row: Row) -> Tuple[str, ...]:
+        return tuple(sorted(row[1]))
+
+    for changed, group in itertools.groupby(sorted(rows, key=columns), columns):
+        batch = list(group)
+        sql = model.statements(
+            ("update", changed), functools.partial(_update_sql, model, changed)
+        )
+
+        executemany(cursor, sql, [data for _, data in batch])
+
+        if cursor.rowcount != len(batch):
+            _insert(
+                model, cursor, True, [(record, row_of(model, record)) for record, _ in batch]
+            )
+
+
+def _update_sql(model: orm.table.TableModel[Any], columns: Tuple[str, ...]) -> str:
+    updates = [column for column in columns if column != model.id_field]
+
+    return (
+        f"UPDATE [{model.table}] SET "
+        + ", ".join(f"[{column}] = :{column}" for column in updates)
+        + f" WHERE [{model.id_field}] = :{model.id_field}"
+    )
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""Storing records: the IDs reported by upserts, and the caches they invalidate"""
+
+from __future__ import annotations
+
+from typing import Iterator, Optional
+
+from dataclasses import dataclass
+
+import pytest
+
+import orm
+from orm.cache import cache_for
+
+
+@orm.cached(size=16)
+@orm.unique("name")
+@dataclass
+class Colour(orm.Table["Colour"]):
+    name: str
+    hex: str = ""
+    colour_id: Optional[int] = None
+
+
+@dataclass
+class Note(orm.Table["Note"]):
+    text: str
+    note_id: Optional[int] = None
+
+
+def colour_id(colour: Colour) -> int:
+    assert colour.colour_id is not None, "The colour has not been stored"
+
+    return colour.colour_id
+
+
+def note_id(note: Note) -> int:
+    assert note.note_id is not None, "The note has not been stored"
+
+    return note.note_id
+
+
+@pytest.fixture(name="database", scope="module")
+def fixture_database(tmp_path_factory: pytest.TempPathFactory) -> orm.ConnectionPool:
+    # Models only create their tables once per process, so the tests share
+    # a database.
+    path = tmp_path_factory.mktemp("orm") / "test.db"
+    pool = orm.ConnectionPool(orm.ConnectionSettings(str(path)))
+
+    with pool.transaction() as cursor:
+        Colour.create_table(cursor)
+        Note.create_table(cursor)
+
+    return pool
+
+
+@pytest.fixture(name="pool")
+def fixture_pool(database: orm.ConnectionPool) -> Iterator[orm.ConnectionPool]:
+    yield database
+
+    with database.transaction() as cursor:
+        Colour.model(cursor).delete(colour_id=orm.AtLeast(0))
+        Note.model(cursor).delete(note_id=orm.AtLeast(0))
+
+    # The cache is shared by the whole process, so must not carry records
+    # from one test to the next.
+    cache = cache_for(Colour)
+    assert cache is not None
+    cache.clear()
+
+
+def test_store_new_record_gets_id(pool: orm.ConnectionPool) -> None:
+    red = Colour("red", "#f00")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(red)
+
+    assert red.colour_id is not None
+
+    with pool.transaction() as cursor:
+        assert Colour.model(cursor).get(colour_id(red)) == red
+
+
+def test_store_matching_unique_key_reports_existing_id(pool: orm.ConnectionPool) -> None:
+    red = Colour("red", "#f00")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(red)
+
+    again = Colour("red", "#ff0000")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(again)
+
+    assert again.colour_id == red.colour_id
+
+    with pool.transaction() as cursor:
+        assert Colour.model(cursor).count() == 1
+        assert Colour.model(cursor).get(colour_id(red)) == again
+
+
+def test_store_many_matches_ids_by_unique_key(pool: orm.ConnectionPool) -> None:
+    green = Colour("green", "#0f0")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(green)
+
+    # More records than fit in one statement, in an order which differs from
+    # the IDs they get, and with one which already exists.
+    names = [f"colour {i:03}" for i in range(400, 0, -1)]
+    colours = [Colour(name, name.upper()) for name in names]
+    colours.insert(200, Colour("green", "#00ff00"))
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store_many(colours)
+
+    assert colours[200].colour_id == green.colour_id
+    assert len({colour.colour_id for colour in colours}) == len(colours)
+
+    with pool.transaction() as cursor:
+        stored = Colour.model(cursor).get_many(*map(colour_id, colours))
+
+    for colour in colours:
+        assert stored[colour_id(colour)] == colour
+
+
+def test_store_many_repeated_unique_key(pool: orm.ConnectionPool) -> None:
+    first = Colour("blue", "#00f")
+    second = Colour("blue", "#0000ff")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store_many([first, second])
+
+    assert first.colour_id == second.colour_id
+
+    with pool.transaction() as cursor:
+        assert Colour.model(cursor).search(name="blue") == [second]
+
+
+def test_store_many_without_unique_key(pool: orm.ConnectionPool) -> None:
+    notes = [Note(f"note {i}") for i in range(5)]
+
+    with pool.transaction() as cursor:
+        Note.model(cursor).store_many(notes)
+
+    assert len({note.note_id for note in notes}) == len(notes)
+
+    with pool.transaction() as cursor:
+        stored = Note.model(cursor).get_many(*map(note_id, notes))
+
+    assert list(stored.values()) == notes
+
+
+def test_cache_serves_unchanged_records(pool: orm.ConnectionPool) -> None:
+    red = Colour("red", "#f00")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(red)
+
+    hits = orm.cache_stats()["Colour"].hits
+
+    for _ in range(2):
+        with pool.transaction() as cursor:
+            assert Colour.model(cursor).get(colour_id(red)) == red
+
+    assert orm.cache_stats()["Colour"].hits == hits + 1
+
+
+def test_cache_invalidated_by_store(pool: orm.ConnectionPool) -> None:
+    red = Colour("red", "#f00")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(red)
+
+    with pool.transaction() as cursor:
+        cached = Colour.model(cursor).get(colour_id(red))
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(Colour("red", "#ff0000"))
+
+    with pool.transaction() as cursor:
+        stored = Colour.model(cursor).get(colour_id(red))
+
+    assert stored != cached
+    assert stored == Colour("red", "#ff0000", red.colour_id)
+
+
+def test_cache_invalidated_by_store_many(pool: orm.ConnectionPool) -> None:
+    colours = [Colour(f"colour {i}") for i in range(10)]
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store_many(colours)
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).get_many(*map(colour_id, colours))
+
+    for colour in colours:
+        colour.hex = "#000"
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store_many(colours)
+
+    with pool.transaction() as cursor:
+        stored = Colour.model(cursor).get_many(*map(colour_id, colours))
+
+    assert {colour.hex for colour in stored.values()} == {"#000"}
+
+
+def test_cache_invalidated_by_write_from_other_connection(pool: orm.ConnectionPool) -> None:
+    red = Colour("red", "#f00")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(red)
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).get(colour_id(red))
+
+    # A write which does not go through the ORM, as another process would make.
+    connection = pool.settings.connect()
+    connection.execute("UPDATE [Colour] SET [hex] = '#ff0000' WHERE [name] = 'red'")
+    connection.commit()
+    connection.close()
+
+    with pool.transaction() as cursor:
+        stored = Colour.model(cursor).get(colour_id(red))
+
+    assert stored is not None
+    assert stored.hex == "#ff0000"
+
+
+def test_cache_invalidated_by_delete(pool: orm.ConnectionPool) -> None:
+    red = Colour("red", "#f00")
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).store(red)
+
+    with pool.transaction() as cursor:
+        Colour.model(cursor).get(colour_id(red))
+
+    with pool.transaction() as cursor:
+        assert Colour.model(cursor).delete(name="red") == 1
+
+    with pool.transaction() as cursor:
+        assert Colour.model(cursor).get(colour_id(red)) is None
+
+
+def test_store_many_moves_generation_for_other_processes(pool: orm.ConnectionPool) -> None:
+    with pool.transaction() as cursor:
+        before = orm.generations(cursor, "Colour")["Colour"]
+        Colour.model(cursor).store_many([Colour(f"colour {i}") for i in range(10)])
+
+    with pool.transaction() as cursor:
+        after = orm.generations(cursor, "Colour")["Colour"]
+
+    assert before < after
+
+    # The triggers are not left paused for writes outside the ORM.
+    connection = pool.settings.connect()
+    connection.execute("UPDATE [Colour] SET [hex] = '#000'")
+    connection.commit()
+    connection.close()
+
+    with pool.transaction() as cursor:
+        assert orm.generations(cursor, "Colour")["Colour"] > after
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+# vim: fileencoding=utf-8 expandtab ts=4 nospell
+
+# SPDX-FileCopyrightText: 2021 Benedict Harcourt <ben.harcourt@harcourtprogramming.co.uk>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Micro-benchmarks for the ORM.
+
+Each benchmark builds its own throwaway database, so this can be run from
+the repository root without touching games.db:
+
+    python3 tools/benchmark.py            # run everything
+    python3 tools/benchmark.py join       # run one benchmark
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import argparse
+import contextlib
+import functools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from dataclasses import dataclass, replace
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orm  # noqa: E402 pylint: disable=wrong-import-position
+import orm.abc  # noqa: E402 pylint: disable=wrong-import-position
+
+
+@orm.unique("name")
+@dataclass
+class BenchUser(orm.Table["BenchUser"]):
+    name: str
+    bench_user_id: Optional[int] = None
+
+
+@dataclass
+class BenchGame(orm.Table["BenchGame"]):
+    name: str
+    bench_game_id: Optional[int] = None
+
+
+@orm.unique("link")
+@orm.index("state", "last_seen")
+@orm.index("seats")
+@dataclass
+class BenchBoard(orm.Table["BenchBoard"]):
+    link: str
+    state: str
+    seats: int
+    last_seen: int
+    bench_board_id: Optional[int] = None
+
+
+@orm.join_layout(without_rowid=False, reverse_index=False)
+@dataclass
+class RowidVote(orm.JoinTable[BenchUser, BenchGame]):
+    user: BenchUser
+    game: BenchGame
+
+
+@orm.join_layout()
+@dataclass
+class ClusteredVote(orm.JoinTable[BenchUser, BenchGame]):
+    user: BenchUser
+    game: BenchGame
+
+
+@orm.join_layout()
+@dataclass
+class BenchListing(orm.JoinTable[BenchBoard, BenchGame]):
+    board: BenchBoard
+    game: BenchGame
+
+
+Benchmark = Callable[[sqlite3.Cursor, argparse.Namespace], None]
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(func: Benchmark) -> Benchmark:
+    BENCHMARKS[func.__name__] = func
+
+    return func
+
+
+@contextlib.contextmanager
+def database() -> Iterator[sqlite3.Cursor]:
+    with tempfile.TemporaryDirectory() as directory:
+        settings = orm.ConnectionSettings(os.path.join(directory, "bench.db"))
+        connection = settings.connect()
+        cursor = connection.cursor()
+
+        # Table models only create their table once, so must be told that
+        # each benchmark's database is a new one.
+        for table in (BenchUser, BenchGame, BenchBoard):
+            table.model(cursor).model.created = False
+
+        try:
+            yield cursor
+        finally:
+            connection.close()
+
+
+def timed(label: str, repeat: int, func: Callable[[], object], calls: int = 1) -> None:
+    """Prints the mean time of `func`, which makes `calls` calls, per call"""
+
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        func()
+
+    per_call = (time.perf_counter() - start) / repeat / calls
+
+    print(f"  {label:<40} {per_call * 1e6:10.1f} µs/call")
+
+
+def populate(cursor: sqlite3.Cursor, users: int, games: int) -> None:
+    BenchUser.create_table(cursor)
+    BenchGame.create_table(cursor)
+
+    cursor.executemany(
+        "INSERT INTO [BenchUser] ([name]) VALUES (?)", [(f"u{i}",) for i in range(users)]
+    )
+    cursor.executemany(
+        "INSERT INTO [BenchGame] ([name]) VALUES (?)", [(f"g{i}",) for i in range(games)]
+    )
+
+
+@benchmark
+def join(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """Lookups by left and by right for each JoinTable layout"""
+
+    populate(cursor, args.users, args.games)
+
+    rand = random.Random(1)
+    pairs = [
+        (user, game)
+        for user in range(1, args.users + 1)
+        for game in rand.sample(range(1, args.games + 1), args.votes)
+    ]
+
+    users: List[BenchUser] = [
+        BenchUser(f"u{i}", i) for i in rand.sample(range(1, args.users + 1), 50)
+    ]
+    games: List[BenchGame] = [
+        BenchGame(f"g{i}", i) for i in rand.sample(range(1, args.games + 1), 50)
+    ]
+
+    print(f"join: {args.users} users x {args.votes} votes over {args.games} games")
+
+    for table in (RowidVote, ClusteredVote):
+        table.create_table(cursor)
+        cursor.executemany(f"INSERT INTO [{table.__name__}] VALUES (?, ?)", pairs)
+
+        lookups(table.__name__, table.model(cursor), users, games, args.repeat)
+
+
+def lookups(
+    name: str,
+    model: orm.JoinModel[BenchUser, BenchGame],
+    users: List[BenchUser],
+    games: List[BenchGame],
+    repeat: int,
+) -> None:
+    timed(
+        f"{name}.ids_for_left",
+        repeat,
+        lambda: [model.ids_for_left(user) for user in users],
+        len(users),
+    )
+    timed(
+        f"{name}.ids_for_right",
+        repeat,
+        lambda: [model.ids_for_right(game) for game in games],
+        len(games),
+    )
+
+
+@benchmark
+def in_lists(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """ID lookups of varying length, with and without bucketed IN lists"""
+
+    populate(cursor, args.users, args.games)
+
+    rand = random.Random(1)
+
+    for longest in (100, 1000):
+        id_lists = [
+            rand.sample(range(1, args.users + 1), rand.randint(1, longest))
+            for _ in range(200)
+        ]
+
+        print(f"in_lists: {len(id_lists)} lookups of 1-{longest} ids over {args.users} rows")
+
+        in_list_lookups(cursor, id_lists, args.repeat)
+
+
+def in_list_lookups(cursor: sqlite3.Cursor, id_lists: List[List[int]], repeat: int) -> None:
+    model = BenchUser.model(cursor)
+
+    def lookup(ids: Sequence[orm.abc.PrimitiveTypes]) -> List[Any]:
+        cursor.execute(
+            f"SELECT [bench_user_id] FROM [BenchUser] "
+            f"WHERE [bench_user_id] IN ({orm.abc.placeholders(len(ids))})",
+            ids,
+        )
+
+        return cursor.fetchall()
+
+    timed(
+        "one statement per length",
+        repeat,
+        lambda: [lookup(ids) for ids in id_lists],
+        len(id_lists),
+    )
+    timed(
+        "bucketed lengths",
+        repeat,
+        lambda: [lookup(orm.abc.in_params(ids)) for ids in id_lists],
+        len(id_lists),
+    )
+    timed(
+        "known_ids",
+        repeat,
+        lambda: [model.known_ids(*ids) for ids in id_lists],
+        len(id_lists),
+    )
+
+
+@benchmark
+def get_many(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """get_many, known_ids, and search over 10, 1k, and 100k IDs"""
+
+    populate(cursor, 200_000, 0)
+
+    rand = random.Random(1)
+
+    for count in (10, 1_000, 100_000):
+        print(f"get_many: {count} ids from 200000 rows")
+
+        id_lookups(
+            BenchUser.model(cursor),
+            rand.sample(range(1, 200_001), count),
+            max(1, args.repeat * 10 // count),
+        )
+
+
+def id_lookups(model: orm.TableModel[BenchUser], ids: List[int], repeat: int) -> None:
+    timed("get_many", repeat, lambda: model.get_many(*ids))
+    timed("known_ids", repeat, lambda: model.known_ids(*ids))
+    timed("search", repeat, lambda: model.search(bench_user_id=ids))
+
+
+@benchmark
+def iteration(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """Time and peak memory of all() and iter_all() over the whole table"""
+
+    populate(cursor, args.users * 20, 0)
+
+    print(f"iteration: {args.users * 20} rows")
+
+    model = BenchUser.model(cursor)
+
+    for label, func in (
+        ("all", lambda: sum(1 for _ in model.all())),
+        ("iter_all", lambda: sum(1 for _ in model.iter_all())),
+    ):
+        tracemalloc.start()
+        timed(label, 1, func)
+        print(f"  {'peak memory':<40} {tracemalloc.get_traced_memory()[1] / 1e6:10.1f} MB")
+        tracemalloc.stop()
+
+
+@benchmark
+def bulk(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """store() and JoinTable.store() per new record, against store_many() and store_pairs()"""
+
+    populate(cursor, 0, args.games)
+    ClusteredVote.create_table(cursor)
+
+    games = BenchGame.model(cursor).all()
+    votes = ClusteredVote.model(cursor)
+    model = BenchUser.model(cursor)
+
+    print(f"bulk: {args.users} new users with {args.votes} votes each, per row")
+
+    def store_users(users: List[BenchUser]) -> None:
+        for user in users:
+            model.store(user)
+
+    def store_votes(users: List[BenchUser]) -> None:
+        for user in users:
+            for game in games[: args.votes]:
+                votes.store(user, game)
+
+    def store_pairs(users: List[BenchUser]) -> None:
+        votes.store_pairs((user, game) for user in users for game in games[: args.votes])
+
+    for label, write_users, write_votes in (
+        ("store", store_users, store_votes),
+        ("store_many", model.store_many, store_pairs),
+    ):
+        users = [BenchUser(f"u{i}") for i in range(args.users)]
+
+        timed(f"{label}, users", 1, functools.partial(write_users, users), args.users)
+        timed(
+            f"{label}, votes",
+            1,
+            functools.partial(write_votes, users),
+            args.users * args.votes,
+        )
+        cursor.execute("DELETE FROM [ClusteredVote]")
+        cursor.execute("DELETE FROM [BenchUser]")
+
+
+@benchmark
+def upsert(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """Pages written re-storing some existing rows, with INSERT OR REPLACE and upserts"""
+
+    model = boards_table(cursor, args.users)
+
+    columns = ["bench_board_id", "link", "state", "seats", "last_seen"]
+    replace_sql = (
+        f"INSERT OR REPLACE INTO [BenchBoard] ([{'], ['.join(columns)}])"
+        f" VALUES (:{', :'.join(columns)})"
+    )
+    # Each measurement moves different rows, as the index entries of rows
+    # which have been moved before are next to each other.
+    seen = iter(range(1, 500))
+
+    print(f"upsert: re-storing every 500th of {args.users} rows, with three indexes")
+
+    def boards(with_id: bool) -> List[BenchBoard]:
+        last_seen = next(seen)
+
+        return [
+            BenchBoard(
+                board.link,
+                board.state,
+                board.seats,
+                last_seen,
+                board.bench_board_id if with_id else None,
+            )
+            for board in model.all()[last_seen::500]
+        ]
+
+    def replace_all(records: List[BenchBoard]) -> None:
+        for record in records:
+            cursor.execute(
+                replace_sql, {column: getattr(record, column) for column in columns}
+            )
+
+    for label, with_id, store in (
+        ("by ID, INSERT OR REPLACE", True, replace_all),
+        ("by ID, store_many()", True, model.store_many),
+        ("by unique key, INSERT OR REPLACE", False, replace_all),
+        ("by unique key, store_many()", False, model.store_many),
+    ):
+        rewrite(label, model, store, boards(with_id))
+
+
+@benchmark
+def dirty(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """Re-storing loaded records with one changed column, against copies of them"""
+
+    model = boards_table(cursor, args.users)
+
+    print(f"dirty: re-storing every 500th of {args.users} rows")
+
+    copies = [replace(board, last_seen=1) for board in model.all()[::500]]
+    loaded = model.all()[1::500]
+
+    for board in loaded:
+        board.last_seen = 1
+
+    rewrite("copied records, in full", model, model.store_many, copies)
+    rewrite("loaded records, changed column", model, model.store_many, loaded)
+    rewrite("loaded records, unchanged", model, model.store_many, loaded)
+
+
+@benchmark
+def pushdown(cursor: sqlite3.Cursor, args: argparse.Namespace) -> None:
+    """Open boards of a game, filtered in Python against filtered in the join"""
+
+    populate(cursor, 0, 10)
+    boards_table(cursor, args.users)
+    BenchListing.create_table(cursor)
+
+    # A long history of finished boards, with every 50th still open.
+    cursor.execute("UPDATE [BenchBoard] SET [state] = 'finished' WHERE [bench_board_id] % 50")
+    cursor.execute(
+        "INSERT INTO [BenchListing] SELECT [bench_board_id], [bench_board_id] % 10 + 1 "
+        "FROM [BenchBoard]"
+    )
+    cursor.execute("ANALYZE")
+
+    model = BenchListing.model(cursor)
+    games = [BenchGame(f"g{i}", i + 1) for i in range(10)]
+
+    print(f"pushdown: {args.users} boards over {len(games)} games, 1 in 50 open")
+
+    timed(
+        "of_right, then state == 'open'",
+        args.repeat,
+        lambda: [[b for b in model.of_right(game) if b.state == "open"] for game in games],
+        len(games),
+    )
+    timed(
+        "of_right(state='open')",
+        args.repeat,
+        lambda: [model.of_right(game, state="open") for game in games],
+        len(games),
+    )
+
+
+def boards_table(cursor: sqlite3.Cursor, count: int) -> orm.TableModel[BenchBoard]:
+    BenchBoard.create_table(cursor)
+    model = BenchBoard.model(cursor)
+    model.store_many(BenchBoard(f"b{i}", "open", i % 8, 0) for i in range(count))
+
+    return model
+
+
+def rewrite(
+    label: str,
+    model: orm.TableModel[BenchBoard],
+    store: Callable[[List[BenchBoard]], object],
+    records: List[BenchBoard],
+) -> None:
+    """Prints the pages written, time taken, and IDs changed by storing some records"""
+
+    before = {board.link: board.bench_board_id for board in model.all()}
+
+    start = time.perf_counter()
+    pages = wal_pages(model.cursor, lambda: store(records))
+    elapsed = time.perf_counter() - start
+
+    after = {board.link: board.bench_board_id for board in model.all()}
+    moved = sum(before[link] != after[link] for link in before)
+
+    print(f"  {label:<40} {pages:6d} pages {elapsed * 1e3:8.1f} ms {moved:6d} IDs changed")
+
+
+def wal_pages(cursor: sqlite3.Cursor, func: Callable[[], object]) -> int:
+    """The number of pages `func` writes to the WAL, once committed"""
+
+    path = cursor.execute("PRAGMA database_list").fetchall()[0][2]
+    page_size = cursor.execute("PRAGMA page_size").fetchall()[0][0]
+
+    cursor.connection.commit()
+    cursor.execute("PRAGMA wal_autocheckpoint = 0").fetchall()
+
+    if cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()[0][0]:
+        raise RuntimeError("Unable to checkpoint the WAL")
+
+    func()
+    cursor.connection.commit()
+
+    # The WAL has a 32 byte header, then a 24 byte header for each page.
+    return max(0, int((os.path.getsize(f"{path}-wal") - 32) // (page_size + 24)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument(
+        "benchmarks", nargs="*", metavar="benchmark", help=", ".join(BENCHMARKS)
+    )
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--votes", type=int, default=20, help="votes per user")
+    parser.add_argument("--repeat", type=int, default=20)
+
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name}")
+
+    for name in args.benchmarks or BENCHMARKS:
+        with database() as cursor:
+            BENCHMARKS[name](cursor, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 reuse lint
-black boardgames orm
-flake8 boardgames orm
-mypy --strict boardgames orm
+black boardgames orm tests
+flake8 boardgames orm tests
+mypy --strict boardgames orm tests
 pylint boardgames orm